@@ -0,0 +1,140 @@
+import argparse
+import copy
+import json
+import logging
+import os
+import subprocess
+import time
+
+from rename_file_by_time_info import RenameOptions, RenameSession, general_file
+
+
+logger = logging.getLogger()
+
+
+def drop_caches() -> None:
+    """Drop the page cache, dentries and inodes (Linux, as root)"""
+    subprocess.run(["sync"], check=True)
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def measure(
+    config_file: dict,
+    src: str,
+    mode: str,
+    order: str,
+    is_cold: bool,
+    jobs: int = 1,
+) -> tuple[int, float, list[str]]:
+    """Plan the files under a directory, without renaming them
+
+    Returns the number of files planned, the seconds taken and the summary
+    of scheduling, if `jobs` is greater than 1.
+    """
+    if is_cold:
+        drop_caches()
+    with RenameSession(
+        config_file=config_file,
+        options=RenameOptions(order=order, stop_on_error=False),
+        exiftool_processes=jobs,
+    ) as session:
+        start_time = time.perf_counter()
+        files_count = sum(
+            1
+            for _ in session.plan(
+                files_paths=general_file.FileInventory(
+                    src=src, recursive=True
+                ),
+                mode=mode,
+                jobs=jobs,
+            )
+        )
+        return (
+            files_count,
+            time.perf_counter() - start_time,
+            session.scheduler.get_summary_lines(),
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Measure how fast the files under a directory are planned"
+    )
+    parser.add_argument(
+        "--config-file",
+        type=str,
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "config.json"
+        ),
+    )
+    parser.add_argument("--mode", choices=RenameSession.MODES, default="media")
+    parser.add_argument(
+        "--orders",
+        nargs="+",
+        choices=RenameSession.ORDERS,
+        default=list(RenameSession.ORDERS),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of files planned at the same time. If greater than 1, "
+        "files are planned by their costs and in order, instead of in each of "
+        "the orders",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="Drop the caches of the system before every run (Linux, as "
+        "root)",
+    )
+    parser.add_argument("src", type=str)
+    cli_args = parser.parse_args()
+
+    config_file = json.load(open(cli_args.config_file))
+    # Configurations and orders measured, by their names
+    variants: dict[str, tuple[dict, str]] = {}
+    if cli_args.jobs > 1:
+        for name, cost_aware in [("cost-aware", True), ("in order", False)]:
+            variant_config_file = copy.deepcopy(config_file)
+            variant_config_file.setdefault("scheduling", {})[
+                "cost_aware"
+            ] = cost_aware
+            variants[name] = (variant_config_file, "lexical")
+    else:
+        for order in cli_args.orders:
+            variants[order] = (config_file, order)
+    logging.getLogger().setLevel(logging.WARNING)
+    results = []
+    for _ in range(cli_args.repeat):
+        for name, (variant_config_file, order) in variants.items():
+            files_count, seconds, scheduling_lines = measure(
+                config_file=variant_config_file,
+                src=cli_args.src,
+                mode=cli_args.mode,
+                order=order,
+                is_cold=cli_args.cold,
+                jobs=cli_args.jobs,
+            )
+            results.append((name, files_count, seconds, scheduling_lines))
+    logging.getLogger().setLevel(logging.INFO)
+    for name in variants:
+        variant_results = sorted(
+            (i for i in results if i[0] == name), key=lambda i: i[2]
+        )
+        _, files_count, seconds, scheduling_lines = variant_results[
+            len(variant_results) // 2
+        ]
+        logger.info(
+            "%s: %d file(s), %.3fs (median of %d), %.1f file(s)/s",
+            name,
+            files_count,
+            seconds,
+            len(variant_results),
+            files_count / max(seconds, 1e-9),
+        )
+        for line in scheduling_lines:
+            logger.info("  %s", line)
@@ -0,0 +1,8 @@
+from .session import (
+    AuditResult,
+    AuditStatus,
+    RenameOptions,
+    RenameResult,
+    RenameSession,
+    RenameStatus,
+)
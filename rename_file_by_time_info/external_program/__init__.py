@@ -1 +1,2 @@
+from .exiftool import ExiftoolPool, ExiftoolProcess
 from . import helper
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import codecs
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+from . import helper
+
+
+class ExiftoolProcess:
+    """A long-running exiftool process which reads arguments from stdin
+
+    Starting exiftool costs much more than extracting metadata from a single
+    file, so one process started with "-stay_open" is reused for every file.
+    The process is started on first use, and is restarted after it has
+    exited or has been killed.
+
+    Arguments are passed as the bytes of the file system (see os.fsencode()),
+    so that names of files which cannot be decoded, e.g. with b"\\xff", are
+    passed unchanged, and exiftool is told that they are UTF-8 if the file
+    system uses it. Output which cannot be decoded with `encoding` is decoded
+    with surrogate escapes, as names of files are.
+
+    If `memory_limit` is set, the virtual memory of the process is limited to
+    that many bytes, see `helper.limit_memory()`. `niceness` and
+    `io_priority_class` lower the priorities of the process, see
+    `helper.set_priorities()`.
+
+    References:
+    - exiftool -stay_open. https://exiftool.org/exiftool_pod.html#stay_open-FLAG
+    """
+
+    def __init__(
+        self,
+        executable: str = "exiftool",
+        encoding: str = "utf-8",
+        memory_limit: int | None = None,
+        niceness: int | None = None,
+        io_priority_class: int | None = None,
+    ) -> None:
+        self.executable = executable
+        self.encoding = encoding
+        self.memory_limit = memory_limit
+        self.niceness = niceness
+        self.io_priority_class = io_priority_class
+        self._process: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+        self._execution_count = 0
+
+    def __enter__(self) -> ExiftoolProcess:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def execute(
+        self, arguments: list[str], timeout: float | None = None
+    ) -> str | None:
+        """Execute exiftool with arguments and get its output
+
+        The process is killed if it does not respond within `timeout`
+        seconds, in which case TimeoutError is raised. ChildProcessError is
+        raised if the process exits unexpectedly, e.g. when it runs out of
+        memory.
+        """
+        # Arguments are passed line by line, so those with line breaks have
+        # to be passed to a separate process
+        if any("\n" in i or "\r" in i for i in arguments):
+            return helper.execute(
+                command=[self.executable, *arguments],
+                encoding=self.encoding,
+                timeout=timeout,
+                memory_limit=self.memory_limit,
+            )
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            self._execution_count += 1
+            ready_line = "{{ready{}}}".format(self._execution_count)
+            lines = [
+                *_get_charset_arguments(),
+                *arguments,
+                "-execute{}".format(self._execution_count),
+                "",
+            ]
+            self._process.stdin.write(b"\n".join(map(os.fsencode, lines)))
+            self._process.stdin.flush()
+            output_lines = []
+            # Killing the process unblocks the reading below
+            process = self._process
+            timed_out = threading.Event()
+
+            def kill() -> None:
+                timed_out.set()
+                process.kill()
+
+            killer = (
+                None if timeout is None else threading.Timer(timeout, kill)
+            )
+            if killer is not None:
+                killer.start()
+            try:
+                while True:
+                    line = self._process.stdout.readline()
+                    if line == b"":
+                        break
+                    line = line.decode(self.encoding, "surrogateescape")
+                    if line.rstrip("\r\n") == ready_line:
+                        return "".join(output_lines).rstrip("\r\n")
+                    output_lines.append(line)
+            finally:
+                if killer is not None:
+                    killer.cancel()
+            # The process has exited unexpectedly, or has been killed
+            self._process.wait()
+            self._discard_process()
+            if timed_out.is_set():
+                raise TimeoutError(
+                    "exiftool timed out after {} seconds".format(timeout)
+                )
+            raise ChildProcessError("exiftool exited unexpectedly")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._process is None:
+                return
+            if self._process.poll() is None:
+                try:
+                    self._process.stdin.write(b"-stay_open\nFalse\n")
+                    self._process.stdin.flush()
+                    self._process.wait(timeout=10)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._process.kill()
+                    self._process.wait()
+            self._discard_process()
+
+    def _start(self) -> None:
+        self._process = subprocess.Popen(
+            [self.executable, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        helper.limit_memory(
+            pid=self._process.pid, memory_limit=self.memory_limit
+        )
+        helper.set_priorities(
+            pid=self._process.pid,
+            niceness=self.niceness,
+            io_priority_class=self.io_priority_class,
+        )
+
+    def _discard_process(self) -> None:
+        try:
+            self._process.stdin.close()
+        except OSError:
+            # The process has exited with unwritten input
+            pass
+        self._process.stdout.close()
+        self._process = None
+
+
+def _get_charset_arguments() -> list[str]:
+    if codecs.lookup(sys.getfilesystemencoding()).name != "utf-8":
+        return []
+    return ["-charset", "filename=utf8"]
+
+
+class ExiftoolPool:
+    """A fixed number of ExiftoolProcess shared by concurrent callers
+
+    Each call of `execute()` borrows an idle process. The most recently used
+    process is borrowed first, so processes are only started when that many
+    callers are executing at the same time.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        executable: str = "exiftool",
+        encoding: str = "utf-8",
+        memory_limit: int | None = None,
+        niceness: int | None = None,
+        io_priority_class: int | None = None,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Size of the pool must be at least 1")
+        self.size = size
+        self._processes = [
+            ExiftoolProcess(
+                executable=executable,
+                encoding=encoding,
+                memory_limit=memory_limit,
+                niceness=niceness,
+                io_priority_class=io_priority_class,
+            )
+            for _ in range(size)
+        ]
+        self._idle_processes: queue.LifoQueue[ExiftoolProcess] = (
+            queue.LifoQueue()
+        )
+        for process in self._processes:
+            self._idle_processes.put(process)
+
+    def __enter__(self) -> ExiftoolPool:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def configure(
+        self,
+        memory_limit: int | None = None,
+        niceness: int | None = None,
+        io_priority_class: int | None = None,
+    ) -> None:
+        """Change the settings of processes started from now on"""
+        for process in self._processes:
+            process.memory_limit = memory_limit
+            process.niceness = niceness
+            process.io_priority_class = io_priority_class
+
+    def execute(
+        self, arguments: list[str], timeout: float | None = None
+    ) -> str | None:
+        process = self._idle_processes.get()
+        try:
+            return process.execute(arguments=arguments, timeout=timeout)
+        finally:
+            self._idle_processes.put(process)
+
+    def close(self) -> None:
+        for process in self._processes:
+            process.close()
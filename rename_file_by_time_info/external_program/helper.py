@@ -1,15 +1,97 @@
+import logging
+import os
+import shutil
 import subprocess
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
-def execute(command: list, encoding: str = "utf-8") -> str | None:
+
+logger = logging.getLogger()
+
+
+def execute(
+    command: list,
+    encoding: str = "utf-8",
+    timeout: float | None = None,
+    memory_limit: int | None = None,
+) -> str | None:
     """Retrieving the output of subprocess.call()
 
+    The process is killed if it runs for more than `timeout` seconds, in
+    which case TimeoutError is raised. See `limit_memory()` for
+    `memory_limit`.
+
     References:
     - Store output of subprocess.Popen call in a string [duplicate]. https://stackoverflow.com/q/2502833
     """
-    try:
-        result_bytes = subprocess.check_output(command)
-    except subprocess.CalledProcessError:
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        limit_memory(pid=process.pid, memory_limit=memory_limit)
+        try:
+            result_bytes, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise TimeoutError(
+                "Command timed out after {} seconds: {}".format(
+                    timeout, command[0]
+                )
+            )
+    if process.returncode != 0:
         return None
-    else:
-        return result_bytes.decode(encoding).rstrip("\r\n")
+    # Names of files which cannot be decoded are decoded as by os.fsdecode()
+    return result_bytes.decode(encoding, "surrogateescape").rstrip("\r\n")
+
+
+def limit_memory(pid: int, memory_limit: int | None) -> None:
+    """Limit the virtual memory of a process to `memory_limit` bytes
+
+    Only supported on Linux. A process exceeding the limit fails to allocate
+    memory, which usually makes it exit.
+
+    References:
+    - prlimit(2). https://man7.org/linux/man-pages/man2/prlimit.2.html
+    """
+    if (
+        memory_limit is None
+        or resource is None
+        or not hasattr(resource, "prlimit")
+    ):
+        return
+    try:
+        resource.prlimit(pid, resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except (OSError, ValueError) as e:
+        logger.warning("Failed to limit memory of process %d: %s", pid, e)
+
+
+def set_priorities(
+    pid: int, niceness: int | None, io_priority_class: int | None
+) -> None:
+    """Lower the CPU and I/O priorities of a process
+
+    `niceness` is added to the niceness of the process, where supported
+    (POSIX). `io_priority_class` is a scheduling class of ionice(1), e.g. 3
+    for "idle", and is only applied if "ionice" is found (Linux).
+    """
+    if niceness is not None and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(
+                os.PRIO_PROCESS,
+                pid,
+                os.getpriority(os.PRIO_PROCESS, pid) + niceness,
+            )
+        except OSError as e:
+            logger.warning("Failed to set niceness of process %d: %s", pid, e)
+    if io_priority_class is not None:
+        ionice_path = shutil.which("ionice")
+        if ionice_path is None:
+            logger.warning("\"ionice\" not found")
+            return
+        subprocess.run(
+            [ionice_path, "-c", str(io_priority_class), "-p", str(pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
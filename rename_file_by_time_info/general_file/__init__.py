@@ -1,2 +1,8 @@
+from .config_context import ConfigContext
+from .directory_manifest import DirectoryManifest
+from .file_inventory import FileInventory
+from .file_mover import FileMover
 from .file_name_formatter import FileNameFormatter
+from .path_filter import PathFilter
+from .stat_layer import StatLayer
 from . import helper
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import dataclasses
+
+
+@dataclasses.dataclass(frozen=True)
+class ConfigContext:
+    """Settings of a configuration file which new names of files depend on
+
+    A context is passed explicitly to the functions and formatters which need
+    it, so differently configured renames can run side by side, e.g. in
+    threads. It is immutable, hashable and picklable, so it can be shared by
+    threads, sent to a worker process once, and used as a cache key.
+    """
+
+    # Values of the "{dtt}" format code, by names of DateAndTimeType
+    date_and_time_types_to_values: tuple[tuple[str, str], ...] = ()
+    # Values of the "{et}" format code, by names of EditType
+    edit_types_to_values: tuple[tuple[str, str], ...] = ()
+    # In lowercase
+    editing_softwares_keywords: tuple[str, ...] = ()
+
+    @classmethod
+    def from_config(cls, config_file: dict) -> ConfigContext:
+        media_config = config_file.get("media", {})
+        return cls(
+            date_and_time_types_to_values=tuple(
+                media_config.get("DateAndTimeType", {}).items()
+            ),
+            edit_types_to_values=tuple(
+                media_config.get("EditType", {}).items()
+            ),
+            editing_softwares_keywords=tuple(
+                i.lower()
+                for i in config_file.get("editing_softwares_keywords", [])
+            ),
+        )
+
+    def get_date_and_time_type_value(self, name: str) -> str:
+        return _get_value(pairs=self.date_and_time_types_to_values, key=name)
+
+    def get_edit_type_value(self, name: str) -> str:
+        return _get_value(pairs=self.edit_types_to_values, key=name)
+
+
+def _get_value(pairs: tuple[tuple[str, str], ...], key: str) -> str:
+    for k, v in pairs:
+        if k == key:
+            return v
+    raise KeyError(key)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import threading
+
+from .helper import LOCK_FILE_NAME
+
+
+logger = logging.getLogger()
+
+
+@dataclasses.dataclass
+class DirectoryEntry:
+    inode: int
+    mtime_ns: int
+    entries_count: int
+    # Names of sub-directories, which are visited even if the directory is
+    # not listed again
+    subdirectories: list[str]
+
+
+class DirectoryManifest:
+    """States of directories at the end of the last successful run
+
+    A directory is recorded with its inode, modified time and number of
+    entries once all of its files have been processed, and is not listed
+    again by later runs until any of its entries is added, removed or renamed.
+    The manifest is only valid for runs with the same `fingerprint`, e.g. a
+    hash of the configuration and the options.
+
+    The tool's own renames change the modified times of directories too, so
+    the directories listed in a run are checked again at the end of the run.
+    A directory whose modified time has changed is still recorded if its
+    number of entries is what the changes made by the run would give, and
+    is otherwise listed again by the next run. Lock files of renames (see
+    helper.lock_directory()) are not counted, as they are created by them.
+    """
+
+    VERSION = 1
+
+    def __init__(self, fingerprint: str) -> None:
+        self.fingerprint = fingerprint
+        self._entries: dict[str, DirectoryEntry] = {}
+        # Directories listed in this run, with their entries when listed
+        self._observed_entries: dict[str, DirectoryEntry] = {}
+        # Directories not listed in this run, as they are unchanged
+        self._unchanged_entries: dict[str, DirectoryEntry] = {}
+        self._entries_count_changes: dict[str, int] = {}
+        self._discarded_directories: set[str] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> DirectoryManifest:
+        """Load a manifest, or get an empty one if it cannot be used"""
+        manifest = cls(fingerprint=fingerprint)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return manifest
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load directory manifest: %s", e)
+            return manifest
+        if (
+            data.get("version", None) != cls.VERSION
+            or data.get("fingerprint", None) != fingerprint
+        ):
+            logger.info(
+                "Directory manifest ignored, as configuration or options "
+                "have changed"
+            )
+            return manifest
+        manifest._entries = {
+            k: DirectoryEntry(*v) for k, v in data["directories"].items()
+        }
+        return manifest
+
+    def save(self, path: str) -> None:
+        """Update the manifest with the directories of this run and save it
+
+        Call it only if the run has completed. Directories not visited in
+        this run, e.g. those removed, are not kept.
+        """
+        entries = dict(self._unchanged_entries)
+        for directory, entry in self._observed_entries.items():
+            if directory in self._discarded_directories:
+                continue
+            try:
+                directory_status = os.stat(directory)
+            except OSError:
+                continue
+            if directory_status.st_ino != entry.inode:
+                continue
+            if directory_status.st_mtime_ns != entry.mtime_ns:
+                entries_count = entry.entries_count + (
+                    self._entries_count_changes.get(directory, 0)
+                )
+                try:
+                    with os.scandir(directory) as directory_entries:
+                        if (
+                            sum(
+                                1
+                                for i in directory_entries
+                                if i.name != LOCK_FILE_NAME
+                            )
+                            != entries_count
+                        ):
+                            continue
+                except OSError:
+                    continue
+                entry = DirectoryEntry(
+                    inode=directory_status.st_ino,
+                    mtime_ns=directory_status.st_mtime_ns,
+                    entries_count=entries_count,
+                    subdirectories=entry.subdirectories,
+                )
+            entries[directory] = entry
+        self._entries = entries
+
+        temporary_path = "{}.tmp".format(path)
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": type(self).VERSION,
+                    "fingerprint": self.fingerprint,
+                    "directories": {
+                        k: dataclasses.astuple(v) for k, v in entries.items()
+                    },
+                },
+                f,
+            )
+        os.replace(temporary_path, path)
+
+    def get_unchanged_subdirectories(
+        self, directory: str, directory_status: os.stat_result
+    ) -> list[str] | None:
+        """Get the sub-directories of a directory if it is unchanged
+
+        Returns None if the directory has to be listed again.
+        """
+        directory = os.path.abspath(directory)
+        entry = self._entries.get(directory, None)
+        if (
+            entry is None
+            or entry.inode != directory_status.st_ino
+            or entry.mtime_ns != directory_status.st_mtime_ns
+        ):
+            return None
+        with self._lock:
+            self._unchanged_entries[directory] = entry
+        return entry.subdirectories
+
+    def observe(
+        self,
+        directory: str,
+        directory_status: os.stat_result,
+        entries_count: int,
+        subdirectories: list[str],
+    ) -> None:
+        """Record the state of a directory when it is listed"""
+        with self._lock:
+            self._observed_entries[os.path.abspath(directory)] = (
+                DirectoryEntry(
+                    inode=directory_status.st_ino,
+                    mtime_ns=directory_status.st_mtime_ns,
+                    entries_count=entries_count,
+                    subdirectories=subdirectories,
+                )
+            )
+
+    def add_moved_file(self, file_path: str, new_file_path: str) -> None:
+        directory = os.path.abspath(os.path.dirname(file_path))
+        new_directory = os.path.abspath(os.path.dirname(new_file_path))
+        if directory == new_directory:
+            return
+        with self._lock:
+            self._entries_count_changes[directory] = (
+                self._entries_count_changes.get(directory, 0) - 1
+            )
+            self._entries_count_changes[new_directory] = (
+                self._entries_count_changes.get(new_directory, 0) + 1
+            )
+
+    def add_new_file(self, new_file_path: str) -> None:
+        new_directory = os.path.abspath(os.path.dirname(new_file_path))
+        with self._lock:
+            self._entries_count_changes[new_directory] = (
+                self._entries_count_changes.get(new_directory, 0) + 1
+            )
+
+    def discard(self, file_path: str) -> None:
+        """Have the directory of a file listed again by the next run"""
+        with self._lock:
+            self._discarded_directories.add(
+                os.path.abspath(os.path.dirname(file_path))
+            )
+
+    def get_summary_lines(self) -> list[str]:
+        if len(self._unchanged_entries) == 0:
+            return []
+        return [
+            "Directories skipped as unchanged since the last run: {} "
+            "({} entries)".format(
+                len(self._unchanged_entries),
+                sum(i.entries_count for i in self._unchanged_entries.values()),
+            )
+        ]
@@ -0,0 +1,252 @@
+import os
+import sys
+from typing import Iterator
+
+from .directory_manifest import DirectoryManifest
+from .helper import LOCK_FILE_NAME
+from .path_filter import PathFilter
+from .stat_layer import StatLayer
+
+
+class FileInventory:
+    """Files under a directory, listed one directory at a time
+
+    Paths of directories are interned and kept once in `directories`, while
+    files are yielded as arrays of names per directory. Entries of a directory
+    are sorted as if the full paths were sorted, i.e. a sub-directory is
+    placed where the paths of its files would be placed. Thus, iterating the
+    inventory gives the same order as sorting the paths of all files, but
+    memory used is bounded by the largest single directory rather than the
+    whole tree.
+
+    If `manifest` is given, directories unchanged since it was saved are not
+    listed, while their sub-directories are still visited. If `path_filter`
+    is given, files it excludes are not yielded, and directories it excludes
+    are pruned, i.e. neither listed nor visited. Statuses of directories are
+    fetched through `stat_layer`, if given, e.g. to use statx.
+    """
+
+    def __init__(
+        self,
+        src: str,
+        recursive: bool = False,
+        manifest: DirectoryManifest | None = None,
+        path_filter: PathFilter | None = None,
+        stat_layer: StatLayer | None = None,
+    ) -> None:
+        self.src = src
+        self.recursive = recursive
+        self.manifest = manifest
+        self.path_filter = (
+            path_filter
+            if path_filter is not None and path_filter.enabled
+            else None
+        )
+        self.stat_layer = (
+            stat_layer if stat_layer is not None else StatLayer(cache_size=0)
+        )
+        self.directories: list[str] = []
+        self.pruned_directories_count = 0
+        self.excluded_files_count = 0
+        # False for inventories counting files ahead of the iteration
+        self._observes_manifest = True
+
+    def __iter__(self) -> Iterator[str]:
+        for directory, files_names in self.iterate_directories():
+            for file_name in files_names:
+                yield os.path.join(directory, file_name)
+
+    def count_files(self) -> Iterator[int]:
+        """Yield the numbers of files to be iterated, directory by directory
+
+        The directories are listed the same way as `iterate_directories()`,
+        with the types of entries given by the listings, so files are not
+        stat'ed. Nothing is recorded in the manifest or the statistics, so the
+        files can be counted in another thread while being iterated.
+        """
+        inventory = type(self)(
+            src=self.src,
+            recursive=self.recursive,
+            manifest=self.manifest,
+            path_filter=self.path_filter,
+            stat_layer=self.stat_layer,
+        )
+        inventory._observes_manifest = False
+        for _, files_names in inventory.iterate_directories():
+            yield len(files_names)
+
+    def iterate_directories(self) -> Iterator[tuple[str, list[str]]]:
+        """Yield tuples of directory path and sorted names of files
+
+        A directory may be yielded more than once, if files of its
+        sub-directories have to be placed between its own files.
+        """
+        self.directories.clear()
+        self.pruned_directories_count = 0
+        self.excluded_files_count = 0
+        if self.recursive:
+            yield from self._iterate_directory_recursively(
+                directory=self.src, relative_directory=""
+            )
+            return
+        # Non-recursive search. Unlike the recursive search, error on listing
+        # the source directory is not suppressed.
+        directory_status = self.stat_layer.stat(self.src, use_cache=False)
+        if (
+            self.manifest is not None
+            and self.manifest.get_unchanged_subdirectories(
+                directory=self.src, directory_status=directory_status
+            )
+            is not None
+        ):
+            return
+        with os.scandir(self.src) as entries:
+            # Lock files of renames are not counted by the manifest either
+            entries = [e for e in entries if e.name != LOCK_FILE_NAME]
+            files_names = [
+                e.name
+                for e in entries
+                if e.is_file()
+                and not self._is_excluded(
+                    relative_path=e.name, is_directory=False
+                )
+            ]
+        files_names.sort()
+        if self.manifest is not None and self._observes_manifest:
+            self.manifest.observe(
+                directory=self.src,
+                directory_status=directory_status,
+                entries_count=len(entries),
+                subdirectories=[],
+            )
+        if len(files_names) > 0:
+            yield self._intern_directory(directory=self.src), files_names
+
+    def get_summary_lines(self) -> list[str]:
+        if (
+            self.pruned_directories_count == 0
+            and self.excluded_files_count == 0
+        ):
+            return []
+        return [
+            "Excluded by patterns: {} director(ies) pruned, {} file(s)".format(
+                self.pruned_directories_count, self.excluded_files_count
+            )
+        ]
+
+    def _is_excluded(self, relative_path: str, is_directory: bool) -> bool:
+        if self.path_filter is None or not self.path_filter.is_excluded(
+            relative_path=relative_path, is_directory=is_directory
+        ):
+            return False
+        if is_directory:
+            self.pruned_directories_count += 1
+        else:
+            self.excluded_files_count += 1
+        return True
+
+    def _intern_directory(self, directory: str) -> str:
+        directory = sys.intern(directory)
+        self.directories.append(directory)
+        return directory
+
+    def _iterate_directory_recursively(
+        self, directory: str, relative_directory: str
+    ) -> Iterator[tuple[str, list[str]]]:
+        # `relative_directory` is the path relative to `src`, with "/" as
+        # separators, to be matched by the filter
+        # Follow the behaviour of os.walk(): errors are ignored, symbolic links
+        # to directories are not followed and are not treated as files.
+        try:
+            directory_status = self.stat_layer.stat(directory, use_cache=False)
+        except OSError:
+            return
+        if self.manifest is not None:
+            subdirectories = self.manifest.get_unchanged_subdirectories(
+                directory=directory, directory_status=directory_status
+            )
+            if subdirectories is not None:
+                for name in subdirectories:
+                    relative_path = relative_directory + name
+                    if self._is_excluded(
+                        relative_path=relative_path, is_directory=True
+                    ):
+                        continue
+                    yield from self._iterate_directory_recursively(
+                        directory=os.path.join(directory, name),
+                        relative_directory=relative_path + "/",
+                    )
+                return
+        entries_count = 0
+        # Recorded by the manifest, which is independent of the filter
+        pruned_subdirectories: list[str] = []
+        try:
+            with os.scandir(directory) as entries:
+                sort_keys_and_entries: list[tuple[str, str, bool]] = []
+                for entry in entries:
+                    # Created by renames, and counted by neither the
+                    # manifest nor the filter
+                    if entry.name == LOCK_FILE_NAME:
+                        continue
+                    entries_count += 1
+                    try:
+                        is_directory = entry.is_dir()
+                    except OSError:
+                        is_directory = False
+                    if not is_directory:
+                        if not self._is_excluded(
+                            relative_path=relative_directory + entry.name,
+                            is_directory=False,
+                        ):
+                            sort_keys_and_entries.append(
+                                (entry.name, entry.name, False)
+                            )
+                        continue
+                    try:
+                        is_symlink = entry.is_symlink()
+                    except OSError:
+                        is_symlink = False
+                    if is_symlink:
+                        continue
+                    if self._is_excluded(
+                        relative_path=relative_directory + entry.name,
+                        is_directory=True,
+                    ):
+                        pruned_subdirectories.append(entry.name)
+                        continue
+                    # Paths of files in a sub-directory all start with
+                    # "<name><sep>", so they are sorted with this key
+                    sort_keys_and_entries.append(
+                        (entry.name + os.sep, entry.name, True)
+                    )
+        except OSError:
+            return
+        sort_keys_and_entries.sort()
+        if self.manifest is not None and self._observes_manifest:
+            self.manifest.observe(
+                directory=directory,
+                directory_status=directory_status,
+                entries_count=entries_count,
+                subdirectories=sorted(
+                    [
+                        *(i[1] for i in sort_keys_and_entries if i[2]),
+                        *pruned_subdirectories,
+                    ]
+                ),
+            )
+
+        directory = self._intern_directory(directory=directory)
+        files_names: list[str] = []
+        for _, name, is_directory in sort_keys_and_entries:
+            if not is_directory:
+                files_names.append(name)
+                continue
+            if len(files_names) > 0:
+                yield directory, files_names
+                files_names = []
+            yield from self._iterate_directory_recursively(
+                directory=os.path.join(directory, name),
+                relative_directory=relative_directory + name + "/",
+            )
+        if len(files_names) > 0:
+            yield directory, files_names
@@ -0,0 +1,378 @@
+import contextlib
+import dataclasses
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Iterator
+
+from . import helper
+from .stat_layer import StatLayer
+from rename_file_by_time_info import throttling, tracing
+
+
+file_logger = logging.getLogger(tracing.FILE_LOGGER_NAME)
+
+
+@dataclasses.dataclass
+class LockStatistics:
+    acquisitions: int = 0
+    # Acquisitions which have waited for other threads or processes
+    contentions: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    timeouts: int = 0
+
+
+class FileMover:
+    """Rename files, possibly into other directories on other file systems
+
+    Files moved into a directory are serialized by a lock of the directory,
+    so that a suffix is never taken by two files at the same time, while
+    different directories can be written concurrently. The lock is also an
+    advisory lock of the directory shared by other processes, e.g. other
+    instances of this tool. If a lock cannot be acquired within
+    `lock_timeout` seconds, its holder is considered stale and TimeoutError
+    is raised. Directories are created on first use and their devices are
+    cached.
+
+    A file moved to another file system is copied to a hidden temporary file
+    in the new directory first, which is flushed to the disk and verified.
+    The copy is then renamed to the new name, and the file is only deleted
+    after that. The directory lock is only held while the name is picked,
+    so that large files can be copied into a directory at the same time.
+    Files linked by `link()` are handled in the same way, except that they
+    are not deleted. Copies can also be made ahead by `prepare()`, e.g. by
+    several threads, while the names are picked in order by `move()` or
+    `link()`. If `throttle` is given, files are renamed at its rate of
+    files, and copied at its rate of bytes. Statuses of files are fetched
+    through `stat_layer`, and dropped from it when files are renamed.
+    """
+
+    def __init__(
+        self,
+        lock_timeout: float | None = 60.0,
+        throttle: throttling.Throttle | None = None,
+        stat_layer: StatLayer | None = None,
+    ) -> None:
+        self.lock_timeout = lock_timeout
+        self.throttle = throttle
+        self.stat_layer = (
+            stat_layer if stat_layer is not None else StatLayer(cache_size=0)
+        )
+        self.lock_statistics = LockStatistics()
+        self._directories_devices: dict[str, int] = {}
+        self._directories_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def prepare(
+        self,
+        files_paths: list[str],
+        new_files_paths: list[str],
+        link: bool = False,
+    ) -> list[str] | None:
+        """Copy a file, or a group of files, into the new directory ahead of
+        `move()`, or of `link()` if `link` is True
+
+        Returns the paths of the hidden temporary copies, to be passed to
+        `move()` or `link()`, which then only pick the new names, or None if
+        there is nothing to copy, i.e. files moved within a file system, or
+        files already linked. Copies which are not passed on have to be
+        removed by `discard()`.
+        """
+        new_directory = os.path.dirname(new_files_paths[0])
+        if (
+            self._is_linked(
+                files_paths=files_paths, new_files_paths=new_files_paths
+            )
+            if link
+            else self._is_on_same_device(
+                files_paths=files_paths, new_directory=new_directory
+            )
+        ):
+            return None
+        return self._copy_to_directory(
+            files_paths=files_paths,
+            new_directory=new_directory,
+            copy_function=helper.link_file if link else helper.copy_file,
+        )
+
+    def discard(self, copies_paths: list[str]) -> None:
+        for copy_path in copies_paths:
+            if os.path.exists(copy_path):
+                os.remove(copy_path)
+
+    def move(
+        self,
+        files_paths: list[str],
+        new_files_paths: list[str],
+        copies_paths: list[str] | None = None,
+    ) -> list[str] | None:
+        """Move a file, or a group of files sharing the same new directory
+
+        Returns the paths that the files are moved to, with the same suffix
+        added if any of the new paths is taken, or None if all of the files
+        already have the new paths. `copies_paths` are the copies made by
+        `prepare()`, if any.
+        """
+        if self.throttle is not None:
+            self.throttle.wait_for_files(stage="apply", count=len(files_paths))
+        new_directory = os.path.dirname(new_files_paths[0])
+        if copies_paths is None:
+            if self._is_on_same_device(
+                files_paths=files_paths, new_directory=new_directory
+            ):
+                with self.lock_directory(directory=new_directory):
+                    return helper.rename_group_to(
+                        files_paths=files_paths,
+                        new_files_paths=new_files_paths,
+                        stat_layer=self.stat_layer,
+                    )
+            copies_paths = self._copy_to_directory(
+                files_paths=files_paths,
+                new_directory=new_directory,
+                copy_function=helper.copy_file,
+            )
+        return self._rename_copies(
+            files_paths=files_paths,
+            new_files_paths=new_files_paths,
+            copies_paths=copies_paths,
+            remove_files=True,
+        )
+
+    def link(
+        self,
+        files_paths: list[str],
+        new_files_paths: list[str],
+        copies_paths: list[str] | None = None,
+    ) -> list[str] | None:
+        """Link or copy a file, or a group of files, leaving them untouched
+
+        Files are hard-linked, reflinked, or otherwise copied, to the new
+        paths. A new path which is already a link, or a copy with the same
+        size, modified time and content, of the file is not taken, so files
+        already linked are not linked again. Returns the paths that the files are
+        linked to, or None if all of them have already been linked.
+        `copies_paths` are the copies made by `prepare()`, if any.
+        """
+        if self.throttle is not None:
+            self.throttle.wait_for_files(stage="apply", count=len(files_paths))
+        if copies_paths is None:
+            if self._is_linked(
+                files_paths=files_paths, new_files_paths=new_files_paths
+            ):
+                for file_path in files_paths:
+                    file_logger.info("File already linked: %s", file_path)
+                return None
+            copies_paths = self._copy_to_directory(
+                files_paths=files_paths,
+                new_directory=os.path.dirname(new_files_paths[0]),
+                copy_function=helper.link_file,
+            )
+        return self._rename_copies(
+            files_paths=files_paths,
+            new_files_paths=new_files_paths,
+            copies_paths=copies_paths,
+            remove_files=False,
+        )
+
+    @contextlib.contextmanager
+    def lock_directory(self, directory: str) -> Iterator[None]:
+        """Lock a directory out of other threads and processes"""
+        with self._lock:
+            directory_lock = self._directories_locks.get(directory, None)
+            if directory_lock is None:
+                directory_lock = threading.Lock()
+                self._directories_locks[directory] = directory_lock
+        start_time = time.monotonic()
+        with contextlib.ExitStack() as stack:
+            try:
+                if not directory_lock.acquire(
+                    timeout=(
+                        -1 if self.lock_timeout is None else self.lock_timeout
+                    )
+                ):
+                    raise TimeoutError(
+                        "Timed out waiting for the lock of directory: "
+                        "{}".format(directory)
+                    )
+                stack.callback(directory_lock.release)
+                stack.enter_context(
+                    helper.lock_directory(
+                        directory=directory,
+                        timeout=(
+                            None
+                            if self.lock_timeout is None
+                            else max(
+                                self.lock_timeout
+                                - (time.monotonic() - start_time),
+                                0,
+                            )
+                        ),
+                    )
+                )
+            except TimeoutError:
+                with self._lock:
+                    self.lock_statistics.timeouts += 1
+                raise
+            self._record_lock_wait(seconds=time.monotonic() - start_time)
+            yield
+
+    def get_summary_lines(self) -> list[str]:
+        statistics = self.lock_statistics
+        if statistics.acquisitions == 0 and statistics.timeouts == 0:
+            return []
+        return [
+            "Directory locks: {} acquired, {} after waiting, {:.3f}s waited "
+            "(at most {:.3f}s), {} timed out".format(
+                statistics.acquisitions,
+                statistics.contentions,
+                statistics.wait_seconds,
+                statistics.max_wait_seconds,
+                statistics.timeouts,
+            )
+        ]
+
+    def _record_lock_wait(self, seconds: float) -> None:
+        with self._lock:
+            statistics = self.lock_statistics
+            statistics.acquisitions += 1
+            # Waits shorter than this are only the cost of locking
+            if seconds >= 0.001:
+                statistics.contentions += 1
+            statistics.wait_seconds += seconds
+            statistics.max_wait_seconds = max(
+                statistics.max_wait_seconds, seconds
+            )
+
+    def _get_directory_device(self, directory: str) -> int:
+        device = self._directories_devices.get(directory, None)
+        if device is None:
+            os.makedirs(directory, exist_ok=True)
+            device = self.stat_layer.stat(directory).st_dev
+            self._directories_devices[directory] = device
+        return device
+
+    def _is_on_same_device(
+        self, files_paths: list[str], new_directory: str
+    ) -> bool:
+        new_directory_device = self._get_directory_device(
+            directory=new_directory
+        )
+        return all(
+            self.stat_layer.stat(i).st_dev == new_directory_device
+            for i in files_paths
+        )
+
+    def _is_linked(
+        self, files_paths: list[str], new_files_paths: list[str]
+    ) -> bool:
+        new_directory = os.path.dirname(new_files_paths[0])
+        self._get_directory_device(directory=new_directory)
+        with self.lock_directory(directory=new_directory):
+            unique_files_paths = helper.get_unique_files_paths(
+                files_paths=files_paths,
+                new_files_paths=new_files_paths,
+                is_same_file=self._is_same_file_content,
+                stat_layer=self.stat_layer,
+            )
+        return all(
+            map(self._is_same_file_content, files_paths, unique_files_paths)
+        )
+
+    def _is_same_file_content(
+        self, file_path: str, other_file_path: str
+    ) -> bool:
+        return helper.is_same_file_content(
+            file_path=file_path,
+            other_file_path=other_file_path,
+            stat_layer=self.stat_layer,
+        )
+
+    def _copy_to_directory(
+        self,
+        files_paths: list[str],
+        new_directory: str,
+        copy_function: Callable[[str, str], object],
+    ) -> list[str]:
+        """Copy files to hidden temporary files in a directory"""
+        # Copies are removed on failure. The files are left untouched.
+        copies_paths: list[str] = []
+        try:
+            for file_path in files_paths:
+                copy_fd, copy_path = tempfile.mkstemp(
+                    prefix=".{}.".format(os.path.basename(file_path)),
+                    suffix=".partial",
+                    dir=new_directory,
+                )
+                os.close(copy_fd)
+                os.remove(copy_path)
+                copies_paths.append(copy_path)
+                method = copy_function(file_path, copy_path)
+                # Links do not read files, while copies are paid for after
+                # the fact, by delaying the files after them
+                if self.throttle is not None and method not in (
+                    "hardlink",
+                    "reflink",
+                ):
+                    self.throttle.wait_for_bytes(
+                        count=self.stat_layer.stat(file_path).st_size
+                    )
+        except BaseException:
+            self.discard(copies_paths=copies_paths)
+            raise
+        return copies_paths
+
+    def _rename_copies(
+        self,
+        files_paths: list[str],
+        new_files_paths: list[str],
+        copies_paths: list[str],
+        remove_files: bool,
+    ) -> list[str]:
+        new_directory = os.path.dirname(new_files_paths[0])
+        # Copies are removed on failure, wherever they are. The files are
+        # left untouched.
+        copies_paths = list(copies_paths)
+        try:
+            with self.lock_directory(directory=new_directory):
+                new_files_paths = helper.get_unique_files_paths(
+                    files_paths=copies_paths,
+                    new_files_paths=new_files_paths,
+                    is_same_file=(
+                        None if remove_files else self._is_same_file_content
+                    ),
+                    stat_layer=self.stat_layer,
+                )
+                for i, new_file_path in enumerate(new_files_paths):
+                    os.rename(copies_paths[i], new_file_path)
+                    # Renaming a link onto a link of the same file does
+                    # nothing
+                    if os.path.lexists(copies_paths[i]):
+                        os.remove(copies_paths[i])
+                    self.stat_layer.invalidate(new_file_path)
+                    copies_paths[i] = new_file_path
+            _fsync_directory(directory=new_directory)
+        except BaseException:
+            self.discard(copies_paths=copies_paths)
+            raise
+        for file_path, new_file_path in zip(files_paths, new_files_paths):
+            if remove_files:
+                os.remove(file_path)
+                self.stat_layer.invalidate(file_path)
+            helper.log_renamed_file(
+                file_path=file_path, new_file_path=new_file_path
+            )
+        return new_files_paths
+
+
+def _fsync_directory(directory: str) -> None:
+    # Directories cannot be opened on Windows, where renames are durable
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -1,6 +1,13 @@
 import dataclasses
 import datetime
-from typing import ClassVar
+import functools
+import re
+from typing import Any, ClassVar, Type, TypeVar
+
+from .config_context import ConfigContext
+
+
+_F = TypeVar("_F", bound="FileNameFormatter")
 
 
 class NoValueAssociatedWithTheFormatCodeError(ValueError):
@@ -24,6 +31,18 @@ class FileNameFormatter:
         r"{ms}": r"\d{3}",
         "z": r"[+-](0[0-9]|1[0-9]|2[0-3])(0[0-9]|1[0-9]|2[0-9]|3[0-9]|4[0-9]|5[0-9])",
     }
+    # Names of the groups that format codes are parsed into
+    _format_codes_to_group_names: ClassVar[dict[str, str]] = {
+        "Y": "year",
+        "y": "short_year",
+        "m": "month",
+        "d": "day",
+        "H": "hour",
+        "M": "minute",
+        "S": "second",
+        r"{ms}": "millisecond",
+        "z": "timezone",
+    }
 
     year: int | None
     month: int | None
@@ -76,28 +95,32 @@ class FileNameFormatter:
         self._format_code_to_value_mapping = format_codes_to_values_mapping
 
     @classmethod
-    def set_regex_of_format_code(
+    def get_regex_of_naming_format(
         cls,
-        format_code: str,
-        choices: list[str] | None = None,
-        regex: str | None = None,
-    ) -> None:
-        if choices is None and regex is None:
-            raise ValueError(
-                "Either \"choices\" or \"regex\" must be specified"
-            )
-        cls._format_codes_to_regex_mapping[format_code] = "({})".format(
-            "|".join(choices) if choices is not None else regex
-        )
+        naming_format: str,
+        context: ConfigContext | None = None,
+        named_groups: bool = False,
+    ) -> str:
+        """Get a regex matching names formatted in a naming format
 
-    @classmethod
-    def get_regex_of_naming_format(cls, naming_format: str) -> bool:
+        If `named_groups` is True, the value of each format code is captured
+        in a group named in `_format_codes_to_group_names`, and other
+        characters are matched literally.
+        """
+        if context is None:
+            context = ConfigContext()
         regex = []
+        # Groups already in the regex, which repeated format codes refer to
+        group_names: set[str] = set()
         i = 0
         try:
             while i < len(naming_format):
                 if naming_format[i] != "%":
-                    regex.append(naming_format[i])
+                    regex.append(
+                        re.escape(naming_format[i])
+                        if named_groups
+                        else naming_format[i]
+                    )
                     i += 1
                     continue
                 j = i + 1
@@ -111,14 +134,123 @@ class FileNameFormatter:
                     if naming_format[j] != r"}":
                         raise ValueError()
                     format_code = naming_format[i + 1 : j + 1]
+                if named_groups and format_code == "%":
+                    regex.append(re.escape("%"))
+                    i = j + 1
+                    continue
                 if format_code not in cls.FORMAT_CODES:
                     raise ValueError()
-                regex.append(cls._format_codes_to_regex_mapping[format_code])
+                format_code_regex = cls._get_regex_of_format_code(
+                    format_code=format_code, context=context
+                )
+                if named_groups:
+                    group_name = cls._format_codes_to_group_names[format_code]
+                    format_code_regex = (
+                        "(?P={})".format(group_name)
+                        if group_name in group_names
+                        else "(?P<{}>{})".format(group_name, format_code_regex)
+                    )
+                    group_names.add(group_name)
+                regex.append(format_code_regex)
                 i = j + 1
         except ValueError:
             raise ValueError("Invalid format string: {}".format(naming_format))
         return "".join(regex)
 
+    @classmethod
+    def parse(
+        cls: Type[_F],
+        file_name: str,
+        naming_format: str,
+        context: ConfigContext | None = None,
+    ) -> _F | None:
+        """Parse a name formatted in a naming format back into a formatter
+
+        This is the inverse of `get_formatted_filename()`, where `file_name`
+        is without its extension, and may end with the suffix of a duplicated
+        name, e.g. "_0001". Fields whose format codes are not in the naming
+        format are None. A two-digit year ("%y") alone is taken as 1969 to
+        2068. Returns None if the name does not match the naming format.
+        """
+        if context is None:
+            context = ConfigContext()
+        match = _get_naming_format_parser(
+            file_name_formatter=cls,
+            naming_format=naming_format,
+            context=context,
+        ).match(file_name)
+        if match is None:
+            return None
+        try:
+            return cls(
+                **cls._get_fields_of_groups(
+                    groups=match.groupdict(), context=context
+                )
+            )
+        except (AssertionError, KeyError, ValueError):
+            # E.g. "%Y" and "%y" of different years
+            return None
+
+    @classmethod
+    def _get_fields_of_groups(
+        cls, groups: dict[str, str | None], context: ConfigContext
+    ) -> dict[str, Any]:
+        def get_int(group_name: str) -> int | None:
+            value = groups.get(group_name, None)
+            return None if value is None else int(value)
+
+        year = get_int("year")
+        short_year = get_int("short_year")
+        if year is None and short_year is not None:
+            year = short_year + (1900 if short_year >= 69 else 2000)
+        elif year is not None and short_year is not None:
+            if year % 100 != short_year:
+                raise ValueError("Inconsistent years")
+        timezone = None
+        if groups.get("timezone", None) is not None:
+            value = groups["timezone"]
+            offset = datetime.timedelta(
+                hours=int(value[1:3]), minutes=int(value[3:5])
+            )
+            timezone = datetime.timezone(
+                offset if value[0] == "+" else -offset
+            )
+        return {
+            "year": year,
+            "month": get_int("month"),
+            "day": get_int("day"),
+            "hour": get_int("hour"),
+            "minute": get_int("minute"),
+            "second": get_int("second"),
+            "millisecond": get_int("millisecond"),
+            "timezone": timezone,
+        }
+
+    def get_date_and_time(self) -> datetime.datetime | None:
+        """Get the date and time of the fields, or None without a date
+
+        Fields of the time which are None are taken as 0. The result is naive
+        if the time zone is None.
+        """
+        if self.year is None or self.month is None or self.day is None:
+            return None
+        return datetime.datetime(
+            self.year,
+            self.month,
+            self.day,
+            self.hour or 0,
+            self.minute or 0,
+            self.second or 0,
+            (self.millisecond or 0) * 1000,
+            tzinfo=self.timezone,
+        )
+
+    @classmethod
+    def _get_regex_of_format_code(
+        cls, format_code: str, context: ConfigContext
+    ) -> str:
+        return cls._format_codes_to_regex_mapping[format_code]
+
     def get_formatted_filename(self, naming_format: str) -> str:
         file_name = []
         i = 0
@@ -156,3 +288,16 @@ class FileNameFormatter:
         except ValueError:
             raise ValueError("Invalid format string: {}".format(naming_format))
         return "".join(file_name)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_naming_format_parser(
+    file_name_formatter: Type[FileNameFormatter],
+    naming_format: str,
+    context: ConfigContext,
+) -> re.Pattern:
+    # Compiled once per naming format and context, which are hashable
+    regex = file_name_formatter.get_regex_of_naming_format(
+        naming_format=naming_format, context=context, named_groups=True
+    )
+    return re.compile(r"^" + regex + r"(?:_\d{4})?$")
@@ -1,13 +1,48 @@
+import contextlib
 import datetime
+import errno
+import functools
 import logging
 import os
 import re
-from typing import Type
+import shutil
+import stat
+import struct
+import sys
+import time
+from typing import Callable, Iterator, Type
 
+from .config_context import ConfigContext
 from .file_name_formatter import FileNameFormatter
+from .stat_layer import StatLayer
+from rename_file_by_time_info import tracing
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
 
 
 logger = logging.getLogger()
+file_logger = logging.getLogger(tracing.FILE_LOGGER_NAME)
+# Hidden file locked in directories which cannot be locked themselves, e.g.
+# on NFS, which is left in place, as removing it would race with other
+# processes locking it
+LOCK_FILE_NAME = ".rename_file_by_time_info.lock"
+# Errors of file systems without locks, or without locks of directories, e.g.
+# NFS, and of directories where the lock file cannot be created
+_LOCK_UNSUPPORTED_ERRNOS = frozenset(
+    [errno.EBADF, errno.ENOLCK, errno.EOPNOTSUPP, errno.ENOTSUP]
+)
+_LOCK_FILE_UNWRITABLE_ERRNOS = frozenset(
+    [errno.EACCES, errno.EPERM, errno.EROFS]
+)
+# Reference: linux/fs.h
+_FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+_FS_IOC_FIEMAP = 0xC020660B
+# struct fiemap, followed by a single struct fiemap_extent
+_FIEMAP_FORMAT = "=QQIIII" + "QQQQQIIII"
 
 
 def get_file_name_prefix_and_extension(
@@ -24,6 +59,15 @@ def get_file_name_prefix_and_extension(
         )
 
 
+def join_file_name_prefix_and_extension(
+    file_name_prefix: str, file_extension: str
+) -> str:
+    """The inverse of get_file_name_prefix_and_extension()"""
+    if file_extension == "":
+        return file_name_prefix
+    return "{}.{}".format(file_name_prefix, file_extension)
+
+
 def offset_time_str_to_timedelta(value: str) -> datetime.timedelta:
     if value[0] not in ["+", "-"]:
         raise ValueError("The first character must be either +/-")
@@ -44,17 +88,23 @@ def modify_file_path_until_no_duplication_exists(
     lower_limit: int = 1,
     upper_limit: int = 10000,
     replaceable_file_path: str = "",
+    stat_layer: StatLayer | None = None,
 ) -> str:
+    if stat_layer is None:
+        stat_layer = StatLayer(cache_size=0)
     file_directory = os.path.dirname(file_path)
     file_name_prefix, file_extension = get_file_name_prefix_and_extension(
         file_name_or_path=file_path
     )
     for i in range(lower_limit, upper_limit):
         i_str = str(i).zfill(4)
-        new_file_name = f"{file_name_prefix}_{i_str}.{file_extension}"
+        new_file_name = join_file_name_prefix_and_extension(
+            file_name_prefix=f"{file_name_prefix}_{i_str}",
+            file_extension=file_extension,
+        )
         new_file_path = os.path.join(file_directory, new_file_name)
         if (
-            not os.path.isfile(new_file_path)
+            not stat_layer.is_file(new_file_path)
             or new_file_path == replaceable_file_path
         ):
             return new_file_path
@@ -67,39 +117,45 @@ def file_name_matches_file_format(
     file_name_formatter: Type[FileNameFormatter],
     file_name: str,
     naming_format: str,
+    context: ConfigContext | None = None,
 ) -> bool:
+    return (
+        _get_naming_format_pattern(
+            file_name_formatter=file_name_formatter,
+            naming_format=naming_format,
+            context=context if context is not None else ConfigContext(),
+        ).match(file_name)
+        is not None
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _get_naming_format_pattern(
+    file_name_formatter: Type[FileNameFormatter],
+    naming_format: str,
+    context: ConfigContext,
+) -> re.Pattern:
+    # Compiled once per naming format and context, which are hashable
     regex = file_name_formatter.get_regex_of_naming_format(
-        naming_format=naming_format
+        naming_format=naming_format, context=context
     )
-    regex = r"^" + regex + r"(_\d{4})?$"
-    return re.match(regex, file_name) is not None
+    return re.compile(r"^" + regex + r"(_\d{4})?$")
 
 
-def rename(
+def get_renamed_file(
     file_path: str,
     naming_format: str,
     forced_offset_time: str | None = None,
     forced_date: datetime.date | None = None,
-    skip_if_file_name_matches_naming_format: bool = False,
-) -> None:
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError("No such file: {}".format(file_path))
+    file_status: os.stat_result | None = None,
+) -> str:
+    """Get the new name of a file from its modified time
 
-    file_name = os.path.basename(file_path)
-    file_name_prefix, file_extension = get_file_name_prefix_and_extension(
+    `file_status` saves a call of os.stat() if the caller has it already.
+    """
+    _, file_extension = get_file_name_prefix_and_extension(
         file_name_or_path=file_path
     )
-    if (
-        skip_if_file_name_matches_naming_format
-        and file_name_matches_file_format(
-            file_name_formatter=FileNameFormatter,
-            file_name=file_name_prefix,
-            naming_format=naming_format,
-        )
-    ):
-        logger.info("Skip files with matching naming format: %s", file_path)
-        return
-
     time_zone = (
         datetime.timezone.utc
         if forced_offset_time is None
@@ -109,8 +165,10 @@ def rename(
     )
     date_and_time: datetime.datetime
     if forced_date is None:
+        if file_status is None:
+            file_status = os.stat(file_path)
         date_and_time = datetime.datetime.fromtimestamp(
-            os.stat(file_path).st_mtime, tz=time_zone
+            file_status.st_mtime, tz=time_zone
         )
     else:
         date_and_time = datetime.datetime.combine(
@@ -127,18 +185,498 @@ def rename(
         millisecond=0,
         timezone=date_and_time.tzinfo,
     )
-    new_file_name = file_name_formatter.get_formatted_filename(
-        naming_format="{}.{}".format(naming_format, file_extension)
+    return file_name_formatter.get_formatted_filename(
+        naming_format=join_file_name_prefix_and_extension(
+            file_name_prefix=naming_format, file_extension=file_extension
+        )
     )
-    file_directory = os.path.dirname(file_path)
-    new_file_path = os.path.join(file_directory, new_file_name)
-    if os.path.normpath(file_path) == os.path.normpath(new_file_path):
-        logger.info("File unchanged: %s", file_name)
+
+
+@contextlib.contextmanager
+def lock_directory(
+    directory: str, timeout: float | None = None
+) -> Iterator[float]:
+    """Hold an advisory lock of a directory, which is shared by processes
+
+    The lock is taken on the directory itself, so that no file is added to
+    it. Where directories cannot be locked, e.g. on NFS, whose client
+    emulates flock(2) with byte-range locks needing files open for writing,
+    the lock is taken on the LOCK_FILE_NAME file in the directory instead.
+    Yields the number of seconds waited for the lock. Raises TimeoutError if
+    the lock is not acquired within `timeout` seconds, e.g. when the process
+    holding it has hung. Locks are released by the system if the process
+    holding them exits.
+
+    Processes are not locked out on Windows, on file systems without locks,
+    or if the lock file cannot be created, in which case a warning is logged
+    once per device. Threads are still locked out by FileMover.
+
+    References:
+    - flock(2). https://man7.org/linux/man-pages/man2/flock.2.html
+    """
+    if fcntl is None:
+        yield 0.0
         return
-    if os.path.isfile(new_file_path):
-        new_file_path = modify_file_path_until_no_duplication_exists(
-            file_path=new_file_path,
-            replaceable_file_path=file_path,
+    start_time = time.monotonic()
+    fd: int | None = os.open(directory, os.O_RDONLY)
+    try:
+        is_locked = _flock(
+            fd=fd, directory=directory, timeout=timeout, start_time=start_time
+        )
+        if not is_locked:
+            os.close(fd)
+            fd = None
+            fd = _open_lock_file(directory=directory)
+            is_locked = fd is not None and _flock(
+                fd=fd,
+                directory=directory,
+                timeout=timeout,
+                start_time=start_time,
+            )
+        # Closing the file descriptor releases the lock
+        yield time.monotonic() - start_time
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def _flock(
+    fd: int, directory: str, timeout: float | None, start_time: float
+) -> bool:
+    """Lock a file descriptor, or return False if it cannot be locked"""
+    delay = 0.001
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if (
+                timeout is not None
+                and time.monotonic() - start_time >= timeout
+            ):
+                raise TimeoutError(
+                    "Timed out waiting for the lock of directory: {}".format(
+                        directory
+                    )
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        except OSError as e:
+            if e.errno not in _LOCK_UNSUPPORTED_ERRNOS:
+                raise
+            if stat.S_ISREG(os.fstat(fd).st_mode):
+                _warn_lock_unsupported(
+                    device=os.fstat(fd).st_dev, message=str(e)
+                )
+            return False
+
+
+def _open_lock_file(directory: str) -> int | None:
+    try:
+        return os.open(
+            os.path.join(directory, LOCK_FILE_NAME),
+            os.O_RDWR | os.O_CREAT,
+            0o666,
+        )
+    except OSError as e:
+        if e.errno not in _LOCK_FILE_UNWRITABLE_ERRNOS:
+            raise
+        _warn_lock_unsupported(
+            device=os.stat(directory).st_dev, message=str(e)
+        )
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _warn_lock_unsupported(device: int, message: str) -> None:
+    logger.warning(
+        "Directories on device %d are not locked out of other processes: %s",
+        device,
+        message,
+    )
+
+
+def rename_to(
+    file_path: str,
+    new_file_path: str,
+    stat_layer: StatLayer | None = None,
+    lock_timeout: float | None = 60.0,
+) -> str | None:
+    """Rename a file, with a suffix added to the new name if it is taken
+
+    Returns the path that the file is renamed to, or None if the file already
+    has the new name. Statuses are fetched through `stat_layer`, if given.
+    Raises TimeoutError if the directory is not locked within `lock_timeout`
+    seconds.
+    """
+    if stat_layer is None:
+        stat_layer = StatLayer(cache_size=0)
+    file_name = os.path.basename(file_path)
+    if os.path.normpath(file_path) == os.path.normpath(new_file_path):
+        file_logger.info("File unchanged: %s", file_name)
+        return None
+    with lock_directory(
+        directory=os.path.dirname(new_file_path) or ".", timeout=lock_timeout
+    ):
+        if stat_layer.is_file(new_file_path):
+            new_file_path = modify_file_path_until_no_duplication_exists(
+                file_path=new_file_path,
+                replaceable_file_path=file_path,
+                stat_layer=stat_layer,
+            )
+        try:
+            os.rename(file_path, new_file_path)
+        finally:
+            stat_layer.invalidate(file_path, new_file_path)
+    log_renamed_file(file_path=file_path, new_file_path=new_file_path)
+    return new_file_path
+
+
+def get_unique_files_paths(
+    files_paths: list[str],
+    new_files_paths: list[str],
+    lower_limit: int = 1,
+    upper_limit: int = 10000,
+    is_same_file: Callable[[str, str], bool] | None = None,
+    stat_layer: StatLayer | None = None,
+) -> list[str]:
+    """Get new paths of a group of files, with the same suffix added to them
+    if any of them is taken by another file
+
+    If `is_same_file` is given, a path is also not taken if
+    `is_same_file(file_path, new_file_path)` is true.
+    """
+    if stat_layer is None:
+        stat_layer = StatLayer(cache_size=0)
+
+    def is_taken(new_file_path: str, file_path: str) -> bool:
+        return (
+            stat_layer.is_file(new_file_path)
+            and os.path.normpath(new_file_path) != os.path.normpath(file_path)
+            and (
+                is_same_file is None
+                or not is_same_file(file_path, new_file_path)
+            )
+        )
+
+    if not any(map(is_taken, new_files_paths, files_paths)):
+        return list(new_files_paths)
+    for i in range(lower_limit, upper_limit):
+        i_str = str(i).zfill(4)
+        unique_files_paths = []
+        for new_file_path in new_files_paths:
+            file_name_prefix, file_extension = (
+                get_file_name_prefix_and_extension(
+                    file_name_or_path=new_file_path
+                )
+            )
+            unique_files_paths.append(
+                os.path.join(
+                    os.path.dirname(new_file_path),
+                    join_file_name_prefix_and_extension(
+                        file_name_prefix=f"{file_name_prefix}_{i_str}",
+                        file_extension=file_extension,
+                    ),
+                )
+            )
+        if not any(map(is_taken, unique_files_paths, files_paths)):
+            return unique_files_paths
+    raise ValueError(
+        "Could not find a unique file name for group of file: {}".format(
+            files_paths[0]
         )
-    os.rename(file_path, new_file_path)
-    logger.info("%s -> %s", file_name, os.path.basename(new_file_path))
+    )
+
+
+def rename_group_to(
+    files_paths: list[str],
+    new_files_paths: list[str],
+    stat_layer: StatLayer | None = None,
+) -> list[str] | None:
+    """Rename a group of files, with the same suffix added to the new names
+    if any of them is taken
+
+    Files already renamed are renamed back if one of them fails. Returns the
+    paths that the files are renamed to, or None if all of the files already
+    have the new names.
+    """
+    if all(
+        os.path.normpath(i) == os.path.normpath(j)
+        for i, j in zip(files_paths, new_files_paths)
+    ):
+        for file_path in files_paths:
+            file_logger.info("File unchanged: %s", os.path.basename(file_path))
+        return None
+    if stat_layer is None:
+        stat_layer = StatLayer(cache_size=0)
+    new_files_paths = get_unique_files_paths(
+        files_paths=files_paths,
+        new_files_paths=new_files_paths,
+        stat_layer=stat_layer,
+    )
+    renamed_files_paths: list[tuple[str, str]] = []
+    try:
+        for file_path, new_file_path in zip(files_paths, new_files_paths):
+            if os.path.normpath(file_path) == os.path.normpath(new_file_path):
+                continue
+            os.rename(file_path, new_file_path)
+            renamed_files_paths.append((file_path, new_file_path))
+    except OSError:
+        for file_path, new_file_path in reversed(renamed_files_paths):
+            os.rename(new_file_path, file_path)
+        raise
+    finally:
+        stat_layer.invalidate(*files_paths, *new_files_paths)
+    for file_path, new_file_path in zip(files_paths, new_files_paths):
+        log_renamed_file(file_path=file_path, new_file_path=new_file_path)
+    return new_files_paths
+
+
+def log_renamed_file(file_path: str, new_file_path: str) -> None:
+    """Log a file renamed, with the full paths if it is moved to another
+    directory
+    """
+    if os.path.dirname(os.path.normpath(file_path)) == os.path.dirname(
+        os.path.normpath(new_file_path)
+    ):
+        file_logger.info(
+            "%s -> %s",
+            os.path.basename(file_path),
+            os.path.basename(new_file_path),
+        )
+    else:
+        file_logger.info("%s -> %s", file_path, new_file_path)
+
+
+def copy_file(file_path: str, new_file_path: str) -> None:
+    """Copy a file, including its timestamps, and flush it to the disk
+
+    The content is copied by the kernel, without passing through Python,
+    if the platform supports it. Raises OSError if the size of the copy is
+    not the same as the original.
+
+    References:
+    - copy_file_range(2). https://man7.org/linux/man-pages/man2/copy_file_range.2.html
+    - sendfile(2). https://man7.org/linux/man-pages/man2/sendfile.2.html
+    """
+    with open(file_path, "rb") as f, open(new_file_path, "xb") as new_f:
+        file_size = os.fstat(f.fileno()).st_size
+        _copy_file_content(
+            fd=f.fileno(), new_fd=new_f.fileno(), file_size=file_size
+        )
+        shutil.copystat(file_path, new_file_path)
+        os.fsync(new_f.fileno())
+        new_file_size = os.fstat(new_f.fileno()).st_size
+    if new_file_size != file_size:
+        raise OSError(
+            "Size of the copy ({}) differs from the file ({}): {}".format(
+                new_file_size, file_size, file_path
+            )
+        )
+
+
+def link_file(file_path: str, new_file_path: str) -> str:
+    """Make a hard link, a reflink, or otherwise a copy of a file
+
+    Returns the method used, which is either "hardlink", "reflink" or
+    "copy".
+
+    References:
+    - ioctl_ficlone(2). https://man7.org/linux/man-pages/man2/ioctl_ficlone.2.html
+    """
+    try:
+        os.link(file_path, new_file_path)
+        return "hardlink"
+    except OSError as e:
+        # Otherwise, e.g. on another file system, or one without hard links
+        if e.errno not in (
+            errno.EXDEV,
+            errno.EPERM,
+            errno.EMLINK,
+            errno.ENOTSUP,
+        ):
+            raise
+    if fcntl is not None and sys.platform == "linux":
+        with open(file_path, "rb") as f, open(new_file_path, "xb") as new_f:
+            try:
+                fcntl.ioctl(new_f.fileno(), _FICLONE, f.fileno())
+                is_cloned = True
+            except OSError:
+                # Not supported by the file system, or across file systems
+                is_cloned = False
+        if is_cloned:
+            shutil.copystat(file_path, new_file_path)
+            return "reflink"
+        os.remove(new_file_path)
+    copy_file(file_path=file_path, new_file_path=new_file_path)
+    return "copy"
+
+
+def is_same_file_content(
+    file_path: str, other_file_path: str, stat_layer: StatLayer | None = None
+) -> bool:
+    """Whether two files are links of the same file, or copies of the same
+    size, modified time and content
+
+    Files of the same size and modified time, e.g. photos copied from a
+    camera, may still differ, so their contents are compared.
+    """
+    if stat_layer is None:
+        stat_layer = StatLayer(cache_size=0)
+    try:
+        file_status = stat_layer.stat(file_path)
+        other_file_status = stat_layer.stat(other_file_path)
+    except FileNotFoundError:
+        return False
+    if (file_status.st_dev, file_status.st_ino) == (
+        other_file_status.st_dev,
+        other_file_status.st_ino,
+    ):
+        return True
+    if (file_status.st_size, file_status.st_mtime_ns) != (
+        other_file_status.st_size,
+        other_file_status.st_mtime_ns,
+    ):
+        return False
+    with open(file_path, "rb") as f, open(other_file_path, "rb") as other_f:
+        while True:
+            data = f.read(1024 * 1024)
+            if data != other_f.read(1024 * 1024):
+                return False
+            if len(data) == 0:
+                return True
+
+
+def get_locality_key(
+    file_path: str,
+    use_extents: bool = False,
+    stat_layer: StatLayer | None = None,
+) -> tuple:
+    """Get a key sorting files by their locations on the disk
+
+    Files are sorted by device and inode, which file systems usually
+    allocate close to the data, or by the physical offset of their first
+    extents if `use_extents` is True and it is available. Files which cannot
+    be accessed are sorted first.
+    """
+    if stat_layer is None:
+        stat_layer = StatLayer(cache_size=0)
+    try:
+        file_status = stat_layer.stat(file_path)
+    except OSError:
+        return (-1,)
+    physical_offset = (
+        get_physical_offset(file_path=file_path) if use_extents else None
+    )
+    return (
+        file_status.st_dev,
+        physical_offset is not None,
+        physical_offset or 0,
+        file_status.st_ino,
+    )
+
+
+def get_physical_offset(file_path: str) -> int | None:
+    """Get the offset of the first extent of a file on its device
+
+    Uses the FIEMAP ioctl, which is only available on Linux. Returns None if
+    the offset is unavailable, e.g. for empty files or on file systems
+    without FIEMAP.
+
+    References:
+    - Fiemap Ioctl. https://docs.kernel.org/filesystems/fiemap.html
+    """
+    if fcntl is None or sys.platform != "linux":
+        return None
+    request = bytearray(struct.calcsize(_FIEMAP_FORMAT))
+    # Map the whole file, into at most one extent
+    struct.pack_into("=QQIIII", request, 0, 0, 2**64 - 1, 0, 0, 1, 0)
+    try:
+        with open(file_path, "rb") as f:
+            fcntl.ioctl(f.fileno(), _FS_IOC_FIEMAP, request, True)
+    except OSError:
+        return None
+    fiemap = struct.unpack(_FIEMAP_FORMAT, request)
+    mapped_extents_count = fiemap[3]
+    if mapped_extents_count == 0:
+        return None
+    return fiemap[7]
+
+
+def _copy_file_content(fd: int, new_fd: int, file_size: int) -> None:
+    copied_size = 0
+    for copy_function in [
+        getattr(os, "copy_file_range", None),
+        (
+            (lambda fd, new_fd, count: os.sendfile(new_fd, fd, None, count))
+            if hasattr(os, "sendfile")
+            else None
+        ),
+    ]:
+        if copy_function is None:
+            continue
+        try:
+            while copied_size < file_size:
+                size = copy_function(fd, new_fd, file_size - copied_size)
+                if size == 0:
+                    break
+                copied_size += size
+            return
+        except OSError as e:
+            # Not supported between these files. Only fall back if nothing
+            # has been copied.
+            if copied_size > 0 or e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+            ):
+                raise
+    while True:
+        data = memoryview(os.read(fd, 1024 * 1024))
+        if len(data) == 0:
+            return
+        while len(data) > 0:
+            data = data[os.write(new_fd, data) :]
+
+
+def rename(
+    file_path: str,
+    naming_format: str,
+    forced_offset_time: str | None = None,
+    forced_date: datetime.date | None = None,
+    skip_if_file_name_matches_naming_format: bool = False,
+    context: ConfigContext | None = None,
+    lock_timeout: float | None = 60.0,
+) -> None:
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError("No such file: {}".format(file_path))
+
+    file_name_prefix, _ = get_file_name_prefix_and_extension(
+        file_name_or_path=file_path
+    )
+    if (
+        skip_if_file_name_matches_naming_format
+        and file_name_matches_file_format(
+            file_name_formatter=FileNameFormatter,
+            file_name=file_name_prefix,
+            naming_format=naming_format,
+            context=context,
+        )
+    ):
+        file_logger.info(
+            "Skip files with matching naming format: %s", file_path
+        )
+        return
+
+    new_file_name = get_renamed_file(
+        file_path=file_path,
+        naming_format=naming_format,
+        forced_offset_time=forced_offset_time,
+        forced_date=forced_date,
+    )
+    rename_to(
+        file_path=file_path,
+        new_file_path=os.path.join(os.path.dirname(file_path), new_file_name),
+        lock_timeout=lock_timeout,
+    )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import dataclasses
+import re
+
+
+@dataclasses.dataclass(frozen=True)
+class _Rule:
+    pattern: re.Pattern
+    # Whether the rule includes paths excluded by earlier rules
+    is_negated: bool
+    is_directory_only: bool
+    # Whether the pattern matches whole relative paths, or names only
+    is_anchored: bool
+
+
+class PathFilter:
+    """Exclude paths under a directory with gitignore-style patterns
+
+    Paths are relative to the directory searched, with "/" as separators.
+    The last pattern matching a path decides whether it is excluded:
+
+    - A pattern starting with "!" includes paths excluded by earlier
+      patterns. However, nothing under an excluded directory is included, as
+      excluded directories are never listed.
+    - A pattern ending with "/" only matches directories.
+    - A pattern containing "/" elsewhere matches paths relative to the
+      directory searched, while other patterns match names at any depth.
+    - "*" matches anything but "/", "?" matches any character but "/",
+      "[...]" matches a range of characters, and "**" matches anything,
+      e.g. "**/cache/" matches "cache" directories at any depth.
+
+    Blank lines and lines starting with "#" are ignored. If
+    `skip_hidden_directories` is True, directories whose names start with "."
+    are excluded as well.
+
+    References:
+    - gitignore. https://git-scm.com/docs/gitignore#_pattern_format
+    """
+
+    def __init__(
+        self,
+        patterns: list[str] | None = None,
+        skip_hidden_directories: bool = False,
+    ) -> None:
+        self.patterns = list(patterns or [])
+        self.skip_hidden_directories = skip_hidden_directories
+        self._rules = [
+            i
+            for i in (_compile(pattern=i) for i in self.patterns)
+            if i is not None
+        ]
+
+    @classmethod
+    def from_config(cls, config: dict) -> PathFilter:
+        return cls(
+            patterns=config.get("exclude_patterns", []),
+            skip_hidden_directories=config.get(
+                "skip_hidden_directories", False
+            ),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return len(self._rules) > 0 or self.skip_hidden_directories
+
+    def is_excluded(self, relative_path: str, is_directory: bool) -> bool:
+        name = relative_path.rpartition("/")[2]
+        if is_directory and self.skip_hidden_directories:
+            if name.startswith("."):
+                return True
+        is_excluded = False
+        for rule in self._rules:
+            if is_excluded != rule.is_negated:
+                # The rule would not change the result
+                continue
+            if rule.is_directory_only and not is_directory:
+                continue
+            if rule.pattern.fullmatch(
+                relative_path if rule.is_anchored else name
+            ):
+                is_excluded = not rule.is_negated
+        return is_excluded
+
+
+def _compile(pattern: str) -> _Rule | None:
+    pattern = pattern.rstrip()
+    if pattern == "" or pattern.startswith("#"):
+        return None
+    is_negated = pattern.startswith("!")
+    if is_negated:
+        pattern = pattern[1:]
+    is_directory_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    is_anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if pattern == "":
+        return None
+    return _Rule(
+        pattern=re.compile(_translate(pattern=pattern)),
+        is_negated=is_negated,
+        is_directory_only=is_directory_only,
+        is_anchored=is_anchored,
+    )
+
+
+def _translate(pattern: str) -> str:
+    regex = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            # Any number of directories, including none
+            regex.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            regex.append("[^/]*")
+        elif c == "?":
+            regex.append("[^/]")
+        elif c == "\\" and i + 1 < len(pattern):
+            regex.append(re.escape(pattern[i + 1]))
+            i += 1
+        elif c == "[":
+            j = pattern.find("]", i + 2)
+            if j == -1:
+                regex.append(re.escape(c))
+            else:
+                characters = pattern[i + 1 : j].replace("\\", "\\\\")
+                if characters.startswith("!"):
+                    characters = "^" + characters[1:]
+                regex.append("[{}]".format(characters))
+                i = j
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    return "".join(regex)
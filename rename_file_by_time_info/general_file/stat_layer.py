@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import collections
+import ctypes
+import dataclasses
+import logging
+import os
+import stat as stat_module
+import sys
+import threading
+
+logger = logging.getLogger()
+# Reference: linux/fcntl.h and linux/stat.h
+_AT_FDCWD = -100
+_AT_STATX_DONT_SYNC = 0x4000
+_STATX_TYPE = 0x1
+_STATX_MODE = 0x2
+_STATX_MTIME = 0x40
+_STATX_INO = 0x100
+_STATX_SIZE = 0x200
+# Fields of os.stat_result used by this package. The device is always
+# returned.
+_STATX_MASK = (
+    _STATX_TYPE | _STATX_MODE | _STATX_MTIME | _STATX_INO | _STATX_SIZE
+)
+
+
+class _StatxTimestamp(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec", ctypes.c_int64),
+        ("tv_nsec", ctypes.c_uint32),
+        ("__reserved", ctypes.c_int32),
+    ]
+
+
+class _Statx(ctypes.Structure):
+    _fields_ = [
+        ("stx_mask", ctypes.c_uint32),
+        ("stx_blksize", ctypes.c_uint32),
+        ("stx_attributes", ctypes.c_uint64),
+        ("stx_nlink", ctypes.c_uint32),
+        ("stx_uid", ctypes.c_uint32),
+        ("stx_gid", ctypes.c_uint32),
+        ("stx_mode", ctypes.c_uint16),
+        ("__spare0", ctypes.c_uint16),
+        ("stx_ino", ctypes.c_uint64),
+        ("stx_size", ctypes.c_uint64),
+        ("stx_blocks", ctypes.c_uint64),
+        ("stx_attributes_mask", ctypes.c_uint64),
+        ("stx_atime", _StatxTimestamp),
+        ("stx_btime", _StatxTimestamp),
+        ("stx_ctime", _StatxTimestamp),
+        ("stx_mtime", _StatxTimestamp),
+        ("stx_rdev_major", ctypes.c_uint32),
+        ("stx_rdev_minor", ctypes.c_uint32),
+        ("stx_dev_major", ctypes.c_uint32),
+        ("stx_dev_minor", ctypes.c_uint32),
+        ("__spare2", ctypes.c_uint64 * 14),
+    ]
+
+
+@dataclasses.dataclass
+class StatStatistics:
+    # Statuses fetched from file systems, which may be round trips to the
+    # servers of network file systems
+    fetches: int = 0
+    cache_hits: int = 0
+    invalidations: int = 0
+
+
+class StatLayer:
+    """Statuses of files, fetched once per run
+
+    A layer is owned by a session and passed to the functions and classes
+    which read statuses, so that sessions running side by side neither share
+    nor clear each other's statuses. Successful statuses are cached by path
+    until `clear()` is called at the start of every run, or until the path, or a file in the directory, is
+    renamed or removed by this package (see `invalidate()`). Paths which are
+    not found are not cached, so that new names are always probed. The least
+    recently used entries are dropped once `cache_size` is reached.
+
+    If `use_statx` is True and Linux statx(2) is available (glibc 2.28+),
+    statuses are fetched with AT_STATX_DONT_SYNC and only the type, mode,
+    inode, size and modified time of files, so that a network file system
+    may answer from its attribute cache instead of asking the server. The
+    other fields of these statuses are 0.
+
+    References:
+    - statx(2). https://man7.org/linux/man-pages/man2/statx.2.html
+    """
+
+    def __init__(
+        self, use_statx: bool = False, cache_size: int = 100000
+    ) -> None:
+        self.statistics = StatStatistics()
+        self._entries: collections.OrderedDict[str, os.stat_result] = (
+            collections.OrderedDict()
+        )
+        self._statx = None
+        self._lock = threading.Lock()
+        self.configure(use_statx=use_statx, cache_size=cache_size)
+
+    def configure(self, use_statx: bool, cache_size: int) -> None:
+        self.cache_size = cache_size
+        self._statx = None
+        if use_statx:
+            self._statx = _load_statx()
+            if self._statx is None:
+                logger.warning("statx is not available, using stat instead")
+        self.clear()
+
+    @property
+    def uses_statx(self) -> bool:
+        return self._statx is not None
+
+    def stat(self, path: str, use_cache: bool = True) -> os.stat_result:
+        """Get the status of a path, following symbolic links like
+        os.stat()
+
+        If `use_cache` is False, the status is fetched again, e.g. for
+        directories which other programs may have changed.
+        """
+        key = os.path.normpath(path)
+        with self._lock:
+            file_status = self._entries.get(key, None) if use_cache else None
+            if file_status is not None:
+                self._entries.move_to_end(key)
+                self.statistics.cache_hits += 1
+                return file_status
+            self.statistics.fetches += 1
+        file_status = (
+            os.stat(path)
+            if self._statx is None
+            else self._stat_with_statx(path=path)
+        )
+        self._put(key=key, file_status=file_status)
+        return file_status
+
+    def is_file(self, path: str) -> bool:
+        try:
+            return stat_module.S_ISREG(self.stat(path=path).st_mode)
+        except (OSError, ValueError):
+            return False
+
+    def record(self, path: str, file_status: os.stat_result) -> None:
+        """Cache a status fetched otherwise, e.g. by os.fstat()"""
+        with self._lock:
+            self.statistics.fetches += 1
+        self._put(key=os.path.normpath(path), file_status=file_status)
+
+    def invalidate(self, *paths: str) -> None:
+        """Drop the statuses of paths renamed, created or removed, and of
+        their directories, whose modified times change
+        """
+        with self._lock:
+            for path in paths:
+                key = os.path.normpath(path)
+                for i in (key, os.path.dirname(key) or "."):
+                    if self._entries.pop(i, None) is not None:
+                        self.statistics.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_summary_lines(self, files_count: int) -> list[str]:
+        statistics = self.statistics
+        if statistics.fetches == 0:
+            return []
+        return [
+            "File statuses ({}): {} fetch(es), {:.2f} per file, {} cache "
+            "hit(s), {} invalidation(s)".format(
+                "statx" if self.uses_statx else "stat",
+                statistics.fetches,
+                statistics.fetches / max(files_count, 1),
+                statistics.cache_hits,
+                statistics.invalidations,
+            )
+        ]
+
+    def _put(self, key: str, file_status: os.stat_result) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = file_status
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_size:
+                self._entries.popitem(last=False)
+
+    def _stat_with_statx(self, path: str) -> os.stat_result:
+        buffer = _Statx()
+        if (
+            self._statx(
+                _AT_FDCWD,
+                os.fsencode(path),
+                _AT_STATX_DONT_SYNC,
+                _STATX_MASK,
+                ctypes.byref(buffer),
+            )
+            != 0
+        ):
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number), path)
+        if buffer.stx_mask & _STATX_MASK != _STATX_MASK:
+            # Some of the fields are not supported by the file system
+            return os.stat(path)
+        mtime = buffer.stx_mtime
+        return os.stat_result(
+            (
+                buffer.stx_mode,
+                buffer.stx_ino,
+                os.makedev(buffer.stx_dev_major, buffer.stx_dev_minor),
+                0,
+                0,
+                0,
+                buffer.stx_size,
+                0,
+                mtime.tv_sec,
+                0,
+            ),
+            {
+                "st_mtime": mtime.tv_sec + mtime.tv_nsec / 1e9,
+                "st_mtime_ns": mtime.tv_sec * 1000000000 + mtime.tv_nsec,
+            },
+        )
+
+
+def _load_statx():
+    if sys.platform != "linux":
+        return None
+    try:
+        statx = ctypes.CDLL(None, use_errno=True).statx
+    except (AttributeError, OSError):
+        return None
+    statx.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_uint,
+        ctypes.POINTER(_Statx),
+    ]
+    statx.restype = ctypes.c_int
+    return statx
+
@@ -1,3 +1,11 @@
+from .audit_log import AuditLog
+from .extractor_chain import Extractor, ExtractorChain, ExtractorLimits
+from .file_group import FileGroup, FileGrouper
+from .file_type import FileType, FileTypeStatistics
 from .media_file_info import MediaFileInfo
 from .media_file_name_formatter import MediaFileNameFormatter
-from . import helper
+from .metadata_cache import MetadataCache
+from .metadata_index import MetadataIndex
+from .quarantine import Quarantine
+from .xattr_cache import XattrCache
+from . import bounded_read, file_type, helper
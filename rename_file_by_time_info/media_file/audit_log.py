@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger()
+
+
+class AuditLog:
+    """Files whose names agreed with their metadata in the last audit
+
+    A file is recorded with its size and modified time once the timestamp in
+    its name is verified, and is not checked again by later audits until
+    either of them changes. Files are kept by directory, so that the log of
+    an archive of millions of files stays small. The log is only valid for
+    audits with the same `fingerprint`, e.g. a hash of the configuration and
+    the options.
+    """
+
+    VERSION = 1
+
+    def __init__(self, fingerprint: str) -> None:
+        self.fingerprint = fingerprint
+        # Sizes and modified times of files, by names of files by directories
+        self._entries: dict[str, dict[str, tuple[int, int]]] = {}
+        # Files verified in this audit, or skipped as unchanged
+        self._verified_entries: dict[str, dict[str, tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str) -> AuditLog:
+        """Load a log, or get an empty one if it cannot be used"""
+        audit_log = cls(fingerprint=fingerprint)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return audit_log
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load audit log: %s", e)
+            return audit_log
+        if (
+            data.get("version", None) != cls.VERSION
+            or data.get("fingerprint", None) != fingerprint
+        ):
+            logger.info(
+                "Audit log ignored, as configuration or options have changed"
+            )
+            return audit_log
+        audit_log._entries = {
+            directory: {k: tuple(v) for k, v in files.items()}
+            for directory, files in data["directories"].items()
+        }
+        return audit_log
+
+    def save(self, path: str) -> None:
+        """Save the files verified in this audit
+
+        Files not visited in this audit, e.g. those removed, are not kept.
+        """
+        temporary_path = "{}.tmp".format(path)
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": type(self).VERSION,
+                    "fingerprint": self.fingerprint,
+                    "directories": self._verified_entries,
+                },
+                f,
+            )
+        os.replace(temporary_path, path)
+
+    def is_verified(self, file_path: str, file_status: os.stat_result) -> bool:
+        """Get whether a file is unchanged since it was verified, in which
+        case it is kept in the log
+        """
+        directory, file_name = os.path.split(os.path.abspath(file_path))
+        entry = self._entries.get(directory, {}).get(file_name, None)
+        if entry != (file_status.st_size, file_status.st_mtime_ns):
+            return False
+        with self._lock:
+            self._verified_entries.setdefault(directory, {})[file_name] = entry
+        return True
+
+    def add(self, file_path: str, file_status: os.stat_result) -> None:
+        directory, file_name = os.path.split(os.path.abspath(file_path))
+        with self._lock:
+            self._verified_entries.setdefault(directory, {})[file_name] = (
+                file_status.st_size,
+                file_status.st_mtime_ns,
+            )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import os
+import tempfile
+import threading
+from typing import Iterator
+
+from rename_file_by_time_info import throttling
+
+
+@dataclasses.dataclass
+class BoundedReadLimits:
+    # Bytes read from the beginning of a file, or None to read whole files
+    head_kibibytes: int | None = None
+    # Bytes read from the end of a file, e.g. for videos with the "moov" atom
+    # at the end
+    tail_kibibytes: int = 0
+    # Directory of the local copies, which defaults to that of the system
+    directory: str | None = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> BoundedReadLimits:
+        return cls(
+            head_kibibytes=config.get("head_kibibytes", None),
+            tail_kibibytes=config.get("tail_kibibytes", 0),
+            directory=config.get("directory", None),
+        )
+
+
+class BoundedReader:
+    """Read the head and the tail of files into local copies for extractors
+
+    Extractors seek around a file for its metadata, which costs a round trip
+    and more data than needed on network file systems. Instead, the head and
+    the tail of a file are read with one large read each, and written to a
+    sparse local file of the same size, at the same offsets, which exiftool
+    and Pillow read instead. Metadata outside of these ranges reads as zeros,
+    so extractors are run on the original file again if they do not find an
+    authentic timestamp in the copy, see `should_read_fully()`.
+
+    If `throttle` is given, the bytes read are waited for.
+    """
+
+    def __init__(
+        self,
+        limits: BoundedReadLimits | None = None,
+        throttle: throttling.Throttle | None = None,
+    ) -> None:
+        self.limits = limits if limits is not None else BoundedReadLimits()
+        self.throttle = throttle
+        self._files_count = 0
+        self._bytes_count = 0
+        self._full_reads_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.limits.head_kibibytes is not None
+
+    @contextlib.contextmanager
+    def read(self, file_path: str, file_size: int) -> Iterator[str]:
+        """Make a local copy of the head and the tail of a file
+
+        Yields the path of the copy, which is removed afterwards.
+        """
+        head_size = self.limits.head_kibibytes * 1024
+        tail_size = min(
+            self.limits.tail_kibibytes * 1024, max(file_size - head_size, 0)
+        )
+        if self.throttle is not None:
+            self.throttle.wait_for_bytes(
+                count=min(head_size + tail_size, file_size)
+            )
+        fd, copy_path = tempfile.mkstemp(
+            suffix=os.path.splitext(file_path)[1], dir=self.limits.directory
+        )
+        try:
+            with open(fd, "wb") as copy, open(file_path, "rb") as f:
+                head = f.read(head_size)
+                copy.write(head)
+                bytes_count = len(head)
+                if tail_size > 0:
+                    f.seek(file_size - tail_size)
+                    tail = f.read(tail_size)
+                    copy.seek(file_size - tail_size)
+                    copy.write(tail)
+                    bytes_count += len(tail)
+                # The gap between the head and the tail is a hole
+                copy.truncate(file_size)
+            with self._lock:
+                self._files_count += 1
+                self._bytes_count += bytes_count
+            yield copy_path
+        finally:
+            os.remove(copy_path)
+
+    def is_complete(self, file_size: int) -> bool:
+        """Get whether copies of files of a size are whole files"""
+        return (
+            file_size
+            <= (self.limits.head_kibibytes + self.limits.tail_kibibytes) * 1024
+        )
+
+    def should_read_fully(self, file_size: int, is_authentic: bool) -> bool:
+        """Get whether an extractor is run on the original file, after it is
+        run on the copy
+        """
+        if is_authentic or self.is_complete(file_size=file_size):
+            return False
+        with self._lock:
+            self._full_reads_count += 1
+        return True
+
+    def get_summary_lines(self) -> list[str]:
+        if self._files_count == 0:
+            return []
+        return [
+            "Bounded reads: {} file(s), {:.1f} KiB read per file, {} full "
+            "read(s) without authentic timestamps".format(
+                self._files_count,
+                self._bytes_count / self._files_count / 1024,
+                self._full_reads_count,
+            )
+        ]
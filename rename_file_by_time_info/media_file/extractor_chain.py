@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import dataclasses
+import enum
+import heapq
+import os
+import threading
+from typing import ClassVar
+
+from .bounded_read import BoundedReader, BoundedReadLimits
+from .quarantine import Quarantine
+from rename_file_by_time_info import external_program, throttling
+
+
+class Extractor(enum.Enum):
+    EXIFTOOL = "exiftool"
+    PILLOW = "pillow"
+    FILE_STATUS = "file_status"
+
+
+@dataclasses.dataclass
+class ExtractorLimits:
+    # Seconds an extractor may take on a file, before it is killed by exiftool
+    # or abandoned by Pillow
+    timeout_seconds: float | None = None
+    # Memory the exiftool process may take
+    memory_limit_megabytes: int | None = None
+    # Images with more pixels are refused by Pillow
+    max_image_pixels: int | None = None
+    # Pillow is not run while this many of its threads abandoned on timeout
+    # are still running
+    max_abandoned_threads: int = 4
+
+
+@dataclasses.dataclass
+class ExtractorStatistics:
+    attempts: int = 0
+    hits: int = 0
+    authentic_hits: int = 0
+    consecutive_misses: int = 0
+    skips: int = 0
+    probes: int = 0
+    failures: int = 0
+
+
+class ExtractorChain:
+    """Ordered extractors to be tried on media files of each type
+
+    Extractors are tried one by one until one of them returns the date and
+    time information of a file. Within a run, the results of each extractor
+    are tracked per directory and file extension. Once an extractor has
+    returned nothing for `skip_after_misses` consecutive files, and has never
+    returned anything, in a directory for an extension, it is skipped for the
+    remaining files of that extension in that directory. Every
+    `probe_interval`-th skipped file is still passed to the extractor, and a
+    single hit stops the extractor from being skipped there again. The last
+    extractor of a file which may find an authentic timestamp, e.g. exiftool
+    for videos, is never skipped (see helper.extract_media_file_info()), so
+    that no file is named by its modified time only because the files before
+    it had no metadata. Once the
+    files of a directory have all been tried, `leave_directory()` folds its
+    results into totals by extensions, and only the
+    `summary_directories_count` directories with the most skipped files are
+    kept for the summary.
+
+    If `exiftool_process` is given, it is used by the exiftool extractor
+    instead of starting a new exiftool process for every file.
+
+    An extractor fails on a file if it exceeds its `limits`, or if exiftool
+    exits unexpectedly. It is tried `retries` more times if it has timed out
+    or exited, and the file is then put into `quarantine`, so that the
+    extractor is skipped for it from then on. Pillow is not tried again on a
+    file it has timed out on, as its thread is still running.
+
+    If `throttle` is given, exiftool waits for it before reading a file.
+    If `bounded_reader` is enabled, extractors read local copies of the heads
+    and the tails of files first.
+    """
+
+    DEFAULT_CHAINS: ClassVar[dict[str, list[Extractor]]] = {
+        "image": [Extractor.EXIFTOOL, Extractor.PILLOW, Extractor.FILE_STATUS],
+        "video_and_audio": [Extractor.EXIFTOOL, Extractor.FILE_STATUS],
+    }
+
+    def __init__(
+        self,
+        chains: dict[str, list[Extractor]] | None = None,
+        chains_by_extension: dict[str, list[Extractor]] | None = None,
+        skip_after_misses: int = 0,
+        probe_interval: int = 0,
+        exiftool_process: (
+            external_program.ExiftoolProcess
+            | external_program.ExiftoolPool
+            | None
+        ) = None,
+        limits: dict[Extractor, ExtractorLimits] | None = None,
+        retries: int = 0,
+        quarantine: Quarantine | None = None,
+        throttle: throttling.Throttle | None = None,
+        bounded_reader: BoundedReader | None = None,
+        summary_directories_count: int = 10,
+    ) -> None:
+        self.chains = dict(type(self).DEFAULT_CHAINS)
+        if chains is not None:
+            self.chains.update(chains)
+        self.chains_by_extension = {
+            k.lower(): v for k, v in (chains_by_extension or {}).items()
+        }
+        self.skip_after_misses = skip_after_misses
+        self.probe_interval = probe_interval
+        self.exiftool_process = exiftool_process
+        self.limits = limits or {}
+        self.retries = retries
+        self.quarantine = (
+            quarantine if quarantine is not None else Quarantine()
+        )
+        self.throttle = throttle
+        self.bounded_reader = (
+            bounded_reader if bounded_reader is not None else BoundedReader()
+        )
+        self.summary_directories_count = summary_directories_count
+        self._disabled_extractors: set[Extractor] = set()
+        # Statistics of the directories being tried
+        self._statistics: dict[
+            tuple[str, str, Extractor], ExtractorStatistics
+        ] = {}
+        # Statistics of the directories left, by extensions
+        self._totals: dict[tuple[str, Extractor], ExtractorStatistics] = {}
+        # (skips, directory, extension, extractor, probes) of the directories
+        # left with the most skipped files, the fewest first
+        self._most_skipped: list[tuple[int, str, str, str, int]] = []
+        self._statistics_lock = threading.Lock()
+        self._abandoned_threads_count = 0
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict,
+        exiftool_process: (
+            external_program.ExiftoolProcess
+            | external_program.ExiftoolPool
+            | None
+        ) = None,
+        throttle: throttling.Throttle | None = None,
+    ) -> ExtractorChain:
+        return cls(
+            chains={
+                k: [Extractor(i) for i in v]
+                for k, v in config.get("chains", {}).items()
+            },
+            chains_by_extension={
+                k: [Extractor(i) for i in v]
+                for k, v in config.get("chains_by_extension", {}).items()
+            },
+            skip_after_misses=config.get("skip_after_misses", 0),
+            probe_interval=config.get("probe_interval", 0),
+            exiftool_process=exiftool_process,
+            limits={
+                Extractor(k): ExtractorLimits(**v)
+                for k, v in config.get("limits", {}).items()
+            },
+            retries=config.get("retries", 0),
+            quarantine=Quarantine(path=config.get("quarantine_file", None)),
+            throttle=throttle,
+            bounded_reader=BoundedReader(
+                limits=BoundedReadLimits.from_config(
+                    config=config.get("bounded_read", {})
+                ),
+                throttle=throttle,
+            ),
+        )
+
+    def disable(self, extractor: Extractor) -> None:
+        if extractor == Extractor.FILE_STATUS:
+            raise ValueError("File status is always available")
+        self._disabled_extractors.add(extractor)
+
+    def get_limits(self, extractor: Extractor) -> ExtractorLimits:
+        return self.limits.get(extractor, ExtractorLimits())
+
+    def get_extractors(
+        self, media_type: str, file_extension: str
+    ) -> list[Extractor]:
+        extractors = [
+            i
+            for i in self.chains_by_extension.get(
+                file_extension.lower(), self.chains[media_type]
+            )
+            if i not in self._disabled_extractors
+        ]
+        # File status is the last resort of every chain
+        if Extractor.FILE_STATUS in extractors:
+            extractors.remove(Extractor.FILE_STATUS)
+        extractors.append(Extractor.FILE_STATUS)
+        return extractors
+
+    @property
+    def abandoned_threads_count(self) -> int:
+        """Get the number of threads abandoned on timeout which are still
+        running"""
+        return self._abandoned_threads_count
+
+    def add_abandoned_thread(self) -> None:
+        with self._statistics_lock:
+            self._abandoned_threads_count += 1
+
+    def remove_abandoned_thread(self) -> None:
+        with self._statistics_lock:
+            self._abandoned_threads_count -= 1
+
+    def should_skip(
+        self, directory: str, file_extension: str, extractor: Extractor
+    ) -> bool:
+        if self.skip_after_misses <= 0 or extractor == Extractor.FILE_STATUS:
+            return False
+        with self._statistics_lock:
+            statistics = self._statistics.get(
+                (directory, file_extension.lower(), extractor), None
+            )
+            if (
+                statistics is None
+                or statistics.hits > 0
+                or statistics.consecutive_misses < self.skip_after_misses
+            ):
+                return False
+            if (
+                self.probe_interval > 0
+                and (statistics.skips + 1) % self.probe_interval == 0
+            ):
+                statistics.probes += 1
+                # Counted so that the next file will not be probed again
+                statistics.skips += 1
+                return False
+            statistics.skips += 1
+            return True
+
+    def record(
+        self,
+        directory: str,
+        file_extension: str,
+        extractor: Extractor,
+        is_hit: bool,
+        is_authentic: bool = False,
+    ) -> None:
+        key = (directory, file_extension.lower(), extractor)
+        with self._statistics_lock:
+            statistics = self._statistics.setdefault(
+                key, ExtractorStatistics()
+            )
+            statistics.attempts += 1
+            if is_hit:
+                statistics.hits += 1
+                statistics.consecutive_misses = 0
+                if is_authentic:
+                    statistics.authentic_hits += 1
+            else:
+                statistics.consecutive_misses += 1
+
+    def record_failure(
+        self,
+        file_path: str,
+        file_status: os.stat_result,
+        file_extension: str,
+        extractor: Extractor,
+        message: str,
+    ) -> None:
+        """Record that an extractor has failed on a file, even if retried"""
+        key = (os.path.dirname(file_path), file_extension.lower(), extractor)
+        with self._statistics_lock:
+            self._statistics.setdefault(
+                key, ExtractorStatistics()
+            ).failures += 1
+        self.quarantine.add(
+            file_path=file_path,
+            file_status=file_status,
+            extractor=extractor.value,
+            message=message,
+        )
+
+    def leave_directory(self, directory: str) -> None:
+        """Fold the results of a directory whose files have all been tried
+        into the totals"""
+        with self._statistics_lock:
+            for key in [i for i in self._statistics if i[0] == directory]:
+                self._fold(
+                    key=key,
+                    statistics=self._statistics.pop(key),
+                    totals=self._totals,
+                    most_skipped=self._most_skipped,
+                )
+
+    def _fold(
+        self,
+        key: tuple[str, str, Extractor],
+        statistics: ExtractorStatistics,
+        totals: dict[tuple[str, Extractor], ExtractorStatistics],
+        most_skipped: list[tuple[int, str, str, str, int]],
+    ) -> None:
+        directory, file_extension, extractor = key
+        total = totals.setdefault(
+            (file_extension, extractor), ExtractorStatistics()
+        )
+        total.attempts += statistics.attempts
+        total.hits += statistics.hits
+        total.authentic_hits += statistics.authentic_hits
+        total.skips += statistics.skips
+        total.probes += statistics.probes
+        total.failures += statistics.failures
+        skips = statistics.skips - statistics.probes
+        if skips <= 0 or self.summary_directories_count <= 0:
+            return
+        item = (
+            skips,
+            directory,
+            file_extension,
+            extractor.value,
+            statistics.probes,
+        )
+        if len(most_skipped) < self.summary_directories_count:
+            heapq.heappush(most_skipped, item)
+        else:
+            heapq.heappushpop(most_skipped, item)
+
+    def get_summary_lines(self) -> list[str]:
+        with self._statistics_lock:
+            # The directories being tried are folded into copies
+            totals = {
+                k: dataclasses.replace(v) for k, v in self._totals.items()
+            }
+            most_skipped = list(self._most_skipped)
+            for key, statistics in self._statistics.items():
+                self._fold(
+                    key=key,
+                    statistics=statistics,
+                    totals=totals,
+                    most_skipped=most_skipped,
+                )
+        extractors_totals: dict[Extractor, ExtractorStatistics] = {}
+        for (_, extractor), statistics in totals.items():
+            total = extractors_totals.setdefault(
+                extractor, ExtractorStatistics()
+            )
+            total.attempts += statistics.attempts
+            total.hits += statistics.hits
+            total.authentic_hits += statistics.authentic_hits
+            total.skips += statistics.skips - statistics.probes
+            total.failures += statistics.failures
+        lines = [
+            "Skipped {} on {} \"{}\" file(s) in {} ({} probe(s))".format(
+                extractor_value, skips, file_extension, directory, probes
+            )
+            for (
+                skips,
+                directory,
+                file_extension,
+                extractor_value,
+                probes,
+            ) in sorted(most_skipped, reverse=True)
+        ]
+        return (
+            [
+                "Extractor {}: {} hit(s) ({} authentic) in {} attempt(s), {} skip(s), {} failure(s)".format(
+                    extractor.value,
+                    total.hits,
+                    total.authentic_hits,
+                    total.attempts,
+                    total.skips,
+                    total.failures,
+                )
+                for extractor, total in sorted(
+                    extractors_totals.items(), key=lambda i: i[0].value
+                )
+            ]
+            + lines
+            + self.quarantine.get_summary_lines()
+            + self.bounded_reader.get_summary_lines()
+        )
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import dataclasses
+import os
+from typing import Iterable, Iterator
+
+from rename_file_by_time_info import general_file
+
+
+@dataclasses.dataclass
+class FileGroup:
+    primary_file_path: str
+    # Files renamed after the primary file, e.g. its ".XMP" sidecar
+    sidecar_files_paths: list[str] = dataclasses.field(default_factory=list)
+
+
+class FileGrouper:
+    """Group files sharing a name prefix in a directory
+
+    Files with extensions in `primary_file_extensions` or
+    `sidecar_file_extensions` are grouped with the other files in the same
+    directory with the same name prefix, e.g. "IMG_0001.HEIC",
+    "IMG_0001.AAE" and "IMG_0001.MOV". The file whose extension comes first
+    in `primary_file_extensions` is the primary file of the group, from which
+    the metadata of the whole group is extracted. Groups without any primary
+    file are not formed.
+    """
+
+    def __init__(
+        self,
+        primary_file_extensions: list[str] | None = None,
+        sidecar_file_extensions: list[str] | None = None,
+    ) -> None:
+        # Priorities of extensions, where a lower value is a higher priority
+        self.primary_file_extensions = {
+            extension.upper(): i
+            for i, extension in reversed(
+                list(enumerate(primary_file_extensions or []))
+            )
+        }
+        self.sidecar_file_extensions = set(
+            i.upper() for i in sidecar_file_extensions or []
+        )
+
+    @classmethod
+    def from_config(cls, config: dict) -> FileGrouper:
+        return cls(
+            primary_file_extensions=config.get("primary_file_extensions", []),
+            sidecar_file_extensions=config.get("sidecar_file_extensions", []),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.primary_file_extensions) > 0
+
+    def group(self, files_paths: Iterable[str]) -> Iterator[FileGroup]:
+        """Group files, which are listed directory by directory
+
+        Files of a directory are held until the next directory is reached,
+        then groups are yielded in the order of their first files.
+        """
+        directory_files_paths: list[str] = []
+        last_directory = None
+        for file_path in files_paths:
+            current_directory = os.path.dirname(file_path)
+            if current_directory != last_directory:
+                yield from self._group_directory(
+                    files_paths=directory_files_paths
+                )
+                directory_files_paths = []
+                last_directory = current_directory
+            directory_files_paths.append(file_path)
+        yield from self._group_directory(files_paths=directory_files_paths)
+
+    def _group_directory(self, files_paths: list[str]) -> Iterator[FileGroup]:
+        if not self.enabled:
+            for file_path in files_paths:
+                yield FileGroup(primary_file_path=file_path)
+            return
+        files_paths_by_prefix: dict[str, list[str]] = {}
+        for file_path in files_paths:
+            file_name = os.path.basename(file_path)
+            if file_name.startswith("."):
+                continue
+            file_name_prefix, file_extension = (
+                general_file.helper.get_file_name_prefix_and_extension(
+                    file_name_or_path=file_name
+                )
+            )
+            file_extension = file_extension.upper()
+            if (
+                file_extension in self.primary_file_extensions
+                or file_extension in self.sidecar_file_extensions
+            ):
+                files_paths_by_prefix.setdefault(file_name_prefix, []).append(
+                    file_path
+                )
+
+        groups: dict[str, FileGroup] = {}
+        for group_files_paths in files_paths_by_prefix.values():
+            if len(group_files_paths) < 2:
+                continue
+            primary_file_path = min(
+                group_files_paths,
+                key=lambda i: self.primary_file_extensions.get(
+                    general_file.helper.get_file_name_prefix_and_extension(
+                        file_name_or_path=i
+                    )[1].upper(),
+                    len(self.primary_file_extensions),
+                ),
+            )
+            _, primary_file_extension = (
+                general_file.helper.get_file_name_prefix_and_extension(
+                    file_name_or_path=primary_file_path
+                )
+            )
+            if primary_file_extension.upper() not in (
+                self.primary_file_extensions
+            ):
+                continue
+            group = FileGroup(
+                primary_file_path=primary_file_path,
+                sidecar_files_paths=[
+                    i for i in group_files_paths if i != primary_file_path
+                ],
+            )
+            for file_path in group_files_paths:
+                groups[file_path] = group
+
+        yielded_primary_files_paths: set[str] = set()
+        for file_path in files_paths:
+            group = groups.get(file_path, None)
+            if group is None:
+                yield FileGroup(primary_file_path=file_path)
+            elif group.primary_file_path not in yielded_primary_files_paths:
+                yielded_primary_files_paths.add(group.primary_file_path)
+                yield group
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import dataclasses
+import os
+import stat
+import threading
+
+from rename_file_by_time_info import general_file
+
+# Number of bytes read from the beginning of a file to detect its type
+HEADER_SIZE = 64
+
+
+@dataclasses.dataclass(frozen=True)
+class FileType:
+    name: str
+    # "image" or "video_and_audio", or None for content which is not media
+    media_type: str | None
+    # In lowercase. Files of other extensions are reported as mismatched.
+    file_extensions: frozenset[str] = frozenset()
+
+
+def _image(name: str, *file_extensions: str) -> FileType:
+    return FileType(
+        name=name,
+        media_type="image",
+        file_extensions=frozenset(file_extensions),
+    )
+
+
+def _video_or_audio(name: str, *file_extensions: str) -> FileType:
+    return FileType(
+        name=name,
+        media_type="video_and_audio",
+        file_extensions=frozenset(file_extensions),
+    )
+
+
+EMPTY = FileType(name="empty", media_type=None)
+TEXT = FileType(name="text", media_type=None)
+
+_JPEG = _image("JPEG", "jpg", "jpeg", "jpe", "jps", "mpo", "thm")
+_TIFF = _image(
+    "TIFF",
+    "tif",
+    "tiff",
+    "dng",
+    "nef",
+    "nrw",
+    "arw",
+    "sr2",
+    "srf",
+    "cr2",
+    "pef",
+    "srw",
+    "erf",
+    "mef",
+    "mos",
+    "iiq",
+    "fff",
+    "3fr",
+    "gpr",
+    "raw",
+    "rwl",
+    "dcp",
+    "exif",
+)
+_QUICKTIME = _video_or_audio(
+    "QuickTime",
+    "mov",
+    "qt",
+    "mqv",
+    "mp4",
+    "m4v",
+    "lrv",
+    "360",
+    "3gp",
+    "3gpp",
+    "3g2",
+    "3gp2",
+    "f4v",
+    "f4p",
+    "m4a",
+    "m4b",
+    "m4p",
+    "f4a",
+    "f4b",
+    "aax",
+)
+_HEIF = _image("HEIF", "heic", "heif", "hif", "avif")
+_CR3 = _image("CR3", "cr3", "crm")
+_MPEG_TS = _video_or_audio("MPEG-TS", "mts", "m2ts", "m2t", "ts")
+# Offsets and leading bytes of types
+_signatures: list[tuple[int, bytes, FileType]] = [
+    (0, b"\xff\xd8\xff", _JPEG),
+    (0, b"II*\x00", _TIFF),
+    (0, b"MM\x00*", _TIFF),
+    (0, b"IIRO", _image("ORF", "orf", "ori")),
+    (0, b"IIRS", _image("ORF", "orf", "ori")),
+    (0, b"IIU\x00", _image("RW2", "rw2", "raw")),
+    (0, b"II\x1a\x00\x00\x00HEAPCCDR", _image("CRW", "crw", "ciff")),
+    (0, b"FUJIFILMCCD-RAW", _image("RAF", "raf")),
+    (0, b"FOVb", _image("X3F", "x3f")),
+    (0, b"\x00MRM", _image("MRW", "mrw")),
+    (0, b"\x89PNG\r\n\x1a\n", _image("PNG", "png", "apng")),
+    (0, b"\x8aMNG\r\n\x1a\n", _image("MNG", "mng")),
+    (0, b"\x8bJNG\r\n\x1a\n", _image("JNG", "jng")),
+    (0, b"GIF87a", _image("GIF", "gif")),
+    (0, b"GIF89a", _image("GIF", "gif")),
+    (0, b"8BPS", _image("PSD", "psd", "psb", "psdt")),
+    (0, b"\xff\x0a", _image("JPEG XL", "jxl")),
+    (0, b"\x00\x00\x00\x0cJXL \r\n\x87\n", _image("JPEG XL", "jxl")),
+    (
+        0,
+        b"\x00\x00\x00\x0cjP  \r\n\x87\n",
+        _image("JPEG 2000", "jp2", "jpf", "jpx", "jpm", "j2k"),
+    ),
+    (0, b"\xff\x4f\xff\x51", _image("JPEG 2000", "j2k", "j2c")),
+    (0, b"II\xbc\x01", _image("JPEG XR", "jxr", "hdp", "wdp")),
+    (
+        0,
+        b"%!PS",
+        _image(
+            "PostScript", "ps", "ps2", "ps3", "eps", "eps2", "eps3", "epsf"
+        ),
+    ),
+    (
+        0,
+        b"\xc5\xd0\xd3\xc6",
+        _image("PostScript", "eps", "eps2", "eps3", "epsf"),
+    ),
+    (0, b"<?xpacket", _image("XMP", "xmp")),
+    (0, b"<x:xmpmeta", _image("XMP", "xmp")),
+    (0, b"\x1aE\xdf\xa3", _video_or_audio("Matroska", "mkv", "mka", "webm")),
+    (0, b"0&\xb2u\x8ef\xcf\x11", _video_or_audio("ASF", "wmv", "wma", "asf")),
+    (
+        0,
+        b"\x00\x00\x01\xba",
+        _video_or_audio("MPEG-PS", "mpg", "mpeg", "vob", "mod", "tod"),
+    ),
+    (0, b"ID3", _video_or_audio("MP3", "mp3")),
+    (0, b"fLaC", _video_or_audio("FLAC", "flac")),
+    (0, b"OggS", _video_or_audio("Ogg", "ogg", "oga", "ogv", "opus")),
+]
+# Major brands of ISO base media files which are images
+_image_brands_to_file_types: dict[bytes, FileType] = {
+    **{
+        i: _HEIF
+        for i in [
+            b"heic",
+            b"heix",
+            b"heim",
+            b"heis",
+            b"mif1",
+            b"msf1",
+            b"avif",
+            b"avis",
+        ]
+    },
+    b"crx ": _CR3,
+}
+# Forms of RIFF files
+_riff_forms_to_file_types: dict[bytes, FileType] = {
+    b"AVI ": _video_or_audio("AVI", "avi"),
+    b"WAVE": _video_or_audio("WAV", "wav"),
+    b"WEBP": _image("WebP", "webp"),
+}
+
+
+class FileTypeStatistics:
+    """Counts of files whose content does not match their extensions"""
+
+    def __init__(self) -> None:
+        # Files planned by their content instead of their extensions
+        self.rerouted_count = 0
+        # Files of other formats of the same media type, e.g. PNG as ".jpg"
+        self.mismatched_count = 0
+        # Empty or non-media files with media extensions
+        self.non_media_count = 0
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        file_type: FileType | None,
+        file_extension: str,
+        media_type: str | None,
+    ) -> None:
+        """Record the type of a file, whose extension implies `media_type`"""
+        if file_type is None:
+            return
+        with self._lock:
+            if file_type.media_type is None:
+                if media_type is not None:
+                    self.non_media_count += 1
+            elif file_type.media_type != media_type:
+                self.rerouted_count += 1
+            elif file_extension.lower() not in file_type.file_extensions:
+                self.mismatched_count += 1
+
+    def get_summary_lines(self) -> list[str]:
+        if (
+            self.rerouted_count == 0
+            and self.mismatched_count == 0
+            and self.non_media_count == 0
+        ):
+            return []
+        return [
+            "File types: {} file(s) planned by their content, {} with "
+            "extensions of other formats, {} empty or not media".format(
+                self.rerouted_count,
+                self.mismatched_count,
+                self.non_media_count,
+            )
+        ]
+
+
+def stat_and_read_header(
+    file_path: str, stat_layer: general_file.StatLayer | None = None
+) -> tuple[os.stat_result, bytes]:
+    """Get the status of a regular file and its first HEADER_SIZE bytes
+
+    FileNotFoundError is raised if the path is not of a regular file. The
+    status is recorded in `stat_layer`, if given.
+    """
+    try:
+        # Opening a FIFO would block without O_NONBLOCK
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0))
+    except (OSError, ValueError):
+        raise FileNotFoundError("No such file: {}".format(file_path)) from None
+    try:
+        file_status = os.fstat(fd)
+        if not stat.S_ISREG(file_status.st_mode):
+            raise FileNotFoundError("No such file: {}".format(file_path))
+        if stat_layer is not None:
+            stat_layer.record(path=file_path, file_status=file_status)
+        return file_status, os.read(fd, HEADER_SIZE)
+    finally:
+        os.close(fd)
+
+
+def detect_file_type(header: bytes) -> FileType | None:
+    """Detect the type of a file from its first bytes
+
+    Returns EMPTY or TEXT for content which is not media, or None if the type
+    is not recognized.
+
+    References:
+    - List of file signatures. https://en.wikipedia.org/wiki/List_of_file_signatures
+    - ISO base media file format. https://en.wikipedia.org/wiki/ISO_base_media_file_format
+    """
+    if len(header) == 0:
+        return EMPTY
+    for offset, magic, file_type in _signatures:
+        if header.startswith(magic, offset):
+            return file_type
+    if header[4:8] == b"ftyp":
+        return _image_brands_to_file_types.get(header[8:12], _QUICKTIME)
+    # QuickTime files which do not start with "ftyp", and with small first
+    # atoms, unlike text
+    if header[:2] == b"\x00\x00" and header[4:8] in (
+        b"moov",
+        b"mdat",
+        b"wide",
+        b"free",
+        b"skip",
+    ):
+        return _QUICKTIME
+    if header[:4] == b"RIFF":
+        return _riff_forms_to_file_types.get(header[8:12], None)
+    # Transport streams, and those with 4-byte timestamps (".mts"), usually
+    # start with a packet of the program association table (PID 0)
+    for offset in (0, 4):
+        if (
+            header[offset : offset + 1] == b"\x47"
+            and header[offset + 1 : offset + 3] == b"\x40\x00"
+        ):
+            return _MPEG_TS
+    if _is_text(header=header):
+        return TEXT
+    return None
+
+
+def _is_text(header: bytes) -> bool:
+    # XML may be XMP, which is media
+    if header.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"<?xml"):
+        return False
+    try:
+        text = header.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The header may end in the middle of a character
+        if e.start < len(header) - 3:
+            return False
+        text = header[: e.start].decode("utf-8")
+    return all(i.isprintable() or i in "\t\r\n" for i in text)
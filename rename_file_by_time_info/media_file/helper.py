@@ -1,91 +1,438 @@
+import concurrent.futures
+import contextlib
 import datetime
+import functools
 import logging
 import os
+import threading
+from typing import Any, Callable, Type
 
+from PIL import Image
+
+from .bounded_read import BoundedReader
+from .extractor_chain import Extractor, ExtractorChain
 from .image_info import ImageInfo
-from .media_file_info import DateAndTimeType
+from .media_file_info import DateAndTimeType, MediaFileInfo
 from .media_file_name_formatter import MediaFileNameFormatter
+from .metadata_cache import MetadataCache
+from .metadata_index import MetadataIndex
 from .video_and_audio_info import VideoAndAudioInfo
-from rename_file_by_time_info import general_file
+from .xattr_cache import XattrCache
+from rename_file_by_time_info import general_file, throttling, tracing
 
 
 logger = logging.getLogger()
+file_logger = logging.getLogger(tracing.FILE_LOGGER_NAME)
 
 
-def get_renamed_image_file(
+_extractors_to_method_names: dict[Extractor, str] = {
+    Extractor.EXIFTOOL: "from_exiftool",
+    Extractor.PILLOW: "from_pil",
+    Extractor.FILE_STATUS: "from_file_status",
+}
+# Failures of extractors, after which the next extractor is tried
+_extraction_errors = (
+    TimeoutError,
+    ChildProcessError,
+    MemoryError,
+    Image.DecompressionBombError,
+)
+# Bytes charged to the throttle for exiftool on a file, which usually reads
+# the metadata near the head of the file rather than the whole file
+_EXIFTOOL_READ_BYTES_COUNT = 256 * 1024
+
+
+class _AbandonedThreadsError(Exception):
+    """Too many threads abandoned on timeout are still running"""
+
+
+_media_types_to_media_file_info_types: dict[str, Type[MediaFileInfo]] = {
+    "image": ImageInfo,
+    "video_and_audio": VideoAndAudioInfo,
+}
+
+
+def extract_media_file_info(
     file_path: str,
-    naming_format: str,
-    forced_offset_time: str | None = None,
-    forced_date: datetime.date | None = None,
-    exif_offset_time: str | None = None,
-    use_exiftool: bool = True,
-) -> str:
-    time_zone = (
-        datetime.timezone.utc
-        if forced_offset_time is None
-        else datetime.timezone(
-            offset=general_file.helper.offset_time_str_to_timedelta(
-                value=forced_offset_time
-            )
+    media_file_info_type: Type[MediaFileInfo],
+    extractors: list[Extractor],
+    extractor_chain: ExtractorChain | None = None,
+    metadata_index: MetadataIndex | None = None,
+    file_status: os.stat_result | None = None,
+) -> tuple[MediaFileInfo, Extractor]:
+    """Extract the info of a media file with the first extractor which
+    finds it
+
+    The output of exiftool is taken from `metadata_index` instead, if it has
+    an up-to-date entry for the file.
+    """
+    if file_status is None:
+        file_status = os.stat(file_path)
+    with contextlib.ExitStack() as exit_stack:
+        return _extract_media_file_info(
+            file_path=file_path,
+            media_file_info_type=media_file_info_type,
+            extractors=extractors,
+            extractor_chain=extractor_chain,
+            metadata_index=metadata_index,
+            file_status=file_status,
+            exit_stack=exit_stack,
         )
-    )
 
-    image_info: ImageInfo | None = None
-    if use_exiftool:
-        image_info = ImageInfo.from_exiftool(file_path=file_path)
-    if image_info is None:
-        image_info = ImageInfo.from_pil(file_path=file_path)
-    if image_info is None:
-        image_info = ImageInfo.from_file_status(file_path=file_path)
-    if exif_offset_time is not None:
-        exif_time_zone = datetime.timezone(
-            offset=general_file.helper.offset_time_str_to_timedelta(
-                value=exif_offset_time
+
+def _extract_media_file_info(
+    file_path: str,
+    media_file_info_type: Type[MediaFileInfo],
+    extractors: list[Extractor],
+    extractor_chain: ExtractorChain | None,
+    metadata_index: MetadataIndex | None,
+    file_status: os.stat_result,
+    exit_stack: contextlib.ExitStack,
+) -> tuple[MediaFileInfo, Extractor]:
+    # Local copy of the head and the tail of the file, made on first use
+    copy_path: str | None = None
+    file_directory = os.path.dirname(file_path)
+    _, file_extension = general_file.helper.get_file_name_prefix_and_extension(
+        file_name_or_path=file_path
+    )
+    quarantined_extractors = (
+        None
+        if extractor_chain is None or len(extractor_chain.quarantine) == 0
+        else extractor_chain.quarantine.get_extractors(file_status=file_status)
+    )
+    # Never skipped, as it is the last one which may find an authentic
+    # timestamp
+    last_authentic_extractor = next(
+        (
+            i
+            for i in reversed(extractors)
+            if i != Extractor.FILE_STATUS
+            and hasattr(media_file_info_type, _extractors_to_method_names[i])
+        ),
+        None,
+    )
+    for extractor in extractors:
+        method_name = _extractors_to_method_names[extractor]
+        if not hasattr(media_file_info_type, method_name):
+            continue
+        if (
+            quarantined_extractors is not None
+            and extractor.value in quarantined_extractors
+        ):
+            file_logger.info(
+                "Skip %s on quarantined file: %s", extractor.value, file_path
+            )
+            continue
+        if (
+            extractor_chain is not None
+            and extractor != last_authentic_extractor
+            and extractor_chain.should_skip(
+                directory=file_directory,
+                file_extension=file_extension,
+                extractor=extractor,
+            )
+        ):
+            continue
+        exif_data = (
+            None
+            if metadata_index is None or extractor != Extractor.EXIFTOOL
+            else metadata_index.get(
+                file_path=file_path, file_status=file_status
             )
         )
-        image_info.date_and_time = image_info.date_and_time.replace(
-            tzinfo=exif_time_zone
-        )
-    if (
-        forced_date is None
-        or image_info.date_and_time_type == DateAndTimeType.AUTHENTIC
+        if (
+            exif_data is None
+            and copy_path is None
+            and extractor != Extractor.FILE_STATUS
+            and extractor_chain is not None
+            and extractor_chain.bounded_reader.enabled
+        ):
+            copy_path = exit_stack.enter_context(
+                extractor_chain.bounded_reader.read(
+                    file_path=file_path, file_size=file_status.st_size
+                )
+            )
+        try:
+            if exif_data is not None:
+                media_file_info = media_file_info_type.from_exiftool_output(
+                    exif_data=exif_data
+                )
+            elif copy_path is not None and extractor != Extractor.FILE_STATUS:
+                media_file_info = _extract_from_copy(
+                    file_path=file_path,
+                    copy_path=copy_path,
+                    media_file_info_type=media_file_info_type,
+                    extractor=extractor,
+                    extractor_chain=extractor_chain,
+                    file_status=file_status,
+                )
+            else:
+                media_file_info = _extract_with_limits(
+                    file_path=file_path,
+                    media_file_info_type=media_file_info_type,
+                    extractor=extractor,
+                    extractor_chain=extractor_chain,
+                    file_status=file_status,
+                )
+        except _AbandonedThreadsError as e:
+            file_logger.info(
+                "Skip %s on %s: %s", extractor.value, file_path, e
+            )
+            continue
+        except _extraction_errors as e:
+            if extractor_chain is None:
+                raise
+            file_logger.warning(
+                "%s failed on %s, and the file is quarantined: %s",
+                extractor.value,
+                file_path,
+                e,
+            )
+            extractor_chain.record_failure(
+                file_path=file_path,
+                file_status=file_status,
+                file_extension=file_extension,
+                extractor=extractor,
+                message=str(e),
+            )
+            continue
+        if extractor_chain is not None:
+            extractor_chain.record(
+                directory=file_directory,
+                file_extension=file_extension,
+                extractor=extractor,
+                is_hit=media_file_info is not None,
+                is_authentic=(
+                    media_file_info is not None
+                    and media_file_info.date_and_time_type
+                    == DateAndTimeType.AUTHENTIC
+                ),
+            )
+        if media_file_info is not None:
+            return media_file_info, extractor
+    return (
+        media_file_info_type.from_file_status(
+            file_path=file_path, file_status=file_status
+        ),
+        Extractor.FILE_STATUS,
+    )
+
+
+def _extract_from_copy(
+    file_path: str,
+    copy_path: str,
+    media_file_info_type: Type[MediaFileInfo],
+    extractor: Extractor,
+    extractor_chain: ExtractorChain,
+    file_status: os.stat_result,
+) -> MediaFileInfo | None:
+    """Call an extractor on the local copy of the head and the tail of a file,
+    and then on the file itself if no authentic timestamp is found
+    """
+    media_file_info = _extract_with_limits(
+        file_path=copy_path,
+        media_file_info_type=media_file_info_type,
+        extractor=extractor,
+        extractor_chain=extractor_chain,
+        file_status=file_status,
+        # Already read
+        read_bytes_count=0,
+    )
+    if not extractor_chain.bounded_reader.should_read_fully(
+        file_size=file_status.st_size,
+        is_authentic=media_file_info is not None
+        and media_file_info.date_and_time_type == DateAndTimeType.AUTHENTIC,
     ):
-        date_and_time = image_info.date_and_time
-        date_and_time_type = image_info.date_and_time_type
-    else:
-        date_and_time = datetime.datetime.combine(
-            date=forced_date, time=datetime.time.min, tzinfo=time_zone
-        )
-        date_and_time_type = DateAndTimeType.CURATED
-    if forced_offset_time is not None:
-        date_and_time = date_and_time.astimezone(tz=time_zone)
-    media_file_name_formatter = MediaFileNameFormatter(
-        year=date_and_time.year,
-        month=date_and_time.month,
-        day=date_and_time.day,
-        hour=date_and_time.hour,
-        minute=date_and_time.minute,
-        second=date_and_time.second,
-        millisecond=date_and_time.microsecond // 1000,
-        timezone=date_and_time.tzinfo,
-        date_and_time_type=date_and_time_type,
-        edit_type=image_info.edit_type,
+        return media_file_info
+    file_logger.info(
+        "Run %s on the whole file, without authentic timestamp in its head "
+        "and tail: %s",
+        extractor.value,
+        file_path,
     )
-    _, file_extension = general_file.helper.get_file_name_prefix_and_extension(
-        file_path
+    return _extract_with_limits(
+        file_path=file_path,
+        media_file_info_type=media_file_info_type,
+        extractor=extractor,
+        extractor_chain=extractor_chain,
+        file_status=file_status,
     )
-    return media_file_name_formatter.get_formatted_filename(
-        naming_format="{}.{}".format(naming_format, file_extension)
+
+
+def _extract_with_limits(
+    file_path: str,
+    media_file_info_type: Type[MediaFileInfo],
+    extractor: Extractor,
+    extractor_chain: ExtractorChain | None,
+    file_status: os.stat_result,
+    read_bytes_count: int | None = None,
+) -> MediaFileInfo | None:
+    """Call an extractor within its limits, retrying it if it has timed out
+
+    exiftool is killed on timeout. Pillow cannot be interrupted, so it is run
+    in a thread, which is abandoned on timeout, and is not retried then.
+    _AbandonedThreadsError is raised instead of starting a thread while
+    `max_abandoned_threads` abandoned threads are still running. `read_bytes_count` is the
+    number of bytes charged to the throttle. The bytes that exiftool reads
+    are not known, so it defaults to an estimate bounded by the head and the
+    tail read by the bounded reader, or by _EXIFTOOL_READ_BYTES_COUNT,
+    instead of the size of the file.
+    """
+    function = functools.partial(
+        getattr(media_file_info_type, _extractors_to_method_names[extractor]),
+        file_path=file_path,
     )
+    if extractor == Extractor.FILE_STATUS:
+        function = functools.partial(function, file_status=file_status)
+    if extractor_chain is None:
+        return function()
+    limits = extractor_chain.get_limits(extractor=extractor)
+    if extractor == Extractor.EXIFTOOL:
+        function = functools.partial(
+            function,
+            exiftool_process=extractor_chain.exiftool_process,
+            timeout=limits.timeout_seconds,
+        )
+        if extractor_chain.throttle is not None:
+            function = functools.partial(
+                _call_throttled,
+                function=function,
+                bytes_count=(
+                    _estimate_exiftool_read_bytes_count(
+                        file_size=file_status.st_size,
+                        bounded_reader=extractor_chain.bounded_reader,
+                    )
+                    if read_bytes_count is None
+                    else read_bytes_count
+                ),
+                throttle=extractor_chain.throttle,
+            )
+    elif limits.timeout_seconds is not None:
+        function = functools.partial(
+            _call_in_thread,
+            function=function,
+            timeout=limits.timeout_seconds,
+            max_abandoned_threads=limits.max_abandoned_threads,
+            extractor_chain=extractor_chain,
+        )
+    for retry in range(extractor_chain.retries + 1):
+        try:
+            return function()
+        except (TimeoutError, ChildProcessError) as e:
+            # Retrying an abandoned thread would only add another one
+            if (
+                retry == extractor_chain.retries
+                or extractor != Extractor.EXIFTOOL
+            ):
+                raise
+            file_logger.info(
+                "Retry %s on %s: %s", extractor.value, file_path, e
+            )
 
 
-def get_renamed_video_or_audio_file(
+def _estimate_exiftool_read_bytes_count(
+    file_size: int, bounded_reader: BoundedReader
+) -> int:
+    if bounded_reader.enabled:
+        return min(
+            file_size,
+            (
+                bounded_reader.limits.head_kibibytes
+                + bounded_reader.limits.tail_kibibytes
+            )
+            * 1024,
+        )
+    return min(file_size, _EXIFTOOL_READ_BYTES_COUNT)
+
+
+def _call_throttled(
+    function: Callable[[], Any],
+    bytes_count: int,
+    throttle: throttling.Throttle,
+) -> Any:
+    with throttle.extractor_process():
+        throttle.wait_for_bytes(count=bytes_count)
+        return function()
+
+
+def _call_in_thread(
+    function: Callable[[], Any],
+    timeout: float,
+    max_abandoned_threads: int,
+    extractor_chain: ExtractorChain,
+) -> Any:
+    if extractor_chain.abandoned_threads_count >= max_abandoned_threads:
+        raise _AbandonedThreadsError(
+            "{} thread(s) abandoned on timeout are still running".format(
+                extractor_chain.abandoned_threads_count
+            )
+        )
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def run() -> None:
+        try:
+            future.set_result(function())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        extractor_chain.add_abandoned_thread()
+        # Called at once if the thread has just finished
+        future.add_done_callback(
+            lambda _: extractor_chain.remove_abandoned_thread()
+        )
+        raise TimeoutError(
+            "Timed out after {} seconds".format(timeout)
+        ) from None
+
+
+def get_media_type(
+    file_extension: str,
+    image_file_extensions: list[str] | set[str],
+    video_and_audio_file_extensions: list[str] | set[str],
+) -> str | None:
+    """Get the media type ("image" or "video_and_audio") of an extension
+
+    Extensions given are expected to be in lowercase.
+    """
+    file_extension_lowercase = file_extension.lower()
+    if file_extension_lowercase in image_file_extensions:
+        return "image"
+    if file_extension_lowercase in video_and_audio_file_extensions:
+        return "video_and_audio"
+    return None
+
+
+def get_renamed_media_file(
     file_path: str,
     naming_format: str,
+    media_type: str,
     forced_offset_time: str | None = None,
     forced_date: datetime.date | None = None,
     exif_offset_time: str | None = None,
-) -> str:
+    use_exiftool: bool = True,
+    extractor_chain: ExtractorChain | None = None,
+    metadata_cache: MetadataCache | None = None,
+    context: general_file.ConfigContext | None = None,
+    metadata_index: MetadataIndex | None = None,
+    file_status: os.stat_result | None = None,
+    extractors: list[Extractor] | None = None,
+    xattr_cache: XattrCache | None = None,
+) -> tuple[str, str]:
+    """Get the new name of a media file, and the source of its timestamp
+
+    The source of the timestamp is either the value of the extractor used, or
+    "forced_date". `file_status` saves a call of os.stat() if the caller has
+    it already. `extractors` overrides those of the extractor chain, e.g. to
+    skip the expensive ones. Metadata is looked up in `metadata_cache`, then
+    in `xattr_cache`, before it is extracted. `use_exiftool` only applies to
+    images, as exiftool is the only extractor of videos and audios.
+    """
+    if context is None:
+        context = general_file.ConfigContext()
     time_zone = (
         datetime.timezone.utc
         if forced_offset_time is None
@@ -96,31 +443,84 @@ def get_renamed_video_or_audio_file(
         )
     )
 
-    video_and_audio_info = VideoAndAudioInfo.from_exiftool(file_path=file_path)
-    if video_and_audio_info is None:
-        video_and_audio_info = VideoAndAudioInfo.from_file_status(
-            file_path=file_path
+    _, file_extension = general_file.helper.get_file_name_prefix_and_extension(
+        file_path
+    )
+    cached_entry: tuple[MediaFileInfo, Extractor] | None = None
+    if file_status is None:
+        file_status = os.stat(file_path)
+    media_file_info_type = _media_types_to_media_file_info_types[media_type]
+    if metadata_cache is not None:
+        cached_entry = metadata_cache.get(
+            file_path=file_path, file_status=file_status
         )
+    if cached_entry is None and xattr_cache is not None:
+        cached_entry = xattr_cache.get(
+            file_path=file_path,
+            file_status=file_status,
+            media_file_info_type=media_file_info_type,
+        )
+        if cached_entry is not None and metadata_cache is not None:
+            metadata_cache.put(
+                file_path=file_path,
+                file_status=file_status,
+                media_file_info=cached_entry[0],
+                extractor=cached_entry[1],
+            )
+    if cached_entry is None:
+        if extractors is None:
+            extractors = (
+                ExtractorChain.DEFAULT_CHAINS[media_type]
+                if extractor_chain is None
+                else extractor_chain.get_extractors(
+                    media_type=media_type, file_extension=file_extension
+                )
+            )
+        if not use_exiftool and media_type == "image":
+            extractors = [i for i in extractors if i != Extractor.EXIFTOOL]
+        media_file_info, extractor = extract_media_file_info(
+            file_path=file_path,
+            media_file_info_type=media_file_info_type,
+            extractors=extractors,
+            extractor_chain=extractor_chain,
+            metadata_index=metadata_index,
+            file_status=file_status,
+        )
+        if metadata_cache is not None:
+            metadata_cache.put(
+                file_path=file_path,
+                file_status=file_status,
+                media_file_info=media_file_info,
+                extractor=extractor,
+            )
+        if xattr_cache is not None:
+            xattr_cache.put(
+                file_path=file_path,
+                file_status=file_status,
+                media_file_info=media_file_info,
+                extractor=extractor,
+            )
+    else:
+        media_file_info, extractor = cached_entry
+    date_and_time = media_file_info.date_and_time
     if exif_offset_time is not None:
         exif_time_zone = datetime.timezone(
             offset=general_file.helper.offset_time_str_to_timedelta(
                 value=exif_offset_time
             )
         )
-        video_and_audio_info.date_and_time = (
-            video_and_audio_info.date_and_time.replace(tzinfo=exif_time_zone)
-        )
+        date_and_time = date_and_time.replace(tzinfo=exif_time_zone)
+    timestamp_source = extractor.value
+    date_and_time_type = media_file_info.date_and_time_type
     if (
-        forced_date is None
-        or video_and_audio_info.date_and_time_type == DateAndTimeType.AUTHENTIC
+        forced_date is not None
+        and media_file_info.date_and_time_type != DateAndTimeType.AUTHENTIC
     ):
-        date_and_time = video_and_audio_info.date_and_time
-        date_and_time_type = video_and_audio_info.date_and_time_type
-    else:
         date_and_time = datetime.datetime.combine(
             date=forced_date, time=datetime.time.min, tzinfo=time_zone
         )
         date_and_time_type = DateAndTimeType.CURATED
+        timestamp_source = "forced_date"
     if forced_offset_time is not None:
         date_and_time = date_and_time.astimezone(tz=time_zone)
     media_file_name_formatter = MediaFileNameFormatter(
@@ -130,17 +530,68 @@ def get_renamed_video_or_audio_file(
         hour=date_and_time.hour,
         minute=date_and_time.minute,
         second=date_and_time.second,
-        millisecond=0,
+        millisecond=(
+            date_and_time.microsecond // 1000 if media_type == "image" else 0
+        ),
         timezone=date_and_time.tzinfo,
         date_and_time_type=date_and_time_type,
-        edit_type=video_and_audio_info.edit_type,
+        edit_type=media_file_info.get_edit_type(
+            editing_softwares_keywords=context.editing_softwares_keywords
+        ),
+        context=context,
     )
-    _, file_extension = general_file.helper.get_file_name_prefix_and_extension(
-        file_path
+    new_file_name = media_file_name_formatter.get_formatted_filename(
+        naming_format=general_file.helper.join_file_name_prefix_and_extension(
+            file_name_prefix=naming_format, file_extension=file_extension
+        )
     )
-    return media_file_name_formatter.get_formatted_filename(
-        naming_format="{}.{}".format(naming_format, file_extension)
+    return new_file_name, timestamp_source
+
+
+def get_renamed_image_file(
+    file_path: str,
+    naming_format: str,
+    forced_offset_time: str | None = None,
+    forced_date: datetime.date | None = None,
+    exif_offset_time: str | None = None,
+    use_exiftool: bool = True,
+    extractor_chain: ExtractorChain | None = None,
+    context: general_file.ConfigContext | None = None,
+) -> str:
+    new_file_name, _ = get_renamed_media_file(
+        file_path=file_path,
+        naming_format=naming_format,
+        media_type="image",
+        forced_offset_time=forced_offset_time,
+        forced_date=forced_date,
+        exif_offset_time=exif_offset_time,
+        use_exiftool=use_exiftool,
+        extractor_chain=extractor_chain,
+        context=context,
     )
+    return new_file_name
+
+
+def get_renamed_video_or_audio_file(
+    file_path: str,
+    naming_format: str,
+    forced_offset_time: str | None = None,
+    forced_date: datetime.date | None = None,
+    exif_offset_time: str | None = None,
+    extractor_chain: ExtractorChain | None = None,
+    context: general_file.ConfigContext | None = None,
+) -> str:
+    new_file_name, _ = get_renamed_media_file(
+        file_path=file_path,
+        naming_format=naming_format,
+        media_type="video_and_audio",
+        forced_offset_time=forced_offset_time,
+        forced_date=forced_date,
+        exif_offset_time=exif_offset_time,
+        extractor_chain=extractor_chain,
+        context=context,
+    )
+    return new_file_name
 
 
 def rename(
@@ -153,6 +604,10 @@ def rename(
     image_file_extensions: list[str] | None = None,
     video_and_audio_file_extensions: list[str] | None = None,
     skip_if_file_name_matches_naming_format: bool = False,
+    extractor_chain: ExtractorChain | None = None,
+    context: general_file.ConfigContext | None = None,
+    xattr_cache: XattrCache | None = None,
+    lock_timeout: float | None = 60.0,
 ) -> None:
     if not os.path.isfile(file_path):
         raise FileNotFoundError(f"No such file: {file_path}")
@@ -177,42 +632,36 @@ def rename(
             file_name_formatter=MediaFileNameFormatter,
             file_name=file_name_prefix,
             naming_format=naming_format,
+            context=context,
         )
     ):
-        logger.info("Skip files with matching naming format: %s", file_path)
-        return
-
-    file_extension_lowercase = file_extension.lower()
-    if file_extension_lowercase in image_file_extensions:
-        new_file_name = get_renamed_image_file(
-            file_path=file_path,
-            naming_format=naming_format,
-            forced_offset_time=forced_offset_time,
-            forced_date=forced_date,
-            exif_offset_time=exif_offset_time,
-            use_exiftool=use_exiftool_on_images,
-        )
-    elif file_extension_lowercase in video_and_audio_file_extensions:
-        new_file_name = get_renamed_video_or_audio_file(
-            file_path=file_path,
-            naming_format=naming_format,
-            forced_offset_time=forced_offset_time,
-            forced_date=forced_date,
-            exif_offset_time=exif_offset_time,
+        file_logger.info(
+            "Skip files with matching naming format: %s", file_path
         )
-    else:
-        logger.info("Not a supported media file: %s", file_name)
         return
-    file_directory = os.path.dirname(file_path)
-    new_file_path = os.path.join(file_directory, new_file_name)
-    if os.path.normpath(file_path) == os.path.normpath(new_file_path):
-        logger.info("File unchanged: %s", file_name)
+
+    media_type = get_media_type(
+        file_extension=file_extension,
+        image_file_extensions=image_file_extensions,
+        video_and_audio_file_extensions=video_and_audio_file_extensions,
+    )
+    if media_type is None:
+        file_logger.info("Not a supported media file: %s", file_name)
         return
-    if os.path.isfile(new_file_path):
-        new_file_path = (
-            general_file.helper.modify_file_path_until_no_duplication_exists(
-                file_path=new_file_path, replaceable_file_path=file_path
-            )
-        )
-    os.rename(file_path, new_file_path)
-    logger.info("%s -> %s", file_name, os.path.basename(new_file_path))
+    new_file_name, _ = get_renamed_media_file(
+        file_path=file_path,
+        naming_format=naming_format,
+        media_type=media_type,
+        forced_offset_time=forced_offset_time,
+        forced_date=forced_date,
+        exif_offset_time=exif_offset_time,
+        use_exiftool=use_exiftool_on_images,
+        extractor_chain=extractor_chain,
+        context=context,
+        xattr_cache=xattr_cache,
+    )
+    general_file.helper.rename_to(
+        file_path=file_path,
+        new_file_path=os.path.join(os.path.dirname(file_path), new_file_name),
+        lock_timeout=lock_timeout,
+    )
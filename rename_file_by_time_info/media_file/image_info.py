@@ -8,16 +8,22 @@ import PIL
 from PIL import Image
 
 from .media_file_info import DateAndTimeType, MediaFileInfo
-from rename_file_by_time_info import general_file
-
-if __debug__:
-    import json
+from rename_file_by_time_info import external_program, general_file, tracing
 
 
 logger = logging.getLogger()
 
 
 class ImageInfo(MediaFileInfo):
+    @staticmethod
+    def set_max_image_pixels(value: int | None) -> None:
+        """Set the number of pixels above which Pillow refuses images
+
+        Pillow raises Image.DecompressionBombError for images with more than
+        twice as many pixels. None disables the check.
+        """
+        Image.MAX_IMAGE_PIXELS = value
+
     @staticmethod
     def _exif_datetime_data_to_datetime_obj(
         naive_date_and_time: str,
@@ -53,10 +59,31 @@ class ImageInfo(MediaFileInfo):
             return None
 
     @classmethod
-    def from_exiftool(cls, file_path: str) -> ImageInfo | None:
-        exif_data = cls.get_exiftool_output(file_path=file_path)
+    def from_exiftool(
+        cls,
+        file_path: str,
+        exiftool_process: (
+            external_program.ExiftoolProcess
+            | external_program.ExiftoolPool
+            | None
+        ) = None,
+        timeout: float | None = None,
+    ) -> ImageInfo | None:
+        return cls.from_exiftool_output(
+            exif_data=cls.get_exiftool_output(
+                file_path=file_path,
+                exiftool_process=exiftool_process,
+                timeout=timeout,
+            )
+        )
+
+    @classmethod
+    def from_exiftool_output(
+        cls, exif_data: dict[str, Any]
+    ) -> ImageInfo | None:
+        """Get the info from the JSON output of exiftool for a file"""
         if __debug__:
-            logger.debug("exif_data: %s", json.dumps(exif_data, indent=2))
+            logger.debug("exif_data: %s", tracing.LazyJson(exif_data))
 
         date_and_time_type = DateAndTimeType.AUTHENTIC
         date_and_time: datetime.datetime | None = None
@@ -117,12 +144,17 @@ class ImageInfo(MediaFileInfo):
 
         exif_data = get_exif_data(file_path=file_path)
         if __debug__:
-            keys_to_remove = [
-                k for k, v in exif_data.items() if isinstance(v, bytes)
-            ]
-            for k in keys_to_remove:
-                del exif_data[k]
-            logger.debug("exif_data: %s", exif_data)
+            # Binary tags are left out of the message
+            logger.debug(
+                "exif_data: %s",
+                tracing.Lazy(
+                    lambda: {
+                        k: v
+                        for k, v in exif_data.items()
+                        if not isinstance(v, bytes)
+                    }
+                ),
+            )
 
         date_and_time_type = DateAndTimeType.AUTHENTIC
         date_and_time: datetime.datetime | None = None
@@ -7,7 +7,7 @@ import json
 import logging
 import os
 import statistics
-from typing import Any, ClassVar
+from typing import Any, Iterable
 
 from rename_file_by_time_info import external_program
 
@@ -31,9 +31,6 @@ class EditType(enum.Enum):
 
 @dataclasses.dataclass
 class MediaFileInfo:
-    editing_softwares_keywords: ClassVar[list[str]] = dataclasses.field(
-        default=[]
-    )
     date_and_time_type: DateAndTimeType
     date_and_time: datetime.datetime
     suspected_editing_software_keywords: list[str] = dataclasses.field(
@@ -50,10 +47,9 @@ class MediaFileInfo:
             str(i).lower() for i in self.suspected_editing_software_keywords
         ]
 
-    @property
-    def is_edited(self) -> bool:
+    def is_edited(self, editing_softwares_keywords: Iterable[str]) -> bool:
         is_edited = False
-        for keyword in type(self).editing_softwares_keywords:
+        for keyword in editing_softwares_keywords:
             keyword_lowercase = keyword.lower()
             for test_sample in self.suspected_editing_software_keywords:
                 if keyword_lowercase in test_sample:
@@ -61,14 +57,25 @@ class MediaFileInfo:
                     break
         return is_edited
 
-    @property
-    def edit_type(self) -> EditType:
-        return EditType.EDITED if self.is_edited else EditType.ORIGINAL
+    def get_edit_type(
+        self, editing_softwares_keywords: Iterable[str]
+    ) -> EditType:
+        return (
+            EditType.EDITED
+            if self.is_edited(
+                editing_softwares_keywords=editing_softwares_keywords
+            )
+            else EditType.ORIGINAL
+        )
 
     @classmethod
-    def from_file_status(cls, file_path: str) -> MediaFileInfo:
+    def from_file_status(
+        cls, file_path: str, file_status: os.stat_result | None = None
+    ) -> MediaFileInfo:
+        if file_status is None:
+            file_status = os.stat(file_path)
         date_and_time = datetime.datetime.fromtimestamp(
-            os.stat(file_path).st_mtime, tz=datetime.timezone.utc
+            file_status.st_mtime, tz=datetime.timezone.utc
         )
         return cls(
             date_and_time_type=DateAndTimeType.BEST,
@@ -76,9 +83,24 @@ class MediaFileInfo:
         )
 
     @staticmethod
-    def get_exiftool_output(file_path: str) -> dict[str, Any]:
-        command = ["exiftool", "-ExtractEmbedded", "-j", file_path]
-        command_output = external_program.helper.execute(command=command)
+    def get_exiftool_output(
+        file_path: str,
+        exiftool_process: (
+            external_program.ExiftoolProcess
+            | external_program.ExiftoolPool
+            | None
+        ) = None,
+        timeout: float | None = None,
+    ) -> dict[str, Any]:
+        arguments = ["-ExtractEmbedded", "-j", file_path]
+        if exiftool_process is None:
+            command_output = external_program.helper.execute(
+                command=["exiftool", *arguments], timeout=timeout
+            )
+        else:
+            command_output = exiftool_process.execute(
+                arguments=arguments, timeout=timeout
+            )
         if command_output is None:
             return {}
         try:
@@ -1,5 +1,5 @@
 import dataclasses
-from typing import ClassVar
+from typing import Any, ClassVar
 
 from . import media_file_info
 from rename_file_by_time_info import general_file
@@ -11,16 +11,18 @@ class MediaFileNameFormatter(general_file.FileNameFormatter):
     FORMAT_CODES: ClassVar[set[str]] = (
         general_file.FileNameFormatter.FORMAT_CODES | ADDITIONAL_FORMAT_CODES
     )
-
-    _date_and_time_type_to_value_mapping: ClassVar[
-        dict[media_file_info.DateAndTimeType, str]
-    ] = {}
-    _edit_type_to_value_mapping: ClassVar[
-        dict[media_file_info.EditType, str]
-    ] = {}
+    _format_codes_to_group_names: ClassVar[dict[str, str]] = {
+        **general_file.FileNameFormatter._format_codes_to_group_names,
+        r"{dtt}": "date_and_time_type",
+        r"{et}": "edit_type",
+    }
 
     date_and_time_type: media_file_info.DateAndTimeType | None
     edit_type: media_file_info.EditType | None
+    # Values of the additional format codes
+    context: general_file.ConfigContext = dataclasses.field(
+        default_factory=general_file.ConfigContext
+    )
 
     def __post_init__(self) -> None:
         super().__post_init__()
@@ -31,25 +33,61 @@ class MediaFileNameFormatter(general_file.FileNameFormatter):
         if isinstance(
             self.date_and_time_type, media_file_info.DateAndTimeType
         ):
-            format_codes_to_values_mapping[r"{dtt}"] = type(
-                self
-            )._date_and_time_type_to_value_mapping[self.date_and_time_type]
+            format_codes_to_values_mapping[r"{dtt}"] = (
+                self.context.get_date_and_time_type_value(
+                    name=self.date_and_time_type.name
+                )
+            )
         if isinstance(self.edit_type, media_file_info.EditType):
-            format_codes_to_values_mapping[r"{et}"] = type(
-                self
-            )._edit_type_to_value_mapping[self.edit_type]
+            format_codes_to_values_mapping[r"{et}"] = (
+                self.context.get_edit_type_value(name=self.edit_type.name)
+            )
         self._format_code_to_value_mapping.update(
             format_codes_to_values_mapping
         )
 
     @classmethod
-    def update_date_and_time_type_to_value_mapping(
-        cls, mapping: dict[media_file_info.DateAndTimeType, str]
-    ) -> None:
-        cls._date_and_time_type_to_value_mapping.update(mapping)
+    def _get_regex_of_format_code(
+        cls, format_code: str, context: general_file.ConfigContext
+    ) -> str:
+        if format_code == r"{dtt}":
+            pairs = context.date_and_time_types_to_values
+        elif format_code == r"{et}":
+            pairs = context.edit_types_to_values
+        else:
+            return super()._get_regex_of_format_code(
+                format_code=format_code, context=context
+            )
+        return "({})".format("|".join(v for _, v in pairs))
 
     @classmethod
-    def update_edit_type_to_value_mapping(
-        cls, mapping: dict[media_file_info.EditType, str]
-    ) -> None:
-        cls._edit_type_to_value_mapping.update(mapping)
+    def _get_fields_of_groups(
+        cls,
+        groups: dict[str, str | None],
+        context: general_file.ConfigContext,
+    ) -> dict[str, Any]:
+        fields = super()._get_fields_of_groups(groups=groups, context=context)
+        fields["date_and_time_type"] = _get_enum_member(
+            enum_type=media_file_info.DateAndTimeType,
+            pairs=context.date_and_time_types_to_values,
+            value=groups.get("date_and_time_type", None),
+        )
+        fields["edit_type"] = _get_enum_member(
+            enum_type=media_file_info.EditType,
+            pairs=context.edit_types_to_values,
+            value=groups.get("edit_type", None),
+        )
+        fields["context"] = context
+        return fields
+
+
+def _get_enum_member(
+    enum_type: Any, pairs: tuple[tuple[str, str], ...], value: str | None
+) -> Any:
+    """Get the member of an enum named by the key of a value in pairs"""
+    if value is None:
+        return None
+    for k, v in pairs:
+        if v == value:
+            return enum_type[k]
+    raise KeyError(value)
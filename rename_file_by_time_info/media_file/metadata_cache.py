@@ -0,0 +1,72 @@
+import collections
+import os
+import threading
+
+from .extractor_chain import Extractor
+from .media_file_info import MediaFileInfo
+
+
+class MetadataCache:
+    """In-memory cache of extracted metadata, shared by calls of a session
+
+    Entries are keyed by file path and are only returned if the size and the
+    modified time of the file are unchanged. The least recently used entries
+    are dropped once `max_size` is reached.
+    """
+
+    def __init__(self, max_size: int = 100000) -> None:
+        self.max_size = max_size
+        self._entries: collections.OrderedDict[
+            str, tuple[int, int, MediaFileInfo, Extractor]
+        ] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, file_path: str, file_status: os.stat_result
+    ) -> tuple[MediaFileInfo, Extractor] | None:
+        with self._lock:
+            entry = self._entries.get(file_path, None)
+            if entry is None:
+                return None
+            size, mtime_ns, media_file_info, extractor = entry
+            if (
+                size != file_status.st_size
+                or mtime_ns != file_status.st_mtime_ns
+            ):
+                del self._entries[file_path]
+                return None
+            self._entries.move_to_end(file_path)
+            return media_file_info, extractor
+
+    def put(
+        self,
+        file_path: str,
+        file_status: os.stat_result,
+        media_file_info: MediaFileInfo,
+        extractor: Extractor,
+    ) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[file_path] = (
+                file_status.st_size,
+                file_status.st_mtime_ns,
+                media_file_info,
+                extractor,
+            )
+            self._entries.move_to_end(file_path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def move(self, file_path: str, new_file_path: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(file_path, None)
+            if entry is not None:
+                self._entries[new_file_path] = entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import Any, Iterator, TextIO
+
+
+logger = logging.getLogger()
+
+
+class MetadataIndex:
+    """Metadata extracted beforehand by exiftool, looked up by file path
+
+    The index is loaded from the output of e.g. `exiftool -j -r DIR`, either
+    a JSON array or JSON lines. The file is parsed as a stream, and only the
+    tags which new names depend on are kept, so large outputs do not have to
+    fit in memory.
+
+    Entries are keyed by their "SourceFile", relative to `base_directory` if
+    it is relative. An entry is only returned if the modified time and the
+    size of the file are unchanged, as recorded by the "FileModifyDate" and
+    "FileSize" tags. Sizes are only compared when they are exact, e.g. in
+    the output of `exiftool -n` or with "-FileSize#".
+    """
+
+    # Tags read by `from_exiftool_output()` of ImageInfo and
+    # VideoAndAudioInfo, and those validating entries
+    TAGS = frozenset(
+        [
+            "DateTimeOriginal",
+            "OffsetTimeOriginal",
+            "SubSecTimeOriginal",
+            "CreateDate",
+            "OffsetTimeDigitized",
+            "SubSecTimeDigitized",
+            "ModifyDate",
+            "OffsetTime",
+            "SubSecTime",
+            "MediaCreateDate",
+            "TrackCreateDate",
+            "MediaModifyDate",
+            "TrackModifyDate",
+            "Software",
+            "ProcessingSoftware",
+            "HistorySoftwareAgent",
+            "CreatorTool",
+            "FileModifyDate",
+            "FileSize",
+        ]
+    )
+
+    def __init__(self, path: str, base_directory: str | None = None) -> None:
+        self.path = path
+        self.base_directory = os.path.abspath(
+            os.getcwd() if base_directory is None else base_directory
+        )
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._hits_count = 0
+        self._stale_count = 0
+        self._misses_count = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, file_path: str, file_status: os.stat_result
+    ) -> dict[str, Any] | None:
+        """Get the exiftool output of a file, if it is still up to date"""
+        entry = self._entries.get(os.path.abspath(file_path), None)
+        if entry is None:
+            with self._lock:
+                self._misses_count += 1
+            return None
+        if not _is_up_to_date(entry=entry, file_status=file_status):
+            logger.debug("Stale metadata in the index: %s", file_path)
+            with self._lock:
+                self._stale_count += 1
+            return None
+        with self._lock:
+            self._hits_count += 1
+        return entry
+
+    def get_summary_lines(self) -> list[str]:
+        return [
+            "Metadata index: {} entries, {} hit(s), {} stale, {} miss(es)".format(
+                len(self._entries),
+                self._hits_count,
+                self._stale_count,
+                self._misses_count,
+            )
+        ]
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for value in _iterate_json_values(f=f):
+                if not isinstance(value, dict) or "SourceFile" not in value:
+                    continue
+                self._entries[
+                    os.path.normpath(
+                        os.path.join(self.base_directory, value["SourceFile"])
+                    )
+                ] = {k: v for k, v in value.items() if k in type(self).TAGS}
+        logger.info(
+            "Loaded metadata of %d file(s) from %s",
+            len(self._entries),
+            self.path,
+        )
+
+
+def _is_up_to_date(entry: dict[str, Any], file_status: os.stat_result) -> bool:
+    try:
+        modified_time = datetime.datetime.strptime(
+            str(entry["FileModifyDate"]), "%Y:%m:%d %H:%M:%S%z"
+        )
+    except (KeyError, ValueError):
+        # Entries which cannot be validated are never used
+        return False
+    if int(modified_time.timestamp()) != int(file_status.st_mtime):
+        return False
+    file_size = _parse_file_size(value=entry.get("FileSize", None))
+    return file_size is None or file_size == file_status.st_size
+
+
+def _parse_file_size(value: Any) -> int | None:
+    """Parse an exact size, e.g. 1234 or "1234 bytes", or return None"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.endswith(" bytes"):
+        try:
+            return int(value[: -len(" bytes")])
+        except ValueError:
+            return None
+    return None
+
+
+def _iterate_json_values(
+    f: TextIO, chunk_size: int = 1024 * 1024
+) -> Iterator[Any]:
+    """Iterate over the values of a JSON array, or of JSON lines
+
+    Values are decoded one by one from chunks of the file, so only the value
+    being decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    is_end_of_file = False
+    while True:
+        # Skip whitespaces and the punctuations of the array
+        while position < len(buffer) and buffer[position] in " \t\r\n[],":
+            position += 1
+        if position == len(buffer):
+            if is_end_of_file:
+                return
+            buffer = f.read(chunk_size)
+            position = 0
+            is_end_of_file = buffer == ""
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if is_end_of_file:
+                raise
+            # The value continues in the next chunk
+            chunk = f.read(chunk_size)
+            is_end_of_file = chunk == ""
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield value
+        position = end
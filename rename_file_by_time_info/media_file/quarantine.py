@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger()
+
+
+class Quarantine:
+    """Files on which extractors have failed, e.g. by timing out
+
+    Extractors which have failed on a file are skipped for it later on. Files
+    are identified by their device, inode, size and modified time, so a file
+    stays quarantined after it is renamed, and is released once it changes.
+
+    If `path` is given, the quarantine is loaded from it, and saved to it
+    whenever a file is added, so that it is shared by later runs.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        # Keys of files, to their paths and extractors with failure messages
+        self._entries: dict[str, dict] = {}
+        self._added_count = 0
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_extractors(
+        self, file_status: os.stat_result
+    ) -> dict[str, str] | None:
+        """Get the extractors which have failed on a file, with messages"""
+        entry = self._entries.get(_get_key(file_status=file_status), None)
+        return None if entry is None else entry["extractors"]
+
+    def add(
+        self,
+        file_path: str,
+        file_status: os.stat_result,
+        extractor: str,
+        message: str,
+    ) -> None:
+        with self._lock:
+            entry = self._entries.setdefault(
+                _get_key(file_status=file_status),
+                {"path": file_path, "extractors": {}},
+            )
+            entry["path"] = file_path
+            entry["extractors"][extractor] = message
+            self._added_count += 1
+            if self.path is not None:
+                self._save()
+
+    def get_summary_lines(self) -> list[str]:
+        if self._added_count == 0:
+            return []
+        return [
+            "Quarantined {} extraction(s) which failed, see {}".format(
+                self._added_count,
+                "the log" if self.path is None else self.path,
+            )
+        ]
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load quarantine: %s", e)
+            return
+        if data.get("version", None) != type(self).VERSION:
+            return
+        self._entries = data["files"]
+
+    def _save(self) -> None:
+        temporary_path = "{}.tmp".format(self.path)
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": type(self).VERSION, "files": self._entries},
+                f,
+                indent=2,
+            )
+        os.replace(temporary_path, self.path)
+
+
+def _get_key(file_status: os.stat_result) -> str:
+    return "{}:{}:{}:{}".format(
+        file_status.st_dev,
+        file_status.st_ino,
+        file_status.st_size,
+        file_status.st_mtime_ns,
+    )
@@ -3,12 +3,10 @@ from __future__ import annotations
 import dataclasses
 import datetime
 import logging
+from typing import Any
 
 from .media_file_info import DateAndTimeType, MediaFileInfo
-from rename_file_by_time_info import general_file
-
-if __debug__:
-    import json
+from rename_file_by_time_info import external_program, general_file, tracing
 
 
 logger = logging.getLogger()
@@ -17,7 +15,30 @@ logger = logging.getLogger()
 @dataclasses.dataclass
 class VideoAndAudioInfo(MediaFileInfo):
     @classmethod
-    def from_exiftool(cls, file_path: str) -> VideoAndAudioInfo | None:
+    def from_exiftool(
+        cls,
+        file_path: str,
+        exiftool_process: (
+            external_program.ExiftoolProcess
+            | external_program.ExiftoolPool
+            | None
+        ) = None,
+        timeout: float | None = None,
+    ) -> VideoAndAudioInfo | None:
+        return cls.from_exiftool_output(
+            exif_data=cls.get_exiftool_output(
+                file_path=file_path,
+                exiftool_process=exiftool_process,
+                timeout=timeout,
+            )
+        )
+
+    @classmethod
+    def from_exiftool_output(
+        cls, exif_data: dict[str, Any]
+    ) -> VideoAndAudioInfo | None:
+        """Get the info from the JSON output of exiftool for a file"""
+
         def _exif_datetime_data_to_datetime_obj(
             naive_date_and_time: str,
             time_zone: datetime.timezone | None = None,
@@ -31,9 +52,8 @@ class VideoAndAudioInfo(MediaFileInfo):
             except ValueError:
                 return None
 
-        exif_data = cls.get_exiftool_output(file_path=file_path)
         if __debug__:
-            logger.debug("exif_data: %s", json.dumps(exif_data, indent=2))
+            logger.debug("exif_data: %s", tracing.LazyJson(exif_data))
 
         offset_time: str | None = None
         for i in ["OffsetTimeOriginal", "OffsetTimeDigitized", "OffsetTime"]:
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import datetime
+import errno
+import json
+import logging
+import os
+import threading
+from typing import Type
+
+from .extractor_chain import Extractor
+from .media_file_info import DateAndTimeType, MediaFileInfo
+
+
+logger = logging.getLogger()
+
+
+class XattrCache:
+    """Cache of extracted metadata in extended attributes of the files
+
+    The metadata is written to the "user.rename_file_by_time_info.metadata"
+    attribute of a file, so it follows the file when it is renamed, or copied
+    with its extended attributes (e.g. `rsync -X`, `cp --preserve=xattr`). An
+    entry is only used if it was written by the same version of the schema,
+    and the size and the modified time (in nanoseconds) of the file are
+    unchanged.
+
+    Timestamps from the file status are not cached, as they are cheap to get
+    and better ones may be extracted later. File systems without extended
+    attributes are skipped after the first failure.
+
+    References:
+    - xattr(7). https://man7.org/linux/man-pages/man7/xattr.7.html
+    """
+
+    NAME = "user.rename_file_by_time_info.metadata"
+    VERSION = 2
+
+    def __init__(self) -> None:
+        self._hits_count = 0
+        self._stale_count = 0
+        self._writes_count = 0
+        # Devices without support of extended attributes
+        self._unsupported_devices: set[int] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available() -> bool:
+        return hasattr(os, "getxattr")
+
+    def get(
+        self,
+        file_path: str,
+        file_status: os.stat_result,
+        media_file_info_type: Type[MediaFileInfo],
+    ) -> tuple[MediaFileInfo, Extractor] | None:
+        if file_status.st_dev in self._unsupported_devices:
+            return None
+        try:
+            value = os.getxattr(file_path, type(self).NAME)
+        except OSError as e:
+            self._handle_error(file_status=file_status, error=e)
+            return None
+        try:
+            entry = json.loads(value)
+            if (
+                entry["version"] != type(self).VERSION
+                or entry["size"] != file_status.st_size
+                or entry["mtime_ns"] != file_status.st_mtime_ns
+            ):
+                raise ValueError("Stale entry")
+            result = (
+                media_file_info_type(
+                    date_and_time_type=DateAndTimeType(
+                        entry["date_and_time_type"]
+                    ),
+                    date_and_time=datetime.datetime.fromisoformat(
+                        entry["date_and_time"]
+                    ),
+                    suspected_editing_software_keywords=entry[
+                        "suspected_editing_software_keywords"
+                    ],
+                ),
+                Extractor(entry["extractor"]),
+            )
+        except (KeyError, TypeError, ValueError, AssertionError):
+            with self._lock:
+                self._stale_count += 1
+            return None
+        with self._lock:
+            self._hits_count += 1
+        return result
+
+    def put(
+        self,
+        file_path: str,
+        file_status: os.stat_result,
+        media_file_info: MediaFileInfo,
+        extractor: Extractor,
+    ) -> None:
+        if (
+            extractor == Extractor.FILE_STATUS
+            or file_status.st_dev in self._unsupported_devices
+        ):
+            return
+        value = json.dumps(
+            {
+                "version": type(self).VERSION,
+                "size": file_status.st_size,
+                "mtime_ns": file_status.st_mtime_ns,
+                "date_and_time": media_file_info.date_and_time.isoformat(),
+                "date_and_time_type": media_file_info.date_and_time_type.value,
+                "suspected_editing_software_keywords": (
+                    media_file_info.suspected_editing_software_keywords
+                ),
+                "extractor": extractor.value,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        try:
+            os.setxattr(file_path, type(self).NAME, value)
+        except OSError as e:
+            self._handle_error(file_status=file_status, error=e)
+            return
+        with self._lock:
+            self._writes_count += 1
+
+    def get_summary_lines(self) -> list[str]:
+        return [
+            "Extended attributes: {} hit(s), {} stale, {} written, {} "
+            "device(s) without support".format(
+                self._hits_count,
+                self._stale_count,
+                self._writes_count,
+                len(self._unsupported_devices),
+            )
+        ]
+
+    def _handle_error(
+        self, file_status: os.stat_result, error: OSError
+    ) -> None:
+        if error.errno == errno.ENODATA:
+            # The file has no entry
+            return
+        if error.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            logger.warning(
+                "Extended attributes are not supported on device %d",
+                file_status.st_dev,
+            )
+            with self._lock:
+                self._unsupported_devices.add(file_status.st_dev)
+            return
+        # E.g. read-only files, or attributes larger than allowed
+        logger.debug("Failed to access extended attributes: %s", error)
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterable
+
+from rename_file_by_time_info import tracing
+
+logger = logging.getLogger()
+
+
+@dataclasses.dataclass
+class ProgressSnapshot:
+    elapsed_seconds: float
+    files_count: int
+    bytes_count: int
+    # Files found by the pre-count so far, and whether it has finished
+    total_files_count: int
+    is_total_final: bool
+    # Rates over the last `window_seconds` of the reporter
+    files_per_second: float
+    bytes_per_second: float
+    # Files per second by the sources of their timestamps, e.g. "exiftool"
+    timestamp_sources_files_per_second: dict[str, float]
+    # Share of the files with timestamps which fell back to the file status
+    file_status_share: float
+    # None until the files are all counted and some are processed
+    eta_seconds: float | None
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+    def format(self) -> str:
+        return (
+            "Progress: {}/{}{} file(s){}, {:.1f} file(s)/s, {:.1f} MiB/s, "
+            "{:.1%} from file status{}, ETA {}".format(
+                self.files_count,
+                self.total_files_count,
+                "" if self.is_total_final else "+",
+                (
+                    " ({:.1%})".format(
+                        self.files_count / self.total_files_count
+                    )
+                    if self.is_total_final and self.total_files_count > 0
+                    else ""
+                ),
+                self.files_per_second,
+                self.bytes_per_second / 1024 / 1024,
+                self.file_status_share,
+                "".join(
+                    ", {} {:.1f}/s".format(k, v)
+                    for k, v in sorted(
+                        self.timestamp_sources_files_per_second.items()
+                    )
+                ),
+                (
+                    "unknown"
+                    if self.eta_seconds is None
+                    else datetime.timedelta(seconds=round(self.eta_seconds))
+                ),
+            )
+        )
+
+
+class ProgressReporter:
+    """Report the throughput and the time left of a run, from a background
+    thread
+
+    Files are counted ahead by another thread, from the numbers of files
+    listed per directory passed to `start()` (see
+    general_file.FileInventory.count_files()), so that files are not
+    stat'ed. `record()` is called by the thread consuming the results, once
+    per file, and only adds to counters, which the reporting thread reads
+    every `interval_seconds` without locks. The progress is logged, emitted
+    as "progress" events (see tracing.emit_event()), and written to
+    `status_file` as a JSON object, which is replaced atomically.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = 10.0,
+        window_seconds: float = 60.0,
+        status_file: str | None = None,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.window_seconds = window_seconds
+        self.status_file = status_file
+        # Written by the consuming thread only
+        self._files_count = 0
+        self._bytes_count = 0
+        self._timestamp_sources_counts: dict[str, int] = {}
+        # Written by the counting thread only
+        self._total_files_count = 0
+        self._is_total_final = False
+        # Read and written by the reporting thread only
+        self._samples: collections.deque[
+            tuple[float, int, int, dict[str, int]]
+        ] = collections.deque()
+        self._start_time = time.monotonic()
+        self._stop_event = threading.Event()
+        self._reporting_thread: threading.Thread | None = None
+
+    def __enter__(self) -> ProgressReporter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self, files_counts: Iterable[int] | None = None) -> None:
+        self._start_time = time.monotonic()
+        self._stop_event.clear()
+        if files_counts is not None:
+            threading.Thread(
+                target=self._count,
+                args=(files_counts,),
+                name="progress-count",
+                daemon=True,
+            ).start()
+        self._reporting_thread = threading.Thread(
+            target=self._run, name="progress-report", daemon=True
+        )
+        self._reporting_thread.start()
+
+    def stop(self) -> None:
+        """Stop the threads, and report the progress a last time"""
+        self._stop_event.set()
+        if self._reporting_thread is None:
+            return
+        self._reporting_thread.join()
+        self._reporting_thread = None
+        self._report()
+
+    def record(
+        self, file_size: int | None, timestamp_source: str | None
+    ) -> None:
+        self._files_count += 1
+        if file_size is not None:
+            self._bytes_count += file_size
+        if timestamp_source is not None:
+            self._timestamp_sources_counts[timestamp_source] = (
+                self._timestamp_sources_counts.get(timestamp_source, 0) + 1
+            )
+
+    def get_snapshot(self) -> ProgressSnapshot:
+        """Get the progress, which is sampled for the rates"""
+        now = time.monotonic()
+        files_count = self._files_count
+        bytes_count = self._bytes_count
+        # Copied at once, as the consuming thread may add sources
+        timestamp_sources_counts = self._timestamp_sources_counts.copy()
+        total_files_count = self._total_files_count
+        is_total_final = self._is_total_final
+
+        if not self._samples:
+            self._samples.append((self._start_time, 0, 0, {}))
+        self._samples.append(
+            (now, files_count, bytes_count, timestamp_sources_counts)
+        )
+        while (
+            len(self._samples) > 2
+            and now - self._samples[1][0] >= self.window_seconds
+        ):
+            self._samples.popleft()
+        (
+            first_time,
+            first_files_count,
+            first_bytes_count,
+            first_timestamp_sources_counts,
+        ) = self._samples[0]
+        seconds = max(now - first_time, 1e-9)
+        files_per_second = (files_count - first_files_count) / seconds
+        timestamps_count = sum(timestamp_sources_counts.values())
+        return ProgressSnapshot(
+            elapsed_seconds=now - self._start_time,
+            files_count=files_count,
+            bytes_count=bytes_count,
+            # Files may be created while the run is going
+            total_files_count=max(total_files_count, files_count),
+            is_total_final=is_total_final,
+            files_per_second=files_per_second,
+            bytes_per_second=(bytes_count - first_bytes_count) / seconds,
+            timestamp_sources_files_per_second={
+                k: (v - first_timestamp_sources_counts.get(k, 0)) / seconds
+                for k, v in timestamp_sources_counts.items()
+            },
+            file_status_share=(
+                timestamp_sources_counts.get("file_status", 0)
+                / timestamps_count
+                if timestamps_count > 0
+                else 0.0
+            ),
+            eta_seconds=(
+                max(total_files_count - files_count, 0) / files_per_second
+                if is_total_final and files_per_second > 0
+                else None
+            ),
+        )
+
+    def _count(self, files_counts: Iterable[int]) -> None:
+        try:
+            for files_count in files_counts:
+                if self._stop_event.is_set():
+                    return
+                self._total_files_count += files_count
+        except OSError as e:
+            logger.debug("Failed to count files: %s", e)
+            return
+        self._is_total_final = True
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(timeout=self.interval_seconds):
+            self._report()
+
+    def _report(self) -> None:
+        snapshot = self.get_snapshot()
+        logger.info(snapshot.format())
+        tracing.emit_event("progress", **snapshot.to_dict())
+        if self.status_file is None:
+            return
+        temporary_path = "{}.tmp".format(self.status_file)
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as f:
+                json.dump({"time": time.time(), **snapshot.to_dict()}, f)
+            os.replace(temporary_path, self.status_file)
+        except OSError as e:
+            logger.warning("Failed to write status file: %s", e)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import heapq
+import threading
+import time
+from typing import Callable, Iterable, Iterator, TypeVar
+
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+@dataclasses.dataclass
+class _Observations:
+    count: int = 0
+    mean_size: float = 0.0
+    mean_seconds: float = 0.0
+    # Sum of squared deviations of sizes, and sum of products of deviations
+    size_m2: float = 0.0
+    comoment: float = 0.0
+
+
+class CostModel:
+    """Estimate the seconds that files take to be planned
+
+    The seconds are modeled per file extension as a linear function of the
+    file size, fitted by least squares to the files observed so far, so that
+    e.g. videos which are read further as they grow cost more, while images
+    of any size cost about the same. Extensions without observations fall
+    back to DEFAULT_SECONDS and DEFAULT_SECONDS_PER_BYTE.
+    """
+
+    DEFAULT_SECONDS = 0.01
+    DEFAULT_SECONDS_PER_BYTE = 1 / (100 * 1024 * 1024)
+
+    def __init__(self) -> None:
+        self._observations: dict[str, _Observations] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, file_extension: str, file_size: int) -> float:
+        with self._lock:
+            observations = self._observations.get(file_extension.lower())
+            if observations is None:
+                return (
+                    type(self).DEFAULT_SECONDS
+                    + file_size * type(self).DEFAULT_SECONDS_PER_BYTE
+                )
+            seconds_per_byte = (
+                max(observations.comoment / observations.size_m2, 0.0)
+                if observations.count > 1 and observations.size_m2 > 0
+                else type(self).DEFAULT_SECONDS_PER_BYTE
+            )
+            return max(
+                observations.mean_seconds
+                + (file_size - observations.mean_size) * seconds_per_byte,
+                0.0,
+            )
+
+    def record(
+        self, file_extension: str, file_size: int, seconds: float
+    ) -> None:
+        # Welford's online algorithm, which is stable for large sizes
+        with self._lock:
+            observations = self._observations.setdefault(
+                file_extension.lower(), _Observations()
+            )
+            observations.count += 1
+            size_deviation = file_size - observations.mean_size
+            observations.mean_size += size_deviation / observations.count
+            observations.mean_seconds += (
+                seconds - observations.mean_seconds
+            ) / observations.count
+            observations.size_m2 += size_deviation * (
+                file_size - observations.mean_size
+            )
+            observations.comoment += size_deviation * (
+                seconds - observations.mean_seconds
+            )
+
+
+@dataclasses.dataclass
+class SchedulerStatistics:
+    items_count: int = 0
+    workers_count: int = 0
+    # Seconds from the start of the first item to the end of the last one,
+    # summed over calls of `map()`
+    makespan_seconds: float = 0.0
+    # Seconds that workers spent without an item within the makespans
+    idle_seconds: float = 0.0
+
+
+class CostScheduler:
+    """Call a function on items in threads, the most expensive items first
+
+    Items are admitted in order into a window of `window_size_per_job` items
+    per job which have not been yielded yet. Whenever a worker is free, it is
+    given the admitted item with the highest estimated cost (longest
+    processing time first), so that large files are started early and cheap
+    ones fill in around them, instead of a few large files at the end leaving
+    all the workers but one idle. Results are yielded in the order of the
+    items anyway.
+
+    If `cost_aware` is False, items are started in order instead, e.g. to
+    compare the makespans of both.
+    """
+
+    def __init__(
+        self, cost_aware: bool = True, window_size_per_job: int = 32
+    ) -> None:
+        self.cost_aware = cost_aware
+        self.window_size_per_job = window_size_per_job
+        self.statistics = SchedulerStatistics()
+        self._lock = threading.Lock()
+
+    def map(
+        self,
+        function: Callable[[_T], _R],
+        items: Iterable[_T],
+        get_cost: Callable[[_T], float],
+        jobs: int,
+    ) -> Iterator[_R]:
+        window_size = max(jobs * self.window_size_per_job, 1)
+        items_iterator = iter(items)
+        # Costs are negated, as heapq pops the smallest entries first
+        pending_items: list[tuple[float, int, _T]] = []
+        running_results: dict[concurrent.futures.Future[_R], int] = {}
+        finished_results: dict[int, concurrent.futures.Future[_R]] = {}
+        admitted_count = 0
+        yielded_count = 0
+        is_exhausted = False
+        # Kept as running values, as the items may be countless
+        run_count = 0
+        first_start_time = float("inf")
+        last_end_time = float("-inf")
+        busy_seconds = 0.0
+
+        def run(item: _T) -> _R:
+            nonlocal run_count, first_start_time, last_end_time, busy_seconds
+            start_time = time.perf_counter()
+            try:
+                return function(item)
+            finally:
+                end_time = time.perf_counter()
+                with self._lock:
+                    run_count += 1
+                    first_start_time = min(first_start_time, start_time)
+                    last_end_time = max(last_end_time, end_time)
+                    busy_seconds += end_time - start_time
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=jobs
+        ) as executor:
+            try:
+                while True:
+                    while (
+                        not is_exhausted
+                        and admitted_count - yielded_count < window_size
+                    ):
+                        try:
+                            item = next(items_iterator)
+                        except StopIteration:
+                            is_exhausted = True
+                            break
+                        heapq.heappush(
+                            pending_items,
+                            (
+                                -get_cost(item) if self.cost_aware else 0.0,
+                                admitted_count,
+                                item,
+                            ),
+                        )
+                        admitted_count += 1
+                    while pending_items and len(running_results) < jobs:
+                        _, index, item = heapq.heappop(pending_items)
+                        running_results[executor.submit(run, item)] = index
+                    if yielded_count in finished_results:
+                        yield finished_results.pop(yielded_count).result()
+                        yielded_count += 1
+                        continue
+                    if not running_results:
+                        break
+                    done, _ = concurrent.futures.wait(
+                        running_results,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        finished_results[running_results.pop(future)] = future
+            finally:
+                for future in running_results:
+                    future.cancel()
+        with self._lock:
+            if run_count > 0:
+                makespan_seconds = last_end_time - first_start_time
+                self.statistics.items_count += run_count
+                self.statistics.workers_count = jobs
+                self.statistics.makespan_seconds += makespan_seconds
+                self.statistics.idle_seconds += max(
+                    jobs * makespan_seconds - busy_seconds, 0.0
+                )
+
+    def get_summary_lines(self) -> list[str]:
+        statistics = self.statistics
+        if statistics.items_count == 0:
+            return []
+        return [
+            "Scheduling ({}): {} item(s) by {} worker(s), {:.3f}s makespan, "
+            "{:.3f}s ({:.1%}) idle".format(
+                "cost-aware" if self.cost_aware else "in order",
+                statistics.items_count,
+                statistics.workers_count,
+                statistics.makespan_seconds,
+                statistics.idle_seconds,
+                statistics.idle_seconds
+                / max(
+                    statistics.workers_count * statistics.makespan_seconds,
+                    1e-9,
+                ),
+            )
+        ]
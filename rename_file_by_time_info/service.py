@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+from typing import Iterator
+
+from .session import RenameOptions, RenameSession
+
+
+logger = logging.getLogger()
+
+
+def _load_config_file(config_file_path: str) -> dict:
+    with open(config_file_path) as f:
+        return json.load(f)
+
+
+def _get_rename_options(options: dict) -> RenameOptions:
+    if not isinstance(options, dict):
+        raise ValueError("\"options\" must be a JSON object")
+    options = dict(options)
+    field_names = set(i.name for i in dataclasses.fields(RenameOptions))
+    unknown_field_names = set(options.keys()) - field_names
+    if len(unknown_field_names) > 0:
+        raise ValueError(
+            "Unknown options: {}".format(
+                ", ".join(sorted(unknown_field_names))
+            )
+        )
+    if options.get("forced_date", None) is not None:
+        options["forced_date"] = datetime.date.fromisoformat(
+            options["forced_date"]
+        )
+    # Errors of a file should not stop the whole request
+    options.setdefault("stop_on_error", False)
+    return RenameOptions(**options)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: _UnixStreamServer
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+                # Closed at once if the client is gone, so that a reload
+                # does not wait for it
+                with contextlib.closing(
+                    self.server.service.handle_request(request=request)
+                ) as responses:
+                    for response in responses:
+                        self._write(response=response)
+            # TypeError is raised by options of wrong types, e.g. "4"
+            except (OSError, TypeError, ValueError) as e:
+                try:
+                    self._write(response={"error": str(e)})
+                except OSError:
+                    return
+
+    def _write(self, response: dict) -> None:
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class _UnixStreamServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: RenameService) -> None:
+        self.service = service
+        super().__init__(socket_path, _RequestHandler)
+
+
+class RenameService:
+    """Serve rename requests over a Unix domain socket
+
+    Each line received is a JSON request, e.g.
+    `{"action": "rename", "mode": "media", "paths": [...], "options": {...}}`,
+    where "action" is either "plan" or "rename", and "options" are fields of
+    RenameOptions. A JSON line is written back for every file as soon as it
+    is processed, followed by `{"done": true, "count": <number of files>}`.
+
+    Requests share a single RenameSession, so the exiftool processes, the
+    metadata cache and the parsed configuration stay warm. At most
+    `max_workers` requests are processed at the same time. On SIGHUP, the
+    configuration file is read again without restarting exiftool, once the
+    requests running have finished. Requests received in the meantime wait
+    for the reload.
+    """
+
+    ACTIONS: tuple[str, ...] = ("plan", "rename")
+
+    def __init__(
+        self, config_file_path: str, socket_path: str, max_workers: int = 4
+    ) -> None:
+        self.config_file_path = config_file_path
+        self.socket_path = socket_path
+        self.max_workers = max_workers
+        self.session = RenameSession(
+            config_file=_load_config_file(config_file_path=config_file_path),
+            options=RenameOptions(stop_on_error=False),
+            exiftool_processes=max_workers,
+        )
+        self._semaphore = threading.BoundedSemaphore(max_workers)
+        # Requests running, which a reload waits for
+        self._requests_condition = threading.Condition()
+        self._running_requests_count = 0
+        self._is_reloading = False
+        self._server: _UnixStreamServer | None = None
+        self._server_ready = threading.Event()
+
+    def reload(self) -> None:
+        try:
+            config_file = _load_config_file(
+                config_file_path=self.config_file_path
+            )
+        except (OSError, ValueError) as e:
+            logger.error("Failed to reload configuration file: %s", e)
+            return
+        with self._requests_condition:
+            self._requests_condition.wait_for(lambda: not self._is_reloading)
+            # Requests received from now on wait for the reload
+            self._is_reloading = True
+            self._requests_condition.wait_for(
+                lambda: self._running_requests_count == 0
+            )
+        try:
+            self.session.reload(config_file=config_file)
+        finally:
+            with self._requests_condition:
+                self._is_reloading = False
+                self._requests_condition.notify_all()
+        logger.info("Configuration file reloaded: %s", self.config_file_path)
+
+    def handle_request(self, request: dict) -> Iterator[dict]:
+        action = request.get("action", "rename")
+        if action not in type(self).ACTIONS:
+            raise ValueError("Unknown action: {}".format(action))
+        mode = request.get("mode", "media")
+        files_paths = request.get("paths", [])
+        if not isinstance(files_paths, list) or not all(
+            isinstance(i, str) for i in files_paths
+        ):
+            raise ValueError("\"paths\" must be a list of strings")
+        options = _get_rename_options(options=request.get("options", {}))
+
+        with self._semaphore, self._running_request():
+            plan = self.session.plan(
+                files_paths=files_paths, mode=mode, options=options
+            )
+            results = (
+                plan
+                if action == "plan"
+                else self.session.apply(plan=plan, options=options)
+            )
+            count = 0
+            for result in results:
+                count += 1
+                yield result.to_dict()
+        yield {"done": True, "count": count}
+
+    @contextlib.contextmanager
+    def _running_request(self) -> Iterator[None]:
+        with self._requests_condition:
+            self._requests_condition.wait_for(lambda: not self._is_reloading)
+            self._running_requests_count += 1
+        try:
+            yield
+        finally:
+            with self._requests_condition:
+                self._running_requests_count -= 1
+                self._requests_condition.notify_all()
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            # Remove the socket left by a previous instance, if it is not
+            # being listened on
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                try:
+                    s.connect(self.socket_path)
+                except ConnectionRefusedError:
+                    os.remove(self.socket_path)
+                else:
+                    raise OSError(
+                        "Socket is in use: {}".format(self.socket_path)
+                    )
+        if threading.current_thread() is threading.main_thread():
+            # Reloaded by another thread, as it waits for the requests
+            signal.signal(
+                signal.SIGHUP,
+                lambda *_: threading.Thread(
+                    target=self.reload, name="reload", daemon=True
+                ).start(),
+            )
+        self._server = _UnixStreamServer(
+            socket_path=self.socket_path, service=self
+        )
+        os.chmod(self.socket_path, 0o600)
+        logger.info("Listening on %s", self.socket_path)
+        self._server_ready.set()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            os.remove(self.socket_path)
+            self.session.close()
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        return self._server_ready.wait(timeout=timeout)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def request(socket_path: str, request: dict) -> Iterator[dict]:
+    """Send a request to a RenameService and yield the responses"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with s.makefile("rb") as f:
+            for line in f:
+                response = json.loads(line)
+                yield response
+                if "done" in response or "error" in response:
+                    return
@@ -0,0 +1,1461 @@
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import dataclasses
+import datetime
+import enum
+import functools
+import hashlib
+import json
+import logging
+import os
+import stat
+import time
+from typing import Callable, Iterable, Iterator, TypeVar
+
+from rename_file_by_time_info import (
+    external_program,
+    general_file,
+    media_file,
+    scheduling,
+    throttling,
+    tracing,
+)
+
+logger = logging.getLogger()
+file_logger = logging.getLogger(tracing.FILE_LOGGER_NAME)
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+class RenameStatus(enum.Enum):
+    # The new name of the file has been computed but not yet applied
+    PLANNED = "PLANNED"
+    SKIPPED = "SKIPPED"
+    UNCHANGED = "UNCHANGED"
+    RENAMED = "RENAMED"
+    # The file is linked or copied to the target, and left untouched
+    LINKED = "LINKED"
+    FAILED = "FAILED"
+
+
+@dataclasses.dataclass
+class RenameOptions:
+    forced_offset_time: str | None = None
+    forced_date: datetime.date | None = None
+    exif_offset_time: str | None = None
+    skip_files_with_formatted_names: bool = False
+    skip_media_files: bool = False
+    # None to follow "use_exiftool_on_images" in the configuration
+    use_exiftool_on_images: bool | None = None
+    # Raise errors of individual files, instead of reporting them as FAILED
+    stop_on_error: bool = True
+    # Template of the directory that files are moved to, with the format
+    # codes of the naming format, e.g. "/mnt/archive/%Y/%m". A relative path
+    # is relative to the directory of each file.
+    destination: str | None = None
+    # Directory to link files into instead of renaming them, at their paths
+    # relative to `mirror_source`
+    mirror_destination: str | None = None
+    mirror_source: str | None = None
+    # Order in which files of a directory are planned: "lexical", or
+    # "inode" or "extent" to follow their locations on the disk. Results are
+    # yielded in the lexical order anyway.
+    order: str = "lexical"
+
+
+@dataclasses.dataclass
+class RenameResult:
+    source: str
+    status: RenameStatus
+    # The planned path, or the actual path after the file is renamed
+    target: str | None = None
+    # The extractor providing the timestamp, or "forced_date"
+    timestamp_source: str | None = None
+    message: str | None = None
+    # The primary file of the group that the file is renamed with
+    group: str | None = None
+    # Size of the source in bytes, if its status has been read
+    file_size: int | None = None
+    plan_seconds: float = 0.0
+    apply_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        result = dataclasses.asdict(self)
+        result["status"] = self.status.value
+        return result
+
+
+class AuditStatus(enum.Enum):
+    # The timestamp in the name agrees with the metadata
+    VERIFIED = "VERIFIED"
+    # Verified by an earlier audit, and unchanged since
+    UNCHANGED = "UNCHANGED"
+    MISMATCHED = "MISMATCHED"
+    # The name does not match the naming format
+    UNFORMATTED = "UNFORMATTED"
+    SKIPPED = "SKIPPED"
+    FAILED = "FAILED"
+
+
+@dataclasses.dataclass
+class AuditResult:
+    source: str
+    status: AuditStatus
+    # The name given by the metadata, without the directory
+    expected: str | None = None
+    timestamp_source: str | None = None
+    message: str | None = None
+    file_size: int | None = None
+    audit_seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        result = dataclasses.asdict(self)
+        result["status"] = self.status.value
+        return result
+
+
+def apply_config_file(config_file: dict) -> None:
+    """Apply the settings of a configuration file which are process-wide
+
+    Other settings are passed explicitly, see general_file.ConfigContext.
+    """
+    # Checked by Pillow on every image
+    pillow_limits = (
+        config_file.get("extractors", {}).get("limits", {}).get("pillow", {})
+    )
+    if "max_image_pixels" in pillow_limits:
+        media_file.image_info.ImageInfo.set_max_image_pixels(
+            value=pillow_limits["max_image_pixels"]
+        )
+
+
+class RenameSession:
+    """Rename files in-process, with resources kept warm across calls
+
+    `plan()` computes the new names of files lazily and `apply()` renames
+    them, both yielding a RenameResult per file. The exiftool process, the
+    extractor chain and the metadata cache are created once per session and
+    reused by every call. Call `close()`, or use the session as a context
+    manager, to stop the exiftool process.
+
+    `progress_callback` is called with the number of files applied so far,
+    and `event_callback` is called with every result yielded. Sessions may be
+    shared by threads, in which case `exiftool_processes` should be set to the
+    number of threads extracting metadata at the same time. If
+    `metadata_index` is given, exiftool is only run on files without
+    up-to-date entries in it.
+    """
+
+    # In "auto" mode, media files are renamed as in "media" mode, and the
+    # other files as in "general" mode
+    MODES: tuple[str, ...] = ("general", "media", "auto")
+    ORDERS: tuple[str, ...] = ("lexical", "inode", "extent")
+
+    def __init__(
+        self,
+        config_file: dict,
+        options: RenameOptions | None = None,
+        progress_callback: Callable[[int], None] | None = None,
+        event_callback: Callable[[RenameResult], None] | None = None,
+        exiftool_processes: int = 1,
+        metadata_index: media_file.MetadataIndex | None = None,
+    ) -> None:
+        self.options = options if options is not None else RenameOptions()
+        self.progress_callback = progress_callback
+        self.event_callback = event_callback
+        self.exiftool_process = external_program.ExiftoolPool(
+            size=exiftool_processes
+        )
+        self.metadata_cache = media_file.MetadataCache()
+        self.metadata_index = metadata_index
+        self.file_type_statistics = media_file.FileTypeStatistics()
+        self.xattr_cache = media_file.XattrCache()
+        self._applied_files_count = 0
+        self._planned_files_count = 0
+        self.throttle = throttling.Throttle()
+        self.stat_layer = general_file.StatLayer()
+        self.file_mover = general_file.FileMover(
+            throttle=self.throttle, stat_layer=self.stat_layer
+        )
+        self.cost_model = scheduling.CostModel()
+        self.scheduler = scheduling.CostScheduler()
+        self.reload(config_file=config_file)
+
+    def reload(self, config_file: dict) -> None:
+        """Apply another configuration, keeping the warm resources
+
+        The exiftool processes and the metadata cache are kept, while the
+        extractor chain is rebuilt from the new configuration.
+        """
+        apply_config_file(config_file=config_file)
+        self.context = general_file.ConfigContext.from_config(
+            config_file=config_file
+        )
+        supported_file_extensions = config_file["supported_file_extensions"]
+        self._media_and_ignored_file_extensions = set(
+            i.lower()
+            for i in [
+                *supported_file_extensions["exiftool"]["image"],
+                *supported_file_extensions["exiftool"]["video_and_audio"],
+                *supported_file_extensions["pillow"]["image"],
+                *config_file["ignored_file_extensions"],
+            ]
+        )
+        throttle_config = config_file.get("throttle", {})
+        self.throttle.configure(
+            limits=throttling.ThrottleLimits.from_config(
+                config=throttle_config
+            ),
+            control_file=throttle_config.get("control_file", None),
+        )
+        self.extractor_chain = media_file.ExtractorChain.from_config(
+            config=config_file.get("extractors", {}),
+            exiftool_process=self.exiftool_process,
+            throttle=self.throttle,
+        )
+        memory_limit_megabytes = self.extractor_chain.get_limits(
+            extractor=media_file.Extractor.EXIFTOOL
+        ).memory_limit_megabytes
+        self.exiftool_process.configure(
+            memory_limit=(
+                None
+                if memory_limit_megabytes is None
+                else memory_limit_megabytes * 1024 * 1024
+            ),
+            niceness=throttle_config.get("niceness", None),
+            io_priority_class=throttle_config.get("io_priority_class", None),
+        )
+        self.file_grouper = media_file.FileGrouper.from_config(
+            config=config_file.get("sidecars", {})
+        )
+        self.file_mover.lock_timeout = config_file.get("lock_timeout", 60)
+        file_status_config = config_file.get("file_status", {})
+        self.stat_layer.configure(
+            use_statx=file_status_config.get("use_statx", False),
+            cache_size=file_status_config.get("cache_size", 100000),
+        )
+        scheduling_config = config_file.get("scheduling", {})
+        self.scheduler.cost_aware = scheduling_config.get("cost_aware", True)
+        self.scheduler.window_size_per_job = scheduling_config.get(
+            "window_size_per_job", 32
+        )
+        self._use_xattr_cache = config_file.get("xattr_cache", False) is True
+        if self._use_xattr_cache and not media_file.XattrCache.is_available():
+            logger.warning("Extended attributes are not supported")
+            self._use_xattr_cache = False
+        # Media settings of the last value of "use_exiftool_on_images" used
+        self._media_settings: (
+            tuple[bool | None, tuple[bool, set[str], set[str]]] | None
+        ) = None
+        self.config_file = config_file
+
+    def __enter__(self) -> RenameSession:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.exiftool_process.close()
+
+    def plan(
+        self,
+        files_paths: Iterable[str],
+        mode: str,
+        options: RenameOptions | None = None,
+        jobs: int = 1,
+    ) -> Iterator[RenameResult]:
+        """Compute the new names of files
+
+        `options` overrides the options of the session for this call only. In
+        media and auto modes, files grouped with a primary file (see
+        "sidecars" in the configuration) are yielded right after it, with the
+        name of the primary file and their own extensions. Such files have to be applied
+        together, so a plan should not be reordered before being applied.
+
+        If `jobs` is greater than 1, files are planned by that many threads,
+        the most expensive first (see scheduling.CostScheduler), while results
+        are still yielded in order. `options.order` is then not followed.
+        """
+        if mode not in type(self).MODES:
+            raise ValueError("Unknown mode: {}".format(mode))
+        if options is None:
+            options = self.options
+        if options.order not in type(self).ORDERS:
+            raise ValueError("Unknown order: {}".format(options.order))
+        # Statuses are cached for a run only
+        self.stat_layer.clear()
+        file_groups: Iterable[media_file.FileGroup] = (
+            self.file_grouper.group(files_paths=files_paths)
+            if mode != "general" and self.file_grouper.enabled
+            else (
+                media_file.FileGroup(primary_file_path=i) for i in files_paths
+            )
+        )
+        for results in _leave_directories(
+            items=self._plan_groups(
+                file_groups=_log_directories(
+                    items=file_groups,
+                    get_file_path=lambda i: i.primary_file_path,
+                ),
+                mode=mode,
+                options=options,
+                jobs=jobs,
+            ),
+            get_file_path=lambda i: i[0].source,
+            extractor_chain=self.extractor_chain,
+        ):
+            for i in results:
+                self._planned_files_count += 1
+                self._emit(result=i)
+                yield i
+
+    def apply(
+        self,
+        plan: Iterable[RenameResult],
+        options: RenameOptions | None = None,
+        jobs: int = 1,
+    ) -> Iterator[RenameResult]:
+        """Rename files as planned
+
+        Files of a group are renamed together. If `jobs` is greater than 1,
+        files moved to another file system, or linked, are copied by that
+        many threads, so that several large files are copied at the same
+        time, and files of different directories are renamed at the same
+        time. Files of the same directory are still renamed one at a time in
+        the order of the plan, so that the suffixes added to names taken are
+        the same as with one job.
+        """
+        if options is None:
+            options = self.options
+        for results, is_applied in _map_by_directory(
+            function=functools.partial(
+                self._apply_prepared_results, options=options
+            ),
+            items=_map_in_order(
+                function=functools.partial(
+                    self._prepare_results, options=options
+                ),
+                items=_group_results(plan=plan),
+                jobs=jobs,
+                on_abandoned=self._discard_copies,
+            ),
+            get_directories=_get_directories,
+            jobs=jobs,
+            on_abandoned=self._discard_copies,
+        ):
+            for result in results:
+                if is_applied:
+                    self._emit(result=result)
+                self._count_applied()
+                yield result
+
+    def rename(
+        self,
+        files_paths: Iterable[str],
+        mode: str,
+        options: RenameOptions | None = None,
+        jobs: int = 1,
+    ) -> Iterator[RenameResult]:
+        """Plan and apply files
+
+        Files are also planned by `jobs` threads. In general mode, each result
+        is then passed to `event_callback` once, after being applied.
+        """
+        if jobs > 1 and mode == "general":
+            return self._rename_in_parallel(
+                files_paths=files_paths, mode=mode, options=options, jobs=jobs
+            )
+        return self.apply(
+            plan=self.plan(
+                files_paths=files_paths, mode=mode, options=options, jobs=jobs
+            ),
+            options=options,
+            jobs=jobs,
+        )
+
+    def _rename_in_parallel(
+        self,
+        files_paths: Iterable[str],
+        mode: str,
+        options: RenameOptions | None,
+        jobs: int,
+    ) -> Iterator[RenameResult]:
+        if options is None:
+            options = self.options
+        # Statuses are cached for a run only
+        self.stat_layer.clear()
+
+        def plan_file(
+            file_path: str,
+        ) -> tuple[list[RenameResult], list[str] | None]:
+            return self._prepare_results(
+                results=[
+                    self._plan_file(
+                        file_path=file_path, mode=mode, options=options
+                    )
+                ],
+                options=options,
+            )
+
+        # Files of the same directory are renamed in order, see apply()
+        for (result,), _ in _map_by_directory(
+            function=functools.partial(
+                self._apply_prepared_results, options=options
+            ),
+            items=_map_in_order(
+                function=plan_file,
+                items=_log_directories(
+                    items=files_paths, get_file_path=lambda i: i
+                ),
+                jobs=jobs,
+                on_abandoned=self._discard_copies,
+            ),
+            get_directories=_get_directories,
+            jobs=jobs,
+            on_abandoned=self._discard_copies,
+        ):
+            self._planned_files_count += 1
+            self._emit(result=result)
+            self._count_applied()
+            yield result
+
+    def audit(
+        self,
+        files_paths: Iterable[str],
+        options: RenameOptions | None = None,
+        jobs: int = 1,
+        audit_log: media_file.AuditLog | None = None,
+    ) -> Iterator[AuditResult]:
+        """Check that the timestamps in the names of renamed media files
+        agree with their metadata
+
+        Files are not renamed. The names of media files are parsed with the
+        media naming format, and files whose names do not match it are
+        reported as UNFORMATTED. The other files are planned as in media
+        mode, with the caches of the session, and the timestamp of the new
+        name is compared to that of the current name, as instants if both have
+        time zones. Files recorded in `audit_log`, with their sizes and
+        modified times unchanged, are not planned again, and files verified
+        are recorded in it. Files are checked by `jobs` threads, while results
+        are still yielded in order.
+        """
+        if options is None:
+            options = self.options
+        # Names are compared without directories
+        options = dataclasses.replace(
+            options,
+            skip_files_with_formatted_names=False,
+            destination=None,
+            mirror_destination=None,
+        )
+        # Checked once, instead of by every thread at the same time
+        self._get_media_settings(options=options)
+        # Statuses are cached for a run only
+        self.stat_layer.clear()
+        for result in _leave_directories(
+            items=_map_in_order(
+                function=functools.partial(
+                    self._audit_file, options=options, audit_log=audit_log
+                ),
+                items=_log_directories(
+                    items=files_paths, get_file_path=lambda i: i
+                ),
+                jobs=jobs,
+            ),
+            get_file_path=lambda i: i.source,
+            extractor_chain=self.extractor_chain,
+        ):
+            self._planned_files_count += 1
+            if tracing.event_logger.isEnabledFor(logging.INFO):
+                tracing.emit_event("audit", **result.to_dict())
+            yield result
+
+    def _audit_file(
+        self,
+        file_path: str,
+        options: RenameOptions,
+        audit_log: media_file.AuditLog | None,
+    ) -> AuditResult:
+        start_time = time.perf_counter()
+        try:
+            result = self._check_file_name(
+                file_path=file_path, options=options, audit_log=audit_log
+            )
+        except (OSError, ValueError) as e:
+            if options.stop_on_error:
+                raise
+            file_logger.error("Failed to audit %s: %s", file_path, e)
+            result = AuditResult(
+                source=file_path, status=AuditStatus.FAILED, message=str(e)
+            )
+        result.audit_seconds = time.perf_counter() - start_time
+        return result
+
+    def _check_file_name(
+        self,
+        file_path: str,
+        options: RenameOptions,
+        audit_log: media_file.AuditLog | None,
+    ) -> AuditResult:
+        file_name_prefix, file_extension = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=os.path.basename(file_path)
+            )
+        )
+        (
+            _,
+            image_file_extensions,
+            video_and_audio_file_extensions,
+        ) = self._get_media_settings(options=options)
+        if (
+            file_name_prefix.startswith(".")
+            or media_file.helper.get_media_type(
+                file_extension=file_extension,
+                image_file_extensions=image_file_extensions,
+                video_and_audio_file_extensions=video_and_audio_file_extensions,
+            )
+            is None
+        ):
+            return AuditResult(source=file_path, status=AuditStatus.SKIPPED)
+        naming_format = self.config_file["file_naming_format"]["media_file"]
+        file_name_formatter = media_file.MediaFileNameFormatter.parse(
+            file_name=file_name_prefix,
+            naming_format=naming_format,
+            context=self.context,
+        )
+        if file_name_formatter is None:
+            return AuditResult(
+                source=file_path, status=AuditStatus.UNFORMATTED
+            )
+        if audit_log is not None:
+            file_status = _stat_file(
+                file_path=file_path, stat_layer=self.stat_layer
+            )
+            if audit_log.is_verified(
+                file_path=file_path, file_status=file_status
+            ):
+                return AuditResult(
+                    source=file_path,
+                    status=AuditStatus.UNCHANGED,
+                    file_size=file_status.st_size,
+                )
+        result = self._route_file(
+            file_path=file_path, mode="media", options=options
+        )
+        if result.status != RenameStatus.PLANNED:
+            return AuditResult(
+                source=file_path,
+                status=AuditStatus.SKIPPED,
+                message=result.message,
+                file_size=result.file_size,
+            )
+        expected_file_name_prefix, _ = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=os.path.basename(result.target)
+            )
+        )
+        expected_file_name_formatter = media_file.MediaFileNameFormatter.parse(
+            file_name=expected_file_name_prefix,
+            naming_format=naming_format,
+            context=self.context,
+        )
+        date_and_time = file_name_formatter.get_date_and_time()
+        expected_date_and_time = (
+            None
+            if expected_file_name_formatter is None
+            else expected_file_name_formatter.get_date_and_time()
+        )
+        if _is_same_date_and_time(
+            date_and_time=date_and_time,
+            other_date_and_time=expected_date_and_time,
+        ):
+            if audit_log is not None:
+                audit_log.add(
+                    file_path=file_path,
+                    file_status=_stat_file(
+                        file_path=file_path, stat_layer=self.stat_layer
+                    ),
+                )
+            status = AuditStatus.VERIFIED
+            message = None
+        else:
+            file_logger.warning(
+                "Timestamp in the name differs from the metadata: %s (%s)",
+                file_path,
+                os.path.basename(result.target),
+            )
+            status = AuditStatus.MISMATCHED
+            message = "Name has {}, metadata has {}".format(
+                date_and_time, expected_date_and_time
+            )
+        return AuditResult(
+            source=file_path,
+            status=status,
+            expected=os.path.basename(result.target),
+            timestamp_source=result.timestamp_source,
+            message=message,
+            file_size=result.file_size,
+        )
+
+    def _plan_groups(
+        self,
+        file_groups: Iterable[media_file.FileGroup],
+        mode: str,
+        options: RenameOptions,
+        jobs: int = 1,
+    ) -> Iterator[list[RenameResult]]:
+        if jobs > 1:
+            yield from self._plan_groups_by_cost(
+                file_groups=file_groups, mode=mode, options=options, jobs=jobs
+            )
+            return
+        if options.order == "lexical":
+            for file_group in file_groups:
+                yield self._plan_group(
+                    file_group=file_group, mode=mode, options=options
+                )
+            return
+        # Files of a directory are read in the order of their locations, so
+        # that a spinning disk seeks less, and then yielded in order
+        for directory_file_groups in _batch_by_directory(
+            file_groups=file_groups
+        ):
+            locality_keys = [
+                general_file.helper.get_locality_key(
+                    file_path=i.primary_file_path,
+                    use_extents=options.order == "extent",
+                    stat_layer=self.stat_layer,
+                )
+                for i in directory_file_groups
+            ]
+            results: list[list[RenameResult] | None] = [None] * len(
+                directory_file_groups
+            )
+            for i in sorted(
+                range(len(directory_file_groups)),
+                key=locality_keys.__getitem__,
+            ):
+                results[i] = self._plan_group(
+                    file_group=directory_file_groups[i],
+                    mode=mode,
+                    options=options,
+                )
+            yield from results
+
+    def _plan_groups_by_cost(
+        self,
+        file_groups: Iterable[media_file.FileGroup],
+        mode: str,
+        options: RenameOptions,
+        jobs: int,
+    ) -> Iterator[list[RenameResult]]:
+        """Plan groups of files in threads, the most expensive first
+
+        The cost of a group is estimated from the extension and the size of
+        its primary file, by the seconds observed on earlier files.
+        """
+        if mode != "general":
+            # Checked once, instead of by every thread at the same time
+            self._get_media_settings(options=options)
+
+        def plan_group(
+            item: tuple[media_file.FileGroup, str, int],
+        ) -> list[RenameResult]:
+            file_group, file_extension, file_size = item
+            results = self._plan_group(
+                file_group=file_group, mode=mode, options=options
+            )
+            if results[0].status != RenameStatus.FAILED:
+                self.cost_model.record(
+                    file_extension=file_extension,
+                    file_size=file_size,
+                    seconds=results[0].plan_seconds,
+                )
+            return results
+
+        yield from self.scheduler.map(
+            function=plan_group,
+            items=(
+                (
+                    i,
+                    general_file.helper.get_file_name_prefix_and_extension(
+                        file_name_or_path=i.primary_file_path
+                    )[1],
+                    _get_file_size(
+                        file_path=i.primary_file_path,
+                        stat_layer=self.stat_layer,
+                    ),
+                )
+                for i in file_groups
+            ),
+            get_cost=lambda i: self.cost_model.estimate(
+                file_extension=i[1], file_size=i[2]
+            ),
+            jobs=jobs,
+        )
+
+    def _plan_group(
+        self,
+        file_group: media_file.FileGroup,
+        mode: str,
+        options: RenameOptions,
+    ) -> list[RenameResult]:
+        file_path = file_group.primary_file_path
+        result = self._plan_file(
+            file_path=file_path, mode=mode, options=options
+        )
+        sidecar_results = [
+            self._plan_sidecar_file(file_path=i, primary_result=result)
+            for i in file_group.sidecar_files_paths
+        ]
+        if result.status == RenameStatus.PLANNED and sidecar_results:
+            result.group = file_path
+        return [result, *sidecar_results]
+
+    def _plan_file(
+        self, file_path: str, mode: str, options: RenameOptions
+    ) -> RenameResult:
+        self.throttle.wait_for_files(stage="plan")
+        start_time = time.perf_counter()
+        try:
+            result = self._route_file(
+                file_path=file_path, mode=mode, options=options
+            )
+        except (OSError, ValueError) as e:
+            if options.stop_on_error:
+                raise
+            file_logger.error("Failed to process %s: %s", file_path, e)
+            result = RenameResult(
+                source=file_path, status=RenameStatus.FAILED, message=str(e)
+            )
+        result.plan_seconds = time.perf_counter() - start_time
+        return result
+
+    def _route_file(
+        self, file_path: str, mode: str, options: RenameOptions
+    ) -> RenameResult:
+        """Plan a file in the mode which it belongs to
+
+        Hidden files are skipped in every mode. In media and auto modes, files
+        of the other media extensions (e.g. of exiftool when it is not
+        installed) and of the ignored extensions are skipped. The first bytes
+        of the other files are read with their status, and files are planned
+        as the media type of their content, or of their extensions if the
+        content is not recognized. Expensive extractors are skipped on empty
+        or text content. In auto mode, files which are not media are planned
+        as general files.
+        """
+        if os.path.basename(file_path).startswith("."):
+            return self._skip(file_path=file_path, message="Skip hidden file")
+        if mode == "general":
+            return self._plan_general_file(
+                file_path=file_path, options=options
+            )
+        _, file_extension = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=file_path
+            )
+        )
+        (
+            _,
+            image_file_extensions,
+            video_and_audio_file_extensions,
+        ) = self._get_media_settings(options=options)
+        media_type = media_file.helper.get_media_type(
+            file_extension=file_extension,
+            image_file_extensions=image_file_extensions,
+            video_and_audio_file_extensions=video_and_audio_file_extensions,
+        )
+        if (
+            media_type is None
+            and file_extension.lower()
+            in self._media_and_ignored_file_extensions
+        ):
+            return self._skip_unsupported_file(file_path=file_path, mode=mode)
+
+        file_status, header = media_file.file_type.stat_and_read_header(
+            file_path=file_path, stat_layer=self.stat_layer
+        )
+        file_type = media_file.file_type.detect_file_type(header=header)
+        self.file_type_statistics.record(
+            file_type=file_type,
+            file_extension=file_extension,
+            media_type=media_type,
+        )
+        # Unrecognized content is planned by the extension
+        content_media_type = (
+            None if file_type is None else file_type.media_type
+        )
+        extractors: list[media_file.Extractor] | None = None
+        if (
+            file_type is not None
+            and content_media_type is None
+            and media_type is not None
+        ):
+            file_logger.warning(
+                "Skip extractors on %s content: %s", file_type.name, file_path
+            )
+            extractors = [media_file.Extractor.FILE_STATUS]
+        elif (
+            content_media_type is not None
+            and content_media_type != media_type
+            # Media types without any extension in use are not supported
+            and len(
+                image_file_extensions
+                if content_media_type == "image"
+                else video_and_audio_file_extensions
+            )
+            > 0
+        ):
+            file_logger.warning(
+                "Plan as %s by its content: %s", file_type.name, file_path
+            )
+            media_type = content_media_type
+        if media_type is not None:
+            return self._plan_media_file(
+                file_path=file_path,
+                options=options,
+                media_type=media_type,
+                file_status=file_status,
+                extractors=extractors,
+            )
+        if mode == "auto":
+            return self._plan_general_file(
+                file_path=file_path, options=options, file_status=file_status
+            )
+        return self._skip_unsupported_file(file_path=file_path, mode=mode)
+
+    def _skip_unsupported_file(
+        self, file_path: str, mode: str
+    ) -> RenameResult:
+        if mode == "auto":
+            return self._skip(
+                file_path=file_path, message="Skip specific file type"
+            )
+        file_logger.info(
+            "Not a supported media file: %s", os.path.basename(file_path)
+        )
+        return RenameResult(
+            source=file_path,
+            status=RenameStatus.SKIPPED,
+            message="Not a supported media file",
+        )
+
+    def _prepare_results(
+        self, results: list[RenameResult], options: RenameOptions
+    ) -> tuple[list[RenameResult], list[str] | None]:
+        """Copy a planned file, or the files of a group, ahead of
+        `_apply_results()` if they are moved to another file system or linked
+
+        Returns the results, and the paths of the copies, if any. Failures
+        are left to `_apply_results()`, which copies the files again.
+        """
+        if results[0].status != RenameStatus.PLANNED:
+            return results, None
+        try:
+            return results, self.file_mover.prepare(
+                files_paths=[i.source for i in results],
+                new_files_paths=[i.target for i in results],
+                link=options.mirror_destination is not None,
+            )
+        except (OSError, ValueError) as e:
+            logger.debug("Failed to copy %s ahead: %s", results[0].source, e)
+            return results, None
+
+    def _discard_copies(
+        self, prepared_results: tuple[list[RenameResult], list[str] | None]
+    ) -> None:
+        _, copies_paths = prepared_results
+        if copies_paths is not None:
+            self.file_mover.discard(copies_paths=copies_paths)
+
+    def _apply_prepared_results(
+        self,
+        prepared_results: tuple[list[RenameResult], list[str] | None],
+        options: RenameOptions,
+    ) -> tuple[list[RenameResult], bool]:
+        results, copies_paths = prepared_results
+        return self._apply_results(
+            results=results, options=options, copies_paths=copies_paths
+        )
+
+    def _apply_results(
+        self,
+        results: list[RenameResult],
+        options: RenameOptions,
+        copies_paths: list[str] | None = None,
+    ) -> tuple[list[RenameResult], bool]:
+        """Rename a planned file, or the files of a group together
+
+        `copies_paths` are the copies made by `_prepare_results()`, if any.
+        Returns the results, and whether they are planned and thus applied.
+        """
+        if results[0].status != RenameStatus.PLANNED:
+            return results, False
+        start_time = time.perf_counter()
+        try:
+            new_files_paths = (
+                self.file_mover.move
+                if options.mirror_destination is None
+                else self.file_mover.link
+            )(
+                files_paths=[i.source for i in results],
+                new_files_paths=[i.target for i in results],
+                copies_paths=copies_paths,
+            )
+        except (OSError, ValueError) as e:
+            if options.stop_on_error:
+                raise
+            file_logger.error("Failed to rename %s: %s", results[0].source, e)
+            for result in results:
+                result.status = RenameStatus.FAILED
+                result.message = str(e)
+        else:
+            for i, result in enumerate(results):
+                if new_files_paths is None or os.path.normpath(
+                    new_files_paths[i]
+                ) == os.path.normpath(result.source):
+                    result.status = RenameStatus.UNCHANGED
+                elif options.mirror_destination is not None:
+                    result.status = RenameStatus.LINKED
+                    result.target = new_files_paths[i]
+                else:
+                    result.status = RenameStatus.RENAMED
+                    result.target = new_files_paths[i]
+                    self.metadata_cache.move(
+                        file_path=result.source,
+                        new_file_path=new_files_paths[i],
+                    )
+        apply_seconds = (time.perf_counter() - start_time) / len(results)
+        for result in results:
+            result.apply_seconds = apply_seconds
+        return results, True
+
+    def _count_applied(self) -> None:
+        self._applied_files_count += 1
+        if self.progress_callback is not None:
+            self.progress_callback(self._applied_files_count)
+
+    def get_fingerprint(
+        self,
+        mode: str,
+        options: RenameOptions | None = None,
+        extra: object = None,
+    ) -> str:
+        """Get a hash of the configuration, the mode and the options, which
+        determine the new names of files
+
+        `extra` is anything else to be hashed, e.g. the patterns deciding
+        which files are processed.
+        """
+        if options is None:
+            options = self.options
+        return hashlib.sha256(
+            json.dumps(
+                [self.config_file, mode, dataclasses.asdict(options), extra],
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get_summary_lines(self) -> list[str]:
+        return [
+            *self.file_type_statistics.get_summary_lines(),
+            *self.extractor_chain.get_summary_lines(),
+            *(
+                []
+                if self.metadata_index is None
+                else self.metadata_index.get_summary_lines()
+            ),
+            *(
+                self.xattr_cache.get_summary_lines()
+                if self._use_xattr_cache
+                else []
+            ),
+            *self.file_mover.get_summary_lines(),
+            *self.throttle.get_summary_lines(),
+            *self.scheduler.get_summary_lines(),
+            *self.stat_layer.get_summary_lines(
+                files_count=self._planned_files_count
+            ),
+        ]
+
+    def _emit(self, result: RenameResult) -> None:
+        if self.event_callback is not None:
+            self.event_callback(result)
+        if tracing.event_logger.isEnabledFor(logging.INFO):
+            tracing.emit_event("file", **result.to_dict())
+
+    def _skip(self, file_path: str, message: str) -> RenameResult:
+        file_logger.info("%s: %s", message, file_path)
+        return RenameResult(
+            source=file_path, status=RenameStatus.SKIPPED, message=message
+        )
+
+    def _get_media_settings(
+        self, options: RenameOptions
+    ) -> tuple[bool, set[str], set[str]]:
+        """Check the availability of exiftool and get the media extensions
+
+        Returns whether exiftool is used on images, and the sets of image and
+        video and audio file extensions.
+        """
+        if (
+            self._media_settings is not None
+            and self._media_settings[0] == options.use_exiftool_on_images
+        ):
+            return self._media_settings[1]
+        try:
+            exiftool_exists = (
+                self.exiftool_process.execute(arguments=["-echo", "OK"])
+                == "OK"
+            )
+        except (FileNotFoundError, ChildProcessError):
+            exiftool_exists = False
+        if exiftool_exists is False:
+            logger.warning("\"exiftool\" not found")
+            self.extractor_chain.disable(
+                extractor=media_file.Extractor.EXIFTOOL
+            )
+
+        supported_file_extensions = self.config_file[
+            "supported_file_extensions"
+        ]
+        use_exiftool_on_images = (options.use_exiftool_on_images is True) or (
+            options.use_exiftool_on_images is None
+            and self.config_file["use_exiftool_on_images"] is True
+        )
+        image_file_extensions: list[str] = []
+        video_and_audio_file_extensions: list[str] = []
+        if exiftool_exists:
+            if use_exiftool_on_images:
+                image_file_extensions.extend(
+                    supported_file_extensions["exiftool"]["image"]
+                )
+            else:
+                image_file_extensions.extend(
+                    supported_file_extensions["pillow"]["image"]
+                )
+            video_and_audio_file_extensions.extend(
+                supported_file_extensions["exiftool"]["video_and_audio"]
+            )
+        else:
+            image_file_extensions.extend(
+                supported_file_extensions["pillow"]["image"]
+            )
+        media_settings = (
+            use_exiftool_on_images,
+            set(i.lower() for i in image_file_extensions),
+            set(i.lower() for i in video_and_audio_file_extensions),
+        )
+        self._media_settings = (options.use_exiftool_on_images, media_settings)
+        return media_settings
+
+    def _plan_general_file(
+        self,
+        file_path: str,
+        options: RenameOptions,
+        file_status: os.stat_result | None = None,
+    ) -> RenameResult:
+        file_name_prefix, file_extension = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=file_path
+            )
+        )
+        if (
+            options.skip_media_files
+            and file_extension.lower()
+            in self._media_and_ignored_file_extensions
+        ):
+            return self._skip(
+                file_path=file_path, message="Skip specific file type"
+            )
+        if file_status is None:
+            file_status = _stat_file(
+                file_path=file_path, stat_layer=self.stat_layer
+            )
+        naming_format = self.config_file["file_naming_format"]["general_file"]
+        if (
+            options.skip_files_with_formatted_names
+            and general_file.helper.file_name_matches_file_format(
+                file_name_formatter=general_file.FileNameFormatter,
+                file_name=file_name_prefix,
+                naming_format=naming_format,
+                context=self.context,
+            )
+        ):
+            return self._skip(
+                file_path=file_path,
+                message="Skip files with matching naming format",
+            )
+        new_file_name = general_file.helper.get_renamed_file(
+            file_path=file_path,
+            naming_format=_get_destination_naming_format(
+                naming_format=naming_format, options=options
+            ),
+            forced_offset_time=options.forced_offset_time,
+            forced_date=options.forced_date,
+            file_status=file_status,
+        )
+        return RenameResult(
+            source=file_path,
+            status=RenameStatus.PLANNED,
+            target=os.path.join(
+                _get_target_directory(file_path=file_path, options=options),
+                new_file_name,
+            ),
+            timestamp_source=(
+                media_file.Extractor.FILE_STATUS.value
+                if options.forced_date is None
+                else "forced_date"
+            ),
+            file_size=file_status.st_size,
+        )
+
+    def _plan_media_file(
+        self,
+        file_path: str,
+        options: RenameOptions,
+        media_type: str,
+        file_status: os.stat_result,
+        extractors: list[media_file.Extractor] | None,
+    ) -> RenameResult:
+        file_name = os.path.basename(file_path)
+        use_exiftool_on_images, _, _ = self._get_media_settings(
+            options=options
+        )
+        file_name_prefix, _ = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=file_name
+            )
+        )
+        naming_format = self.config_file["file_naming_format"]["media_file"]
+        if (
+            options.skip_files_with_formatted_names
+            and general_file.helper.file_name_matches_file_format(
+                file_name_formatter=media_file.MediaFileNameFormatter,
+                file_name=file_name_prefix,
+                naming_format=naming_format,
+                context=self.context,
+            )
+        ):
+            return self._skip(
+                file_path=file_path,
+                message="Skip files with matching naming format",
+            )
+        new_file_name, timestamp_source = (
+            media_file.helper.get_renamed_media_file(
+                file_path=file_path,
+                naming_format=_get_destination_naming_format(
+                    naming_format=naming_format, options=options
+                ),
+                media_type=media_type,
+                forced_offset_time=options.forced_offset_time,
+                forced_date=options.forced_date,
+                exif_offset_time=options.exif_offset_time,
+                use_exiftool=use_exiftool_on_images,
+                extractor_chain=self.extractor_chain,
+                metadata_cache=self.metadata_cache,
+                context=self.context,
+                metadata_index=self.metadata_index,
+                file_status=file_status,
+                extractors=extractors,
+                # Files linked into a mirror are left untouched
+                xattr_cache=(
+                    self.xattr_cache
+                    if self._use_xattr_cache
+                    and options.mirror_destination is None
+                    else None
+                ),
+            )
+        )
+        return RenameResult(
+            source=file_path,
+            status=RenameStatus.PLANNED,
+            target=os.path.join(
+                _get_target_directory(file_path=file_path, options=options),
+                new_file_name,
+            ),
+            timestamp_source=timestamp_source,
+            file_size=file_status.st_size,
+        )
+
+    def _plan_sidecar_file(
+        self, file_path: str, primary_result: RenameResult
+    ) -> RenameResult:
+        """Plan a file to be renamed after the primary file of its group"""
+        if primary_result.status != RenameStatus.PLANNED:
+            return self._skip(
+                file_path=file_path,
+                message="Skip file grouped with {}".format(
+                    os.path.basename(primary_result.source)
+                ),
+            )
+        new_file_name_prefix, _ = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=primary_result.target
+            )
+        )
+        _, file_extension = (
+            general_file.helper.get_file_name_prefix_and_extension(
+                file_name_or_path=file_path
+            )
+        )
+        return RenameResult(
+            source=file_path,
+            status=RenameStatus.PLANNED,
+            target=os.path.join(
+                os.path.dirname(primary_result.target),
+                "{}.{}".format(new_file_name_prefix, file_extension),
+            ),
+            timestamp_source=primary_result.timestamp_source,
+            group=primary_result.source,
+        )
+
+
+def _stat_file(
+    file_path: str, stat_layer: general_file.StatLayer
+) -> os.stat_result:
+    """Get the status of a file, which is the only call of stat_layer.stat()
+    on it while it is planned
+    """
+    try:
+        file_status = stat_layer.stat(file_path)
+    except (OSError, ValueError):
+        file_status = None
+    if file_status is None or not stat.S_ISREG(file_status.st_mode):
+        raise FileNotFoundError("No such file: {}".format(file_path))
+    return file_status
+
+
+def _is_same_date_and_time(
+    date_and_time: datetime.datetime | None,
+    other_date_and_time: datetime.datetime | None,
+) -> bool:
+    """Compare instants if both are aware, or the local times otherwise"""
+    if date_and_time is None or other_date_and_time is None:
+        return date_and_time is other_date_and_time
+    if date_and_time.tzinfo is None or other_date_and_time.tzinfo is None:
+        return date_and_time.replace(tzinfo=None) == (
+            other_date_and_time.replace(tzinfo=None)
+        )
+    return date_and_time == other_date_and_time
+
+
+def _get_file_size(file_path: str, stat_layer: general_file.StatLayer) -> int:
+    """Get the size of a file to estimate its cost, or 0 if it cannot be
+    read, which is then reported when the file is planned
+    """
+    try:
+        return stat_layer.stat(file_path).st_size
+    except (OSError, ValueError):
+        return 0
+
+
+def _get_destination_naming_format(
+    naming_format: str, options: RenameOptions
+) -> str:
+    if options.destination is None:
+        return naming_format
+    return os.path.join(options.destination, naming_format)
+
+
+def _get_target_directory(file_path: str, options: RenameOptions) -> str:
+    directory = os.path.dirname(file_path)
+    if options.mirror_destination is None:
+        return directory
+    return os.path.normpath(
+        os.path.join(
+            options.mirror_destination,
+            os.path.relpath(
+                directory,
+                (
+                    options.mirror_source
+                    if options.mirror_source is not None
+                    else os.getcwd()
+                ),
+            ),
+        )
+    )
+
+
+def _log_directories(
+    items: Iterable[_T], get_file_path: Callable[[_T], str]
+) -> Iterator[_T]:
+    last_directory = None
+    for item in items:
+        current_directory = os.path.dirname(get_file_path(item))
+        if current_directory != last_directory:
+            logger.info("Processing files in directory: %s", current_directory)
+            last_directory = current_directory
+        yield item
+
+
+def _leave_directories(
+    items: Iterable[_T],
+    get_file_path: Callable[[_T], str],
+    extractor_chain: media_file.ExtractorChain,
+) -> Iterator[_T]:
+    """Fold the extractor statistics of every directory once the results of
+    its files have all been yielded"""
+    last_directory = None
+    for item in items:
+        current_directory = os.path.dirname(get_file_path(item))
+        if last_directory is not None and current_directory != last_directory:
+            extractor_chain.leave_directory(directory=last_directory)
+        last_directory = current_directory
+        yield item
+    if last_directory is not None:
+        extractor_chain.leave_directory(directory=last_directory)
+
+
+def _batch_by_directory(
+    file_groups: Iterable[media_file.FileGroup],
+) -> Iterator[list[media_file.FileGroup]]:
+    """Batch consecutive groups of files in the same directory"""
+    batch: list[media_file.FileGroup] = []
+    for file_group in file_groups:
+        if batch and os.path.dirname(
+            file_group.primary_file_path
+        ) != os.path.dirname(batch[0].primary_file_path):
+            yield batch
+            batch = []
+        batch.append(file_group)
+    if batch:
+        yield batch
+
+
+def _group_results(
+    plan: Iterable[RenameResult],
+) -> Iterator[list[RenameResult]]:
+    """Collect the consecutive results of each group"""
+    group_results: list[RenameResult] = []
+    for result in plan:
+        if group_results and result.group != group_results[0].group:
+            yield group_results
+            group_results = []
+        if result.group is None:
+            yield [result]
+        else:
+            group_results.append(result)
+    if group_results:
+        yield group_results
+
+
+def _get_directories(
+    prepared_results: tuple[list[RenameResult], list[str] | None],
+) -> set[str]:
+    """Get the directories of the files of planned results, and of their
+    targets"""
+    results, _ = prepared_results
+    if results[0].status != RenameStatus.PLANNED:
+        return set()
+    return set(
+        os.path.dirname(j) for i in results for j in [i.source, i.target]
+    )
+
+
+def _map_by_directory(
+    function: Callable[[_T], _R],
+    items: Iterable[_T],
+    get_directories: Callable[[_T], set[str]],
+    jobs: int,
+    on_abandoned: Callable[[_T], None] | None = None,
+) -> Iterator[_R]:
+    """Call a function on items in `jobs` threads, yielding in order
+
+    Items sharing any of their directories are called one at a time, in the
+    order of the items, while items of different directories are called at
+    the same time. If the iteration is stopped early, `on_abandoned` is
+    called with the items not called, e.g. to clean them up.
+    """
+    if jobs <= 1:
+        yield from map(function, items)
+        return
+    max_pending_items_count = jobs * 4
+    pending_results: collections.deque[
+        tuple[_T, set[str], concurrent.futures.Future[_R]]
+    ] = collections.deque()
+    # Last pending result of each directory
+    last_results: dict[str, concurrent.futures.Future[_R]] = {}
+
+    def call(
+        item: _T, previous_results: list[concurrent.futures.Future[_R]]
+    ) -> _R:
+        # Submitted earlier, so they are running or done, and this never
+        # waits for an item waiting for a free thread
+        concurrent.futures.wait(previous_results)
+        return function(item)
+
+    def pop_result() -> _R:
+        _, directories, pending_result = pending_results.popleft()
+        for directory in directories:
+            if last_results.get(directory, None) is pending_result:
+                del last_results[directory]
+        return pending_result.result()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for item in items:
+                directories = get_directories(item)
+                pending_result = executor.submit(
+                    call,
+                    item,
+                    [
+                        last_results[i]
+                        for i in directories
+                        if i in last_results
+                    ],
+                )
+                for directory in directories:
+                    last_results[directory] = pending_result
+                pending_results.append((item, directories, pending_result))
+                while len(pending_results) >= max_pending_items_count:
+                    yield pop_result()
+            while len(pending_results) > 0:
+                yield pop_result()
+        finally:
+            # Items waiting for a free thread are not called
+            for item, _, pending_result in pending_results:
+                if pending_result.cancel() and on_abandoned is not None:
+                    on_abandoned(item)
+
+
+def _map_in_order(
+    function: Callable[[_T], _R],
+    items: Iterable[_T],
+    jobs: int,
+    on_abandoned: Callable[[_R], None] | None = None,
+) -> Iterator[_R]:
+    """Call a function on items in `jobs` threads, yielding in order
+
+    Items are submitted ahead of the results being yielded, up to a limit,
+    so that the items are not all held in memory. If the iteration is
+    stopped early, `on_abandoned` is called with the results computed but
+    not yielded, e.g. to clean them up.
+    """
+    if jobs <= 1:
+        yield from map(function, items)
+        return
+    max_pending_items_count = jobs * 4
+    pending_results: collections.deque[concurrent.futures.Future[_R]] = (
+        collections.deque()
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for item in items:
+                pending_results.append(executor.submit(function, item))
+                while len(pending_results) >= max_pending_items_count:
+                    yield pending_results.popleft().result()
+            while len(pending_results) > 0:
+                yield pending_results.popleft().result()
+        finally:
+            for pending_result in pending_results:
+                if pending_result.cancel() or on_abandoned is None:
+                    continue
+                if pending_result.exception() is None:
+                    on_abandoned(pending_result.result())
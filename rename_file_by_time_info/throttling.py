@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterator
+
+
+logger = logging.getLogger()
+
+
+@dataclasses.dataclass
+class ThrottleLimits:
+    # Files planned per second, and files renamed per second
+    files_per_second: float | None = None
+    # Bytes of files read by exiftool or copied per second
+    bytes_per_second: float | None = None
+    max_extractor_processes: int | None = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> ThrottleLimits:
+        return cls(
+            **{
+                i.name: config.get(i.name, None)
+                for i in dataclasses.fields(cls)
+            }
+        )
+
+
+@dataclasses.dataclass
+class ThrottleStatistics:
+    files_wait_seconds: float = 0.0
+    bytes_wait_seconds: float = 0.0
+    extractor_processes_wait_seconds: float = 0.0
+
+
+class _RateLimiter:
+    """Spread amounts over time at a rate
+
+    An amount is let through once the amounts before it have been spread, so
+    a large amount is not delayed itself but delays those after it.
+    """
+
+    def __init__(self) -> None:
+        self.rate: float | None = None
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float) -> float:
+        """Wait for an amount, and get the seconds waited"""
+        with self._lock:
+            if self.rate is None or self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            start_time = max(now, self._next_time)
+            self._next_time = start_time + amount / self.rate
+        if start_time > now:
+            time.sleep(start_time - now)
+        return start_time - now
+
+
+class Throttle:
+    """Limits of the I/O and the processes of a run on busy storage
+
+    Files are let through at `files_per_second` when planned, and again when
+    renamed, so the file system is not flooded with metadata operations.
+    Files read by exiftool and copied across file systems are counted by
+    their sizes in `bytes_per_second`, and at most `max_extractor_processes`
+    exiftool processes work at the same time. None is no limit.
+
+    If `control_file` is given, limits in it, a JSON object with the fields
+    of ThrottleLimits, override the configured limits while a run is going.
+    The file is checked at most once per second.
+    """
+
+    CONTROL_FILE_CHECK_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        limits: ThrottleLimits | None = None,
+        control_file: str | None = None,
+    ) -> None:
+        self.control_file = control_file
+        self.statistics = ThrottleStatistics()
+        self._configured_limits = ThrottleLimits()
+        self._plan_files_limiter = _RateLimiter()
+        self._apply_files_limiter = _RateLimiter()
+        self._bytes_limiter = _RateLimiter()
+        self._max_extractor_processes: int | None = None
+        self._extractor_processes_count = 0
+        self._extractor_processes_condition = threading.Condition()
+        self._control_file_mtime_ns: int | None = None
+        self._control_file_check_time = 0.0
+        self._lock = threading.Lock()
+        self.configure(
+            limits=limits if limits is not None else ThrottleLimits(),
+            control_file=control_file,
+        )
+
+    @property
+    def limits(self) -> ThrottleLimits:
+        return ThrottleLimits(
+            files_per_second=self._plan_files_limiter.rate,
+            bytes_per_second=self._bytes_limiter.rate,
+            max_extractor_processes=self._max_extractor_processes,
+        )
+
+    def configure(
+        self, limits: ThrottleLimits, control_file: str | None = None
+    ) -> None:
+        """Set the configured limits, which the control file overrides"""
+        self.control_file = control_file
+        self._configured_limits = limits
+        self._control_file_mtime_ns = None
+        self._set_limits(limits=limits)
+        self._check_control_file(force=True)
+
+    def wait_for_files(self, stage: str, count: int = 1) -> None:
+        """Wait to plan or rename files, where `stage` is "plan" or "apply" """
+        self._check_control_file()
+        seconds = (
+            self._plan_files_limiter
+            if stage == "plan"
+            else self._apply_files_limiter
+        ).acquire(amount=count)
+        if seconds > 0:
+            with self._lock:
+                self.statistics.files_wait_seconds += seconds
+
+    def wait_for_bytes(self, count: int) -> None:
+        self._check_control_file()
+        seconds = self._bytes_limiter.acquire(amount=count)
+        if seconds > 0:
+            with self._lock:
+                self.statistics.bytes_wait_seconds += seconds
+
+    @contextlib.contextmanager
+    def extractor_process(self) -> Iterator[None]:
+        """Hold one of the extractor processes allowed to work at a time"""
+        self._check_control_file()
+        start_time = time.monotonic()
+        with self._extractor_processes_condition:
+            self._extractor_processes_condition.wait_for(
+                lambda: self._max_extractor_processes is None
+                or self._extractor_processes_count
+                < self._max_extractor_processes
+            )
+            self._extractor_processes_count += 1
+        seconds = time.monotonic() - start_time
+        if seconds >= 0.001:
+            with self._lock:
+                self.statistics.extractor_processes_wait_seconds += seconds
+        try:
+            yield
+        finally:
+            with self._extractor_processes_condition:
+                self._extractor_processes_count -= 1
+                self._extractor_processes_condition.notify()
+
+    def get_summary_lines(self) -> list[str]:
+        limits = self.limits
+        if limits == ThrottleLimits():
+            return []
+        statistics = self.statistics
+        return [
+            "Throttle: {} file(s)/s, {} byte(s)/s, {} extractor process(es); "
+            "waited {:.3f}s for files, {:.3f}s for bytes, {:.3f}s for "
+            "extractor processes".format(
+                _format_limit(limits.files_per_second),
+                _format_limit(limits.bytes_per_second),
+                _format_limit(limits.max_extractor_processes),
+                statistics.files_wait_seconds,
+                statistics.bytes_wait_seconds,
+                statistics.extractor_processes_wait_seconds,
+            )
+        ]
+
+    def _set_limits(self, limits: ThrottleLimits) -> None:
+        self._plan_files_limiter.rate = limits.files_per_second
+        self._apply_files_limiter.rate = limits.files_per_second
+        self._bytes_limiter.rate = limits.bytes_per_second
+        with self._extractor_processes_condition:
+            self._max_extractor_processes = limits.max_extractor_processes
+            self._extractor_processes_condition.notify_all()
+
+    def _check_control_file(self, force: bool = False) -> None:
+        if self.control_file is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if (
+                not force
+                and now - self._control_file_check_time
+                < type(self).CONTROL_FILE_CHECK_INTERVAL
+            ):
+                return
+            self._control_file_check_time = now
+            try:
+                mtime_ns = os.stat(self.control_file).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+            except OSError as e:
+                logger.warning("Failed to check throttle control file: %s", e)
+                return
+            if mtime_ns == self._control_file_mtime_ns:
+                return
+            self._control_file_mtime_ns = mtime_ns
+            overrides = {}
+            if mtime_ns is not None:
+                try:
+                    with open(self.control_file, encoding="utf-8") as f:
+                        overrides = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(
+                        "Failed to load throttle control file: %s", e
+                    )
+                    return
+            try:
+                limits = dataclasses.replace(
+                    self._configured_limits, **overrides
+                )
+            except TypeError as e:
+                logger.warning("Invalid throttle control file: %s", e)
+                return
+        logger.info("Throttle limits: %s", limits)
+        self._set_limits(limits=limits)
+
+
+def _format_limit(value: float | None) -> str:
+    return "unlimited" if value is None else "{:g}".format(value)
@@ -0,0 +1,159 @@
+import functools
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Any, Callable
+
+
+# Messages about individual files, e.g. "a.jpg -> b.jpg". They are
+# propagated to the root logger, but can be filtered by their own level.
+FILE_LOGGER_NAME = "rename_file_by_time_info.file"
+# Machine-readable events, each carrying a dictionary in its "event"
+# attribute. Disabled until an event log is set up.
+EVENT_LOGGER_NAME = "rename_file_by_time_info.event"
+
+file_logger = logging.getLogger(FILE_LOGGER_NAME)
+event_logger = logging.getLogger(EVENT_LOGGER_NAME)
+event_logger.propagate = False
+event_logger.disabled = True
+
+
+class Lazy:
+    """Defer computing a logging argument until the message is formatted
+
+    Arguments of a logging call are formatted only if the record is emitted,
+    so an expensive payload passed as `Lazy(func, *args)` costs nothing when
+    the level is disabled.
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: Callable[..., Any], *args: Any) -> None:
+        self.func = func
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.func(*self.args))
+
+
+class LazyJson(Lazy):
+    def __init__(self, data: Any) -> None:
+        super().__init__(
+            functools.partial(json.dumps, indent=2, default=str), data
+        )
+
+
+def emit_event(event: str, **fields: Any) -> None:
+    if event_logger.isEnabledFor(logging.INFO):
+        event_logger.info(event, extra={"event": {"event": event, **fields}})
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {"time": record.created, **getattr(record, "event", {})},
+            default=str,
+        )
+
+
+class _BufferedStreamHandler(logging.StreamHandler):
+    """A StreamHandler which leaves flushing to its QueueListener"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class _BufferedFileHandler(logging.FileHandler):
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class _BatchingQueueListener(logging.handlers.QueueListener):
+    """A QueueListener which flushes its handlers once the queue is drained
+
+    Records queued in a burst are written in a batch, with a single flush.
+    """
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            if not block:
+                raise
+        self._flush()
+        return self.queue.get()
+
+    def stop(self) -> None:
+        super().stop()
+        self._flush()
+
+    def _flush(self) -> None:
+        for handler in self.handlers:
+            handler.flush()
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    file_level: int = logging.INFO,
+    verbose_format: bool = False,
+    events_log_path: str | None = None,
+) -> logging.handlers.QueueListener:
+    """Set up logging, with output written by a background thread
+
+    `level` is the level of run-level messages, while `file_level` is the
+    level of messages about individual files. If `events_log_path` is given,
+    events are written to it as JSON lines. Call `stop()` of the listener
+    returned before exiting, so that queued records are written.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = _BufferedStreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter(
+            fmt=(
+                "%(asctime)s %(levelname).1s %(name)s %(message)s"
+                if verbose_format
+                else "%(message)s"
+            ),
+            datefmt="%Y-%m-%dT%H:%M:%S%z",
+        )
+    )
+    handlers: list[logging.Handler] = [stream_handler]
+    root_queue_handler = logging.handlers.QueueHandler(log_queue)
+    # The root logger has to pass messages about files down to `file_level`,
+    # so run-level messages below `level` are filtered before being queued
+    root_queue_handler.addFilter(
+        lambda record: record.levelno >= level
+        or record.name == FILE_LOGGER_NAME
+    )
+    root_logger = logging.getLogger()
+    root_logger.setLevel(min(level, file_level))
+    root_logger.addHandler(root_queue_handler)
+    file_logger.setLevel(file_level)
+
+    if events_log_path is not None:
+        events_handler = _BufferedFileHandler(
+            events_log_path, encoding="utf-8"
+        )
+        events_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(events_handler)
+        event_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        event_logger.setLevel(logging.INFO)
+        event_logger.disabled = False
+        # Events are only written to the event log
+        stream_handler.addFilter(
+            lambda record: record.name != EVENT_LOGGER_NAME
+        )
+        events_handler.addFilter(
+            lambda record: record.name == EVENT_LOGGER_NAME
+        )
+
+    listener = _BatchingQueueListener(log_queue, *handlers)
+    listener.start()
+    return listener
@@ -1,10 +1,22 @@
 import argparse
+import collections
 import datetime
 import json
 import logging
 import os
 
-from rename_file_by_time_info import external_program, general_file, media_file
+from rename_file_by_time_info import (
+    AuditStatus,
+    RenameOptions,
+    RenameResult,
+    RenameSession,
+    RenameStatus,
+    general_file,
+    media_file,
+    progress,
+    service,
+    tracing,
+)
 from rename_file_by_time_info._version import __version__
 
 
@@ -12,147 +24,236 @@ logger = logging.getLogger()
 logging.getLogger("PIL.TiffImagePlugin").setLevel(logging.INFO)
 
 
-def _rename_general_files(
-    files_paths: list[str], cli_args: argparse.Namespace, config_file: dict
+def update_manifest(
+    manifest: general_file.DirectoryManifest, result: RenameResult
 ) -> None:
-    skip_extensions = (
-        set()
-        if cli_args.skip_media_files is False
-        else set(
-            [
-                i.lower()
-                for i in [
-                    *config_file["supported_file_extensions"]["exiftool"][
-                        "image"
-                    ],
-                    *config_file["supported_file_extensions"]["exiftool"][
-                        "video_and_audio"
-                    ],
-                    *config_file["supported_file_extensions"]["pillow"][
-                        "image"
-                    ],
-                    *config_file["ignored_file_extensions"],
-                ]
-            ]
+    if result.status == RenameStatus.FAILED:
+        manifest.discard(file_path=result.source)
+    elif result.status == RenameStatus.RENAMED:
+        manifest.add_moved_file(
+            file_path=result.source, new_file_path=result.target
+        )
+    elif result.status == RenameStatus.LINKED:
+        manifest.add_new_file(new_file_path=result.target)
+
+
+def audit(
+    cli_args: argparse.Namespace,
+    session: RenameSession,
+    files_paths: general_file.FileInventory,
+    manifest: general_file.DirectoryManifest | None,
+    progress_reporter: progress.ProgressReporter | None,
+) -> list[str]:
+    """Audit the names of files, and get the summary"""
+    audit_log = (
+        None
+        if cli_args.audit_log is None
+        else media_file.AuditLog.load(
+            path=cli_args.audit_log,
+            fingerprint=session.get_fingerprint(mode="audit"),
         )
     )
-    last_directory = None
-    for file_path in files_paths:
-        current_directory = os.path.dirname(file_path)
-        if current_directory != last_directory:
-            logger.info("Processing files in directory: %s", current_directory)
-            last_directory = current_directory
-        file_name_prefix, file_extension = (
-            general_file.helper.get_file_name_prefix_and_extension(
-                file_name_or_path=file_path
+    statuses_counts: collections.Counter[AuditStatus] = collections.Counter()
+    for result in session.audit(
+        files_paths=files_paths, jobs=cli_args.jobs, audit_log=audit_log
+    ):
+        statuses_counts[result.status] += 1
+        if progress_reporter is not None:
+            progress_reporter.record(
+                file_size=result.file_size,
+                timestamp_source=result.timestamp_source,
             )
+        if manifest is not None and result.status in (
+            AuditStatus.MISMATCHED,
+            AuditStatus.FAILED,
+        ):
+            # Checked again by the next audit
+            manifest.discard(file_path=result.source)
+    if audit_log is not None:
+        audit_log.save(path=cli_args.audit_log)
+    return [
+        "Audit: {} verified, {} unchanged since the last audit, {} "
+        "mismatched, {} unformatted, {} skipped, {} failed".format(
+            statuses_counts[AuditStatus.VERIFIED],
+            statuses_counts[AuditStatus.UNCHANGED],
+            statuses_counts[AuditStatus.MISMATCHED],
+            statuses_counts[AuditStatus.UNFORMATTED],
+            statuses_counts[AuditStatus.SKIPPED],
+            statuses_counts[AuditStatus.FAILED],
         )
-        if file_name_prefix[0] == ".":
-            logger.info("Skip hidden file: %s", file_path)
-            continue
-        if file_extension.lower() in skip_extensions:
-            logger.info("Skip specific file type: %s", file_path)
-            continue
-        general_file.helper.rename(
-            file_path=file_path,
-            naming_format=config_file["file_naming_format"]["general_file"],
-            forced_offset_time=cli_args.forced_offset_time,
-            forced_date=cli_args.forced_date,
-            skip_if_file_name_matches_naming_format=cli_args.skip_files_with_formatted_names,
-        )
+    ]
 
 
-def _rename_media_files(
-    files_paths: list[str], cli_args: argparse.Namespace, config_file: dict
-) -> None:
-    try:
-        exiftool_exists = (
-            external_program.helper.execute(
-                command=["exiftool", "-echo", "OK"]
-            )
-            == "OK"
-        )
-    except FileNotFoundError:
-        exiftool_exists = False
-    if exiftool_exists is False:
-        logger.warning("\"exiftool\" not found")
+def _get_static_directory(template: str) -> str:
+    """Get the directory of a template of directories before its first
+    format code
+    """
+    static_components = []
+    for component in os.path.normpath(template).split(os.sep):
+        if "%" in component:
+            break
+        static_components.append(component)
+    return os.sep.join(static_components) or "."
 
-    use_exiftool_on_images = (cli_args.use_exiftool_on_images is True) or (
-        cli_args.use_exiftool_on_images is None
-        and config_file["use_exiftool_on_images"] is True
-    )
-    image_file_extensions: list[str] = []
-    video_and_audio_file_extensions: list[str] = []
-    if exiftool_exists:
-        if use_exiftool_on_images:
-            image_file_extensions.extend(
-                config_file["supported_file_extensions"]["exiftool"]["image"]
-            )
-        else:
-            image_file_extensions.extend(
-                config_file["supported_file_extensions"]["pillow"]["image"]
-            )
-        video_and_audio_file_extensions.extend(
-            config_file["supported_file_extensions"]["exiftool"][
-                "video_and_audio"
-            ]
-        )
-    else:
-        image_file_extensions.extend(
-            config_file["supported_file_extensions"]["pillow"]["image"]
-        )
 
-    last_directory = None
-    for file_path in files_paths:
-        current_directory = os.path.dirname(file_path)
-        if current_directory != last_directory:
-            logger.info("Processing files in directory: %s", current_directory)
-            last_directory = current_directory
-        file_name_prefix, _ = (
-            general_file.helper.get_file_name_prefix_and_extension(
-                file_name_or_path=file_path
-            )
-        )
-        if file_name_prefix[0] == ".":
-            logger.info("Skip hidden file: %s", file_path)
-            continue
-        media_file.helper.rename(
-            file_path=file_path,
-            naming_format=config_file["file_naming_format"]["media_file"],
-            forced_offset_time=cli_args.forced_offset_time,
-            forced_date=cli_args.forced_date,
-            exif_offset_time=cli_args.exif_offset_time,
-            use_exiftool_on_images=use_exiftool_on_images,
-            image_file_extensions=image_file_extensions,
-            video_and_audio_file_extensions=video_and_audio_file_extensions,
-            skip_if_file_name_matches_naming_format=cli_args.skip_files_with_formatted_names,
+def _positive_int(value: str) -> int:
+    """Parse an argument which must be a positive integer"""
+    i = int(value)
+    if i < 1:
+        raise argparse.ArgumentTypeError(
+            "must be a positive integer: {}".format(value)
         )
+    return i
 
 
 def main(cli_args: argparse.Namespace, config_file: dict) -> None:
-    if cli_args.r is True:
-        # Search files recursively
-        files_paths = []
-        for root, dirs, files in os.walk(cli_args.src):
-            files_paths.extend([os.path.join(root, f) for f in files])
-    else:
-        # Non-recursive search
-        potential_paths = [
-            os.path.join(cli_args.src, f) for f in os.listdir(cli_args.src)
-        ]
-        files_paths = [p for p in potential_paths if os.path.isfile(p)]
-    files_paths.sort()
+    if cli_args.subcommand == "serve":
+        service.RenameService(
+            config_file_path=cli_args.config_file,
+            socket_path=cli_args.socket,
+            max_workers=cli_args.jobs,
+        ).serve_forever()
+        return
 
-    if cli_args.subcommand == "general":
-        _rename_general_files(
-            files_paths=files_paths, cli_args=cli_args, config_file=config_file
+    if (
+        cli_args.mirror is not None
+        and cli_args.r
+        and os.path.commonpath(
+            [os.path.abspath(cli_args.src), os.path.abspath(cli_args.mirror)]
+        )
+        == os.path.abspath(cli_args.src)
+    ):
+        raise ValueError(
+            "Mirror destination must not be in the source directory"
+        )
+    if cli_args.organize is not None and cli_args.r:
+        organize_directory = _get_static_directory(
+            template=os.path.expanduser(cli_args.organize)
+        )
+        # Otherwise, files moved would be found and moved again by the walk
+        if cli_args.mirror is None and not os.path.isabs(organize_directory):
+            raise ValueError(
+                "Destination must be an absolute path with -r, unless "
+                "mirrored"
+            )
+        if os.path.isabs(organize_directory) and os.path.commonpath(
+            [os.path.abspath(cli_args.src), organize_directory]
+        ) == os.path.abspath(cli_args.src):
+            raise ValueError(
+                "Destination must not be in the source directory with -r"
+            )
+    options = RenameOptions(
+        forced_offset_time=cli_args.forced_offset_time,
+        forced_date=cli_args.forced_date,
+        exif_offset_time=cli_args.exif_offset_time,
+        skip_files_with_formatted_names=cli_args.skip_files_with_formatted_names,
+        skip_media_files=getattr(cli_args, "skip_media_files", False),
+        use_exiftool_on_images=getattr(
+            cli_args, "use_exiftool_on_images", None
+        ),
+        destination=(
+            None
+            if cli_args.organize is None
+            else os.path.expanduser(cli_args.organize)
+        ),
+        mirror_destination=cli_args.mirror,
+        mirror_source=cli_args.src,
+        order=cli_args.order,
+    )
+    walk_config = config_file.get("walk", {})
+    path_filter = general_file.PathFilter(
+        patterns=[
+            *walk_config.get("exclude_patterns", []),
+            *cli_args.patterns,
+        ],
+        skip_hidden_directories=cli_args.skip_hidden_directories
+        or walk_config.get("skip_hidden_directories", False),
+    )
+    metadata_from = getattr(cli_args, "metadata_from", None)
+    with RenameSession(
+        config_file=config_file,
+        options=options,
+        exiftool_processes=cli_args.jobs,
+        metadata_index=(
+            None
+            if metadata_from is None
+            else media_file.MetadataIndex(
+                path=metadata_from,
+                base_directory=getattr(cli_args, "metadata_base", None),
+            )
+        ),
+    ) as session:
+        manifest = (
+            None
+            if cli_args.manifest is None
+            else general_file.DirectoryManifest.load(
+                path=cli_args.manifest,
+                fingerprint=session.get_fingerprint(
+                    mode=cli_args.subcommand,
+                    extra=[
+                        path_filter.patterns,
+                        path_filter.skip_hidden_directories,
+                    ],
+                ),
+            )
+        )
+        # Files are listed directory by directory, in the order of sorted
+        # paths
+        files_paths = general_file.FileInventory(
+            src=cli_args.src,
+            recursive=cli_args.r,
+            manifest=manifest,
+            path_filter=path_filter,
+            stat_layer=session.stat_layer,
         )
-    elif cli_args.subcommand == "media":
-        _rename_media_files(
-            files_paths=files_paths, cli_args=cli_args, config_file=config_file
+        progress_reporter = (
+            None
+            if not cli_args.progress and cli_args.status_file is None
+            else progress.ProgressReporter(
+                interval_seconds=cli_args.progress_interval,
+                status_file=cli_args.status_file,
+            )
         )
-    else:
-        raise NotImplementedError()
+        if progress_reporter is not None:
+            # Files are counted ahead, while being renamed
+            progress_reporter.start(files_counts=files_paths.count_files())
+        try:
+            if cli_args.subcommand == "audit":
+                audit_summary_lines = audit(
+                    cli_args=cli_args,
+                    session=session,
+                    files_paths=files_paths,
+                    manifest=manifest,
+                    progress_reporter=progress_reporter,
+                )
+            else:
+                audit_summary_lines = []
+                for result in session.rename(
+                    files_paths=files_paths,
+                    mode=cli_args.subcommand,
+                    jobs=cli_args.jobs,
+                ):
+                    if progress_reporter is not None:
+                        progress_reporter.record(
+                            file_size=result.file_size,
+                            timestamp_source=result.timestamp_source,
+                        )
+                    if manifest is not None:
+                        update_manifest(manifest=manifest, result=result)
+        finally:
+            if progress_reporter is not None:
+                progress_reporter.stop()
+        summary_lines = [
+            *files_paths.get_summary_lines(),
+            *session.get_summary_lines(),
+            *audit_summary_lines,
+        ]
+    if manifest is not None:
+        manifest.save(path=cli_args.manifest)
+        summary_lines.extend(manifest.get_summary_lines())
+    for line in summary_lines:
+        logger.info(line)
+    tracing.emit_event("summary", lines=summary_lines)
 
 
 if __name__ == "__main__":
@@ -169,6 +270,46 @@ if __name__ == "__main__":
             os.path.dirname(os.path.abspath(__file__)), "config.json"
         ),
     )
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default=None,
+        help="Level of run-level messages. Defaults to DEBUG in debug mode, or INFO otherwise",
+    )
+    parser.add_argument(
+        "--file-log-level",
+        type=str.upper,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Level of messages about individual files",
+    )
+    parser.add_argument(
+        "--events-log",
+        type=str,
+        default=None,
+        help="Write events of every file to this file as JSON lines",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Report the throughput and the time left periodically",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10,
+        metavar="SECONDS",
+        help="Seconds between reports of the progress",
+    )
+    parser.add_argument(
+        "--status-file",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Write the progress to this file as JSON, replaced at every "
+        "report. Implies --progress",
+    )
     subcommands_parent_parser = argparse.ArgumentParser(add_help=False)
     subcommands_parent_parser.add_argument(
         "-r", action="store_true", help="Rename files recursively"
@@ -196,6 +337,60 @@ if __name__ == "__main__":
         action="store_true",
         help="Not to process files with names that have already matched the naming format",
     )
+    subcommands_parent_parser.add_argument(
+        "--organize",
+        type=str,
+        default=None,
+        help="Move files into directories named by this template. Example: \"/mnt/archive/%%Y/%%m\"",
+    )
+    subcommands_parent_parser.add_argument(
+        "--mirror",
+        type=str,
+        default=None,
+        help="Keep the files untouched, and build the renamed tree in this directory with hard links, reflinks or copies",
+    )
+    subcommands_parent_parser.add_argument(
+        "--exclude",
+        dest="patterns",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Exclude files and directories matching this gitignore-style "
+        "pattern, in addition to those in the configuration file",
+    )
+    subcommands_parent_parser.add_argument(
+        "--include",
+        dest="patterns",
+        action="append",
+        type=lambda i: "!" + i,
+        metavar="PATTERN",
+        help="Include files and directories matching this gitignore-style "
+        "pattern, even if excluded by the patterns before it",
+    )
+    subcommands_parent_parser.add_argument(
+        "--skip-hidden-directories",
+        action="store_true",
+        help="Do not visit directories whose names start with \".\"",
+    )
+    subcommands_parent_parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Record the states of directories in this file, so that directories unchanged since the last run are not listed again",
+    )
+    subcommands_parent_parser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        default=1,
+        help="Number of files processed at the same time",
+    )
+    subcommands_parent_parser.add_argument(
+        "--order",
+        choices=["lexical", "inode", "extent"],
+        default="lexical",
+        help="Order in which files of a directory are read. Files are "
+        "renamed in the lexical order anyway",
+    )
     subcommands_parent_parser.add_argument(
         "src",
         type=str,
@@ -210,59 +405,81 @@ if __name__ == "__main__":
         action="store_true",
         help="Not to process media files",
     )
-    rename_media_files_subparser = subparser.add_parser(
-        "media", parents=[subcommands_parent_parser]
-    )
-    rename_media_files_subparser.add_argument(
+    # Options of the subcommands renaming media files
+    media_options_parent_parser = argparse.ArgumentParser(add_help=False)
+    media_options_parent_parser.add_argument(
         "--use-exiftool-on-images",
         action=argparse.BooleanOptionalAction,
         default=None,
         type=bool,
         help="Use exiftool to get Exif data from images",
     )
+    media_options_parent_parser.add_argument(
+        "--metadata-from",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Use the metadata in this output of \"exiftool -j\" (a JSON "
+        "array or JSON lines) instead of running exiftool, for files which "
+        "are unchanged since",
+    )
+    media_options_parent_parser.add_argument(
+        "--metadata-base",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="Directory that relative paths in the metadata file are "
+        "relative to. Defaults to the current directory",
+    )
+    subparser.add_parser(
+        "media",
+        parents=[subcommands_parent_parser, media_options_parent_parser],
+    )
+    subparser.add_parser(
+        "auto",
+        parents=[subcommands_parent_parser, media_options_parent_parser],
+    )
+    audit_subparser = subparser.add_parser(
+        "audit",
+        parents=[subcommands_parent_parser, media_options_parent_parser],
+    )
+    audit_subparser.add_argument(
+        "--audit-log",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Record the files verified in this file, so that files "
+        "unchanged since are not checked again",
+    )
+    rename_service_subparser = subparser.add_parser("serve")
+    rename_service_subparser.add_argument(
+        "--socket",
+        type=str,
+        required=True,
+        help="Path of the Unix domain socket to listen on",
+    )
+    rename_service_subparser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        default=4,
+        help="Maximum number of requests processed at the same time",
+    )
     cli_args = parser.parse_args()
 
     config_file = json.load(open(cli_args.config_file))
 
-    logging.basicConfig(
-        format=(
-            "%(asctime)s %(levelname).1s %(name)s %(message)s"
-            if config_file.get("debug_mode", None) is True
-            else "%(message)s"
-        ),
-        datefmt="%Y-%m-%dT%H:%M:%S%z",
+    debug_mode = config_file.get("debug_mode", None) is True
+    log_listener = tracing.setup_logging(
         level=(
-            logging.DEBUG
-            if config_file.get("debug_mode", None) is True
-            else logging.INFO
+            logging.getLevelName(cli_args.log_level)
+            if cli_args.log_level is not None
+            else logging.DEBUG if debug_mode else logging.INFO
         ),
+        file_level=logging.getLevelName(cli_args.file_log_level),
+        verbose_format=debug_mode,
+        events_log_path=cli_args.events_log,
     )
-
-    media_file.MediaFileInfo.editing_softwares_keywords = config_file.get(
-        "editing_softwares_keywords", []
-    )
-    date_and_time_type_to_value_mapping = {
-        media_file.media_file_info.DateAndTimeType(k): v
-        for k, v in config_file.get("media", {})
-        .get("DateAndTimeType", {})
-        .items()
-    }
-    media_file.MediaFileNameFormatter.update_date_and_time_type_to_value_mapping(
-        mapping=date_and_time_type_to_value_mapping
-    )
-    media_file.MediaFileNameFormatter.set_regex_of_format_code(
-        format_code=r"{dtt}",
-        choices=date_and_time_type_to_value_mapping.values(),
-    )
-    edit_type_to_value_mapping = {
-        media_file.media_file_info.EditType(k): v
-        for k, v in config_file.get("media", {}).get("EditType", {}).items()
-    }
-    media_file.MediaFileNameFormatter.update_edit_type_to_value_mapping(
-        mapping=edit_type_to_value_mapping
-    )
-    media_file.MediaFileNameFormatter.set_regex_of_format_code(
-        format_code=r"{et}", choices=edit_type_to_value_mapping.values()
-    )
-
-    main(cli_args=cli_args, config_file=config_file)
+    try:
+        main(cli_args=cli_args, config_file=config_file)
+    finally:
+        log_listener.stop()
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+import textwrap
+
+import pytest
+
+from rename_file_by_time_info import external_program
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Uses a Python script")
+def test_execute_with_undecodable_file_name(tmp_path):
+    # An exiftool which echoes the names of files and their charset
+    executable_path = tmp_path / "exiftool"
+    executable_path.write_text(
+        "#!{}\n".format(sys.executable) + textwrap.dedent(r"""
+            import os, sys
+
+            arguments = []
+            for line in sys.stdin.buffer:
+                line = line.rstrip(b"\n")
+                if not line.startswith(b"-execute"):
+                    arguments.append(line)
+                    continue
+                sys.stdout.buffer.write(
+                    b'[{"SourceFile": "%s", "Exists": %s, "Charset": "%s"}]\n'
+                    % (
+                        arguments[-1],
+                        b"true" if os.path.exists(arguments[-1]) else b"false",
+                        arguments[1] if arguments[0] == b"-charset" else b"",
+                    )
+                )
+                sys.stdout.buffer.write(b"{ready%s}\n" % line[8:])
+                sys.stdout.buffer.flush()
+                arguments = []
+            """)
+    )
+    executable_path.chmod(0o755)
+    file_path = os.fsdecode(os.fsencode(str(tmp_path)) + b"/\xff.jpg")
+    try:
+        open(file_path, "wb").close()
+    except OSError:
+        pytest.skip("Names of files have to be valid on this file system")
+
+    with external_program.ExiftoolProcess(
+        executable=str(executable_path)
+    ) as exiftool_process:
+        output = exiftool_process.execute(arguments=["-j", file_path])
+    exif_data = json.loads(output)[0]
+    assert exif_data["SourceFile"] == file_path
+    assert exif_data["Exists"] is True
+    if sys.getfilesystemencoding() == "utf-8":
+        assert exif_data["Charset"] == "filename=utf8"
@@ -0,0 +1,53 @@
+import datetime
+import pickle
+
+from rename_file_by_time_info import general_file, media_file
+from rename_file_by_time_info.media_file.media_file_info import (
+    DateAndTimeType,
+    EditType,
+)
+
+
+def test_contexts_side_by_side():
+    contexts = [
+        general_file.ConfigContext.from_config(
+            config_file={
+                "media": {
+                    "DateAndTimeType": {"AUTHENTIC": i},
+                    "EditType": {"ORIGINAL": "orig"},
+                }
+            }
+        )
+        for i in ["a", "real"]
+    ]
+    file_names = [
+        media_file.MediaFileNameFormatter(
+            year=2024,
+            month=1,
+            day=2,
+            hour=3,
+            minute=4,
+            second=5,
+            millisecond=0,
+            timezone=datetime.timezone.utc,
+            date_and_time_type=DateAndTimeType.AUTHENTIC,
+            edit_type=EditType.ORIGINAL,
+            context=context,
+        ).get_formatted_filename(naming_format="%Y%m%d_%{dtt}_%{et}")
+        for context in contexts
+    ]
+    assert file_names == ["20240102_a_orig", "20240102_real_orig"]
+    assert general_file.helper.file_name_matches_file_format(
+        file_name_formatter=media_file.MediaFileNameFormatter,
+        file_name="20240102_real_orig_0001",
+        naming_format="%Y%m%d_%{dtt}_%{et}",
+        context=contexts[1],
+    )
+    assert not general_file.helper.file_name_matches_file_format(
+        file_name_formatter=media_file.MediaFileNameFormatter,
+        file_name="20240102_real_orig",
+        naming_format="%Y%m%d_%{dtt}_%{et}",
+        context=contexts[0],
+    )
+
+    assert pickle.loads(pickle.dumps(contexts[1])) == contexts[1]
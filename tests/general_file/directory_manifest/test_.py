@@ -0,0 +1,98 @@
+import datetime
+import errno
+import json
+import os
+import stat
+
+import pytest
+
+import rename_file_by_time_info
+from rename_file_by_time_info import general_file
+
+CONFIG_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "config.json"
+)
+
+
+def test_unchanged_directories_are_not_listed(tmp_path):
+    src = tmp_path.joinpath("src")
+    for relative_path in ["a.txt", "b/c.txt", "b/d/e.txt", "f/g.txt"]:
+        path = src.joinpath(relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    manifest_path = str(tmp_path.joinpath("manifest.json"))
+
+    def list_files() -> list[str]:
+        manifest = general_file.DirectoryManifest.load(
+            path=manifest_path, fingerprint="1"
+        )
+        files_paths = list(
+            general_file.FileInventory(
+                src=str(src), recursive=True, manifest=manifest
+            )
+        )
+        manifest.save(path=manifest_path)
+        return [os.path.relpath(i, str(src)) for i in files_paths]
+
+    assert len(list_files()) == 4
+    assert list_files() == []
+    # Only directories changed by other programs are listed again
+    os.rename(src.joinpath("f", "g.txt"), src.joinpath("f", "h.txt"))
+    src.joinpath("b", "d", "i.txt").write_text("")
+    assert list_files() == [
+        os.path.join("b", "d", "e.txt"),
+        os.path.join("b", "d", "i.txt"),
+        os.path.join("f", "h.txt"),
+    ]
+    assert list_files() == []
+
+
+def test_renamed_directories_are_not_listed(tmp_path, monkeypatch):
+    fcntl = pytest.importorskip("fcntl")
+    original_flock = fcntl.flock
+
+    def flock(fd, operation):
+        # As on NFS, so that lock files are created by renames
+        if stat.S_ISDIR(os.fstat(fd).st_mode):
+            raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+        return original_flock(fd, operation)
+
+    monkeypatch.setattr(fcntl, "flock", flock)
+    src = tmp_path.joinpath("src")
+    for relative_path in ["d1/a.txt", "d1/b.txt", "d2/c.txt"]:
+        path = src.joinpath(relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    manifest_path = str(tmp_path.joinpath("manifest.json"))
+
+    def rename_files() -> list[str]:
+        manifest = general_file.DirectoryManifest.load(
+            path=manifest_path, fingerprint="1"
+        )
+        with rename_file_by_time_info.RenameSession(
+            config_file=json.load(open(CONFIG_FILE_PATH)),
+            options=rename_file_by_time_info.RenameOptions(
+                forced_offset_time="+08:00",
+                forced_date=datetime.date(2023, 9, 25),
+                skip_files_with_formatted_names=True,
+            ),
+        ) as session:
+            results = list(
+                session.rename(
+                    files_paths=general_file.FileInventory(
+                        src=str(src), recursive=True, manifest=manifest
+                    ),
+                    mode="general",
+                )
+            )
+        for result in results:
+            if result.status == rename_file_by_time_info.RenameStatus.RENAMED:
+                manifest.add_moved_file(
+                    file_path=result.source, new_file_path=result.target
+                )
+        manifest.save(path=manifest_path)
+        return [os.path.relpath(i.source, str(src)) for i in results]
+
+    assert len(rename_files()) == 3
+    assert src.joinpath("d1", general_file.helper.LOCK_FILE_NAME).exists()
+    assert rename_files() == []
@@ -0,0 +1,70 @@
+import os
+
+from rename_file_by_time_info import general_file
+
+
+def test_iteration_order_matches_sorted_paths(tmp_path):
+    for relative_path in [
+        "b.txt",
+        "a-b/c.txt",
+        "a/z.txt",
+        "a/b/d.txt",
+        "a/b.txt",
+        "a.txt",
+        "c/e/f.txt",
+    ]:
+        path = tmp_path.joinpath(relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    tmp_path.joinpath("empty").mkdir()
+
+    expected_files_paths = []
+    for root, _, files in os.walk(str(tmp_path)):
+        expected_files_paths.extend([os.path.join(root, f) for f in files])
+    expected_files_paths.sort()
+
+    inventory = general_file.FileInventory(src=str(tmp_path), recursive=True)
+    assert list(inventory) == expected_files_paths
+    assert len(inventory.directories) == 7
+
+
+def test_non_recursive_iteration(tmp_path):
+    tmp_path.joinpath("b.txt").write_text("")
+    tmp_path.joinpath("a.txt").write_text("")
+    tmp_path.joinpath("c").mkdir()
+    tmp_path.joinpath("c", "d.txt").write_text("")
+
+    inventory = general_file.FileInventory(src=str(tmp_path))
+    assert list(inventory) == [
+        os.path.join(str(tmp_path), "a.txt"),
+        os.path.join(str(tmp_path), "b.txt"),
+    ]
+
+
+def test_pruning(tmp_path):
+    for relative_path in ["a.txt", "@eaDir/b.txt", "c/.git/d.txt", "c/e.tmp"]:
+        path = tmp_path.joinpath(relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+
+    inventory = general_file.FileInventory(
+        src=str(tmp_path),
+        recursive=True,
+        path_filter=general_file.PathFilter(
+            patterns=["@eaDir/", "*.tmp"], skip_hidden_directories=True
+        ),
+    )
+    assert list(inventory) == [os.path.join(str(tmp_path), "a.txt")]
+    assert inventory.pruned_directories_count == 2
+    assert inventory.excluded_files_count == 1
+
+
+def test_count_files(tmp_path):
+    for relative_path in ["a.txt", "b/c.txt", "b/d.txt", "e/f/g.txt"]:
+        path = tmp_path.joinpath(relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+
+    inventory = general_file.FileInventory(src=str(tmp_path), recursive=True)
+    assert sum(inventory.count_files()) == 4
+    assert inventory.directories == []
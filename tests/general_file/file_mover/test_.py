@@ -0,0 +1,192 @@
+import errno
+import os
+import stat
+
+import pytest
+
+from rename_file_by_time_info import general_file
+
+
+def test_move_into_new_directory(tmp_path):
+    tmp_path.joinpath("a.jpg").write_text("a")
+    tmp_path.joinpath("a.xmp").write_text("b")
+    new_directory = tmp_path.joinpath("2023", "09")
+    new_directory.mkdir(parents=True)
+    new_directory.joinpath("c.xmp").write_text("c")
+
+    new_files_paths = general_file.FileMover().move(
+        files_paths=[str(tmp_path.joinpath(i)) for i in ["a.jpg", "a.xmp"]],
+        new_files_paths=[
+            str(new_directory.joinpath(i)) for i in ["c.jpg", "c.xmp"]
+        ],
+    )
+    assert new_files_paths == [
+        str(new_directory.joinpath(i)) for i in ["c_0001.jpg", "c_0001.xmp"]
+    ]
+    assert sorted(os.listdir(tmp_path)) == ["2023"]
+    assert new_directory.joinpath("c_0001.xmp").read_text() == "b"
+
+
+def test_move_file_without_extension(tmp_path):
+    tmp_path.joinpath("a").write_text("a")
+    tmp_path.joinpath("b").write_text("b")
+
+    new_files_paths = general_file.FileMover().move(
+        files_paths=[str(tmp_path.joinpath("a"))],
+        new_files_paths=[str(tmp_path.joinpath("b"))],
+    )
+    assert new_files_paths == [str(tmp_path.joinpath("b_0001"))]
+    assert sorted(os.listdir(tmp_path)) == ["b", "b_0001"]
+    assert general_file.helper.modify_file_path_until_no_duplication_exists(
+        file_path=str(tmp_path.joinpath("b"))
+    ) == str(tmp_path.joinpath("b_0002"))
+
+
+def test_copy_file(tmp_path):
+    file_path = tmp_path.joinpath("a.bin")
+    file_path.write_bytes(os.urandom(3 * 1024 * 1024 + 1))
+    os.utime(file_path, (1600000000, 1600000000))
+    new_file_path = tmp_path.joinpath("b.bin")
+
+    general_file.helper.copy_file(
+        file_path=str(file_path), new_file_path=str(new_file_path)
+    )
+    assert new_file_path.read_bytes() == file_path.read_bytes()
+    assert os.stat(new_file_path).st_mtime == 1600000000
+
+
+def test_link_incrementally(tmp_path):
+    tmp_path.joinpath("src").mkdir()
+    file_path = str(tmp_path.joinpath("src", "a.txt"))
+    open(file_path, "w").write("a")
+    new_file_path = str(tmp_path.joinpath("dest", "b.txt"))
+    file_mover = general_file.FileMover()
+
+    assert file_mover.link(
+        files_paths=[file_path], new_files_paths=[new_file_path]
+    ) == [new_file_path]
+    assert os.path.samefile(file_path, new_file_path)
+    assert (
+        file_mover.link(
+            files_paths=[file_path], new_files_paths=[new_file_path]
+        )
+        is None
+    )
+    assert os.listdir(tmp_path.joinpath("dest")) == ["b.txt"]
+
+
+def test_link_files_of_same_size_and_modified_time(tmp_path):
+    tmp_path.joinpath("src").mkdir()
+    files_paths = []
+    for file_name, content in [("a.jpg", "a"), ("b.jpg", "b")]:
+        file_path = str(tmp_path.joinpath("src", file_name))
+        open(file_path, "w").write(content)
+        os.utime(file_path, ns=(0, 0))
+        files_paths.append(file_path)
+    new_file_path = str(tmp_path.joinpath("dest", "c.jpg"))
+    file_mover = general_file.FileMover()
+
+    for file_path in files_paths:
+        file_mover.link(
+            files_paths=[file_path], new_files_paths=[new_file_path]
+        )
+    assert sorted(os.listdir(tmp_path.joinpath("dest"))) == [
+        "c.jpg",
+        "c_0001.jpg",
+    ]
+    assert general_file.helper.is_same_file_content(
+        file_path=files_paths[1],
+        other_file_path=str(tmp_path.joinpath("dest", "c_0001.jpg")),
+    )
+
+
+def test_lock_timeout(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    file_path = str(tmp_path.joinpath("a.txt"))
+    open(file_path, "w").write("a")
+    file_mover = general_file.FileMover(lock_timeout=0.1)
+
+    # Held by another open file description, as if by another process
+    fd = os.open(str(tmp_path), os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with pytest.raises(TimeoutError):
+            file_mover.move(
+                files_paths=[file_path],
+                new_files_paths=[str(tmp_path.joinpath("b.txt"))],
+            )
+    finally:
+        os.close(fd)
+    file_mover.move(
+        files_paths=[file_path],
+        new_files_paths=[str(tmp_path.joinpath("b.txt"))],
+    )
+    assert file_mover.lock_statistics.timeouts == 1
+    assert file_mover.lock_statistics.acquisitions == 1
+
+
+def test_rename_to_lock_timeout(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    file_path = str(tmp_path.joinpath("a.txt"))
+    open(file_path, "w").write("a")
+    new_file_path = str(tmp_path.joinpath("b.txt"))
+
+    fd = os.open(str(tmp_path), os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with pytest.raises(TimeoutError):
+            general_file.helper.rename_to(
+                file_path=file_path,
+                new_file_path=new_file_path,
+                lock_timeout=0.1,
+            )
+    finally:
+        os.close(fd)
+    assert (
+        general_file.helper.rename_to(
+            file_path=file_path, new_file_path=new_file_path
+        )
+        == new_file_path
+    )
+
+
+def test_lock_file(tmp_path, monkeypatch, caplog):
+    fcntl = pytest.importorskip("fcntl")
+    file_path = str(tmp_path.joinpath("a.txt"))
+    open(file_path, "w").write("a")
+    original_flock = fcntl.flock
+
+    def flock(fd, operation):
+        # As on NFS, which only locks files open for writing
+        if stat.S_ISDIR(os.fstat(fd).st_mode):
+            raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+        return original_flock(fd, operation)
+
+    monkeypatch.setattr(fcntl, "flock", flock)
+    general_file.FileMover().move(
+        files_paths=[file_path],
+        new_files_paths=[str(tmp_path.joinpath("b.txt"))],
+    )
+    assert sorted(os.listdir(tmp_path)) == [
+        general_file.helper.LOCK_FILE_NAME,
+        "b.txt",
+    ]
+    assert "not locked out of other processes" not in caplog.text
+
+
+def test_lock_unsupported(tmp_path, monkeypatch, caplog):
+    fcntl = pytest.importorskip("fcntl")
+    file_path = str(tmp_path.joinpath("a.txt"))
+    open(file_path, "w").write("a")
+
+    def flock(fd, operation):
+        # As on an NFS mount without a lock manager
+        raise OSError(errno.ENOLCK, os.strerror(errno.ENOLCK))
+
+    monkeypatch.setattr(fcntl, "flock", flock)
+    general_file.FileMover().move(
+        files_paths=[file_path],
+        new_files_paths=[str(tmp_path.joinpath("b.txt"))],
+    )
+    assert tmp_path.joinpath("b.txt").exists()
+    assert "not locked out of other processes" in caplog.text
@@ -20,3 +20,47 @@ def test_get_formatted_filename():
         )
         == "^65430210120304567+0800%"
     )
+
+
+def test_parse():
+    formatter = general_file.FileNameFormatter.parse(
+        file_name="^65430210120304567-0130%_0001",
+        naming_format=r"^%Y%m%d%H%M%S%{ms}%z%%",
+    )
+    assert formatter.get_date_and_time() == datetime.datetime(
+        6543,
+        2,
+        10,
+        12,
+        3,
+        4,
+        567000,
+        tzinfo=datetime.timezone(
+            offset=-datetime.timedelta(hours=1, minutes=30)
+        ),
+    )
+    assert (
+        general_file.FileNameFormatter.parse(
+            file_name="65430210", naming_format=r"^%Y%m%d"
+        )
+        is None
+    )
+    # Repeated format codes have to agree
+    assert general_file.FileNameFormatter.parse(
+        file_name="2023/09/2023", naming_format=r"%Y/%m/%Y"
+    ) == general_file.FileNameFormatter(
+        year=2023,
+        month=9,
+        day=None,
+        hour=None,
+        minute=None,
+        second=None,
+        millisecond=None,
+        timezone=None,
+    )
+    assert (
+        general_file.FileNameFormatter.parse(
+            file_name="2023/09/2024", naming_format=r"%Y/%m/%Y"
+        )
+        is None
+    )
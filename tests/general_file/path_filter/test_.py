@@ -0,0 +1,37 @@
+from rename_file_by_time_info import general_file
+
+
+def test_is_excluded():
+    path_filter = general_file.PathFilter(
+        patterns=[
+            "# Comment",
+            "@eaDir/",
+            "*.lrdata/",
+            "/cache",
+            "**/tmp/*.jpg",
+            "*.xmp",
+            "!keep.xmp",
+        ],
+        skip_hidden_directories=True,
+    )
+    for relative_path, is_directory, is_excluded in [
+        ("@eaDir", True, True),
+        ("a/@eaDir", True, True),
+        ("@eaDir", False, False),
+        ("a/Catalog Previews.lrdata", True, True),
+        ("cache", True, True),
+        ("a/cache", True, False),
+        ("tmp/a.jpg", False, True),
+        ("a/b/tmp/a.jpg", False, True),
+        ("a/tmp/b/a.jpg", False, False),
+        ("a/b.xmp", False, True),
+        ("a/keep.xmp", False, False),
+        ("a/.git", True, True),
+        ("a/.hidden.jpg", False, False),
+    ]:
+        assert (
+            path_filter.is_excluded(
+                relative_path=relative_path, is_directory=is_directory
+            )
+            is is_excluded
+        ), relative_path
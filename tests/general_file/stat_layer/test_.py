@@ -0,0 +1,30 @@
+import os
+
+from rename_file_by_time_info.general_file import stat_layer
+
+
+def test_stat_with_cache(tmp_path):
+    file_path = str(tmp_path.joinpath("a.txt"))
+    with open(file_path, "w") as f:
+        f.write("a")
+    layer = stat_layer.StatLayer(use_statx=True)
+    file_status = layer.stat(file_path)
+    expected_file_status = os.stat(file_path)
+    for field in ["st_mode", "st_ino", "st_dev", "st_size", "st_mtime_ns"]:
+        assert getattr(file_status, field) == getattr(
+            expected_file_status, field
+        )
+    assert layer.stat(file_path) is file_status
+    assert layer.statistics == stat_layer.StatStatistics(
+        fetches=1, cache_hits=1
+    )
+
+    new_file_path = str(tmp_path.joinpath("b.txt"))
+    os.rename(file_path, new_file_path)
+    layer.invalidate(file_path, new_file_path)
+    assert not layer.is_file(file_path)
+    assert layer.is_file(new_file_path)
+    # Paths not found are not cached
+    assert layer.statistics.fetches == 3
+    assert not layer.is_file(file_path)
+    assert layer.statistics.fetches == 4
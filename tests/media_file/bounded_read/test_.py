@@ -0,0 +1,34 @@
+import os
+
+from rename_file_by_time_info import media_file
+
+
+def test_read_head_and_tail(tmp_path):
+    file_path = tmp_path / "a.mov"
+    content = os.urandom(10 * 1024)
+    file_path.write_bytes(content)
+    bounded_reader = media_file.bounded_read.BoundedReader(
+        limits=media_file.bounded_read.BoundedReadLimits(
+            head_kibibytes=2, tail_kibibytes=1, directory=str(tmp_path)
+        )
+    )
+
+    with bounded_reader.read(
+        file_path=str(file_path), file_size=len(content)
+    ) as copy_path:
+        copy = open(copy_path, "rb").read()
+        assert copy_path.endswith(".mov")
+    assert len(copy) == len(content)
+    assert copy[:2048] == content[:2048]
+    assert copy[-1024:] == content[-1024:]
+    assert copy[2048:-1024] == bytes(len(content) - 3072)
+    assert not os.path.exists(copy_path)
+    assert bounded_reader.should_read_fully(
+        file_size=len(content), is_authentic=False
+    )
+    assert not bounded_reader.should_read_fully(
+        file_size=3072, is_authentic=False
+    )
+    assert "3.0 KiB read per file, 1 full" in (
+        bounded_reader.get_summary_lines()[0]
+    )
@@ -0,0 +1,95 @@
+import datetime
+
+from rename_file_by_time_info import media_file
+from rename_file_by_time_info.media_file import Extractor
+
+
+def test_get_extractors():
+    extractor_chain = media_file.ExtractorChain(
+        chains_by_extension={"PNG": [Extractor.FILE_STATUS, Extractor.PILLOW]}
+    )
+    extractor_chain.disable(extractor=Extractor.EXIFTOOL)
+    assert extractor_chain.get_extractors(
+        media_type="image", file_extension="jpg"
+    ) == [Extractor.PILLOW, Extractor.FILE_STATUS]
+    assert extractor_chain.get_extractors(
+        media_type="image", file_extension="png"
+    ) == [Extractor.PILLOW, Extractor.FILE_STATUS]
+
+
+def test_skip_after_misses():
+    extractor_chain = media_file.ExtractorChain(
+        skip_after_misses=2, probe_interval=3
+    )
+    kwargs = dict(
+        directory="a", file_extension="png", extractor=Extractor.EXIFTOOL
+    )
+    decisions = []
+    for _ in range(8):
+        is_skipped = extractor_chain.should_skip(**kwargs)
+        decisions.append(is_skipped)
+        if not is_skipped:
+            extractor_chain.record(is_hit=False, **kwargs)
+    assert decisions == [False, False, True, True, False, True, True, False]
+
+    # A hit stops the extractor from being skipped again
+    extractor_chain.record(is_hit=True, is_authentic=True, **kwargs)
+    assert extractor_chain.should_skip(**kwargs) is False
+    assert (
+        extractor_chain.should_skip(
+            directory="b", file_extension="png", extractor=Extractor.EXIFTOOL
+        )
+        is False
+    )
+
+
+def test_leave_directory():
+    extractor_chain = media_file.ExtractorChain(
+        skip_after_misses=1, summary_directories_count=1
+    )
+    for directory, files_count in [("a", 3), ("b", 4), ("c", 2)]:
+        kwargs = dict(
+            directory=directory,
+            file_extension="png",
+            extractor=Extractor.EXIFTOOL,
+        )
+        for _ in range(files_count):
+            if not extractor_chain.should_skip(**kwargs):
+                extractor_chain.record(is_hit=False, **kwargs)
+        extractor_chain.leave_directory(directory=directory)
+    assert extractor_chain._statistics == {}
+    assert extractor_chain.get_summary_lines()[:2] == [
+        "Extractor exiftool: 0 hit(s) (0 authentic) in 3 attempt(s), "
+        "6 skip(s), 0 failure(s)",
+        'Skipped exiftool on 3 "png" file(s) in b (0 probe(s))',
+    ]
+
+
+def test_last_authentic_extractor_is_not_skipped(tmp_path):
+    class ImageInfo(media_file.image_info.ImageInfo):
+        @classmethod
+        def from_pil(cls, file_path):
+            if not file_path.endswith("exif.jpg"):
+                return None
+            return cls(
+                date_and_time_type=media_file.media_file_info.DateAndTimeType.AUTHENTIC,
+                date_and_time=datetime.datetime(
+                    2020, 1, 2, tzinfo=datetime.timezone.utc
+                ),
+            )
+
+    extractor_chain = media_file.ExtractorChain(skip_after_misses=2)
+    for file_name in ["a.jpg", "b.jpg", "c.jpg", "exif.jpg"]:
+        file_path = tmp_path / file_name
+        file_path.write_bytes(b"")
+        media_file_info, extractor = media_file.helper.extract_media_file_info(
+            file_path=str(file_path),
+            media_file_info_type=ImageInfo,
+            extractors=[Extractor.PILLOW, Extractor.FILE_STATUS],
+            extractor_chain=extractor_chain,
+        )
+    assert extractor == Extractor.PILLOW
+    assert (
+        media_file_info.date_and_time_type
+        == media_file.media_file_info.DateAndTimeType.AUTHENTIC
+    )
@@ -0,0 +1,38 @@
+from rename_file_by_time_info import media_file
+
+
+def test_group_files_by_prefix():
+    file_grouper = media_file.FileGrouper(
+        primary_file_extensions=["CR3", "HEIC", "JPG", "MOV"],
+        sidecar_file_extensions=["AAE", "XMP"],
+    )
+    groups = list(
+        file_grouper.group(
+            files_paths=[
+                "a/IMG_1.CR3",
+                "a/IMG_1.JPG",
+                "a/IMG_1.txt",
+                "a/IMG_1.xmp",
+                "a/IMG_2.AAE",
+                "a/IMG_2.HEIC",
+                "a/IMG_2.MOV",
+                "a/IMG_3.XMP",
+                "a/IMG_4.JPG",
+                "b/IMG_1.XMP",
+            ]
+        )
+    )
+    assert groups == [
+        media_file.FileGroup(
+            primary_file_path="a/IMG_1.CR3",
+            sidecar_files_paths=["a/IMG_1.JPG", "a/IMG_1.xmp"],
+        ),
+        media_file.FileGroup(primary_file_path="a/IMG_1.txt"),
+        media_file.FileGroup(
+            primary_file_path="a/IMG_2.HEIC",
+            sidecar_files_paths=["a/IMG_2.AAE", "a/IMG_2.MOV"],
+        ),
+        media_file.FileGroup(primary_file_path="a/IMG_3.XMP"),
+        media_file.FileGroup(primary_file_path="a/IMG_4.JPG"),
+        media_file.FileGroup(primary_file_path="b/IMG_1.XMP"),
+    ]
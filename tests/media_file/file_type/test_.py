@@ -0,0 +1,36 @@
+import pytest
+
+from rename_file_by_time_info import media_file
+
+
+@pytest.mark.parametrize(
+    "header, name, media_type",
+    [
+        (b"\xff\xd8\xff\xe1\x00\x18Exif", "JPEG", "image"),
+        (b"II*\x00\x08\x00\x00\x00", "TIFF", "image"),
+        (b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00", "HEIF", "image"),
+        (b"\x00\x00\x00\x18ftypcrx \x00\x00\x00\x01", "CR3", "image"),
+        (
+            b"\x00\x00\x00\x14ftypqt  \x00\x00\x00\x00",
+            "QuickTime",
+            "video_and_audio",
+        ),
+        (b"RIFF\x00\x00\x00\x00AVI LIST", "AVI", "video_and_audio"),
+        (b"\x00\x00\x00\x00\x47\x40\x00\x10", "MPEG-TS", "video_and_audio"),
+        (b"<?xpacket begin=", "XMP", "image"),
+        (b"", "empty", None),
+        (b"<!DOCTYPE html><html><head>", "text", None),
+    ],
+)
+def test_detect_file_type(header, name, media_type):
+    file_type = media_file.file_type.detect_file_type(header=header)
+    assert (file_type.name, file_type.media_type) == (name, media_type)
+
+
+def test_detect_unrecognized_file_type():
+    assert (
+        media_file.file_type.detect_file_type(header=b"\x00\x01\x02") is None
+    )
+    assert (
+        media_file.file_type.detect_file_type(header=b"<?xml version=") is None
+    )
@@ -0,0 +1,75 @@
+import datetime
+import json
+import os
+
+from rename_file_by_time_info import media_file
+from rename_file_by_time_info.media_file import Extractor
+
+
+def test_metadata_from_index(tmp_path):
+    file_path = tmp_path / "a.jpg"
+    file_path.write_bytes(b"")
+    os.utime(file_path, (1700000000, 1700000000))
+    stale_file_path = tmp_path / "b.jpg"
+    stale_file_path.write_bytes(b"")
+    file_modify_date = datetime.datetime.fromtimestamp(
+        1700000000, tz=datetime.timezone.utc
+    ).strftime("%Y:%m:%d %H:%M:%S+00:00")
+    index_path = tmp_path / "index.json"
+    # Split across chunks of the stream parser
+    index_path.write_text(
+        json.dumps(
+            [
+                {
+                    "SourceFile": name,
+                    "FileModifyDate": file_modify_date,
+                    "FileSize": "0 bytes",
+                    "DateTimeOriginal": "2020:01:02 03:04:05",
+                    "ThumbnailImage": "x" * 100,
+                }
+                for name in ["a.jpg", "b.jpg"]
+            ]
+        )
+    )
+
+    metadata_index = media_file.MetadataIndex(
+        path=str(index_path), base_directory=str(tmp_path)
+    )
+    assert len(metadata_index) == 2
+    media_file_info, extractor = media_file.helper.extract_media_file_info(
+        file_path=str(file_path),
+        media_file_info_type=media_file.image_info.ImageInfo,
+        extractors=[Extractor.EXIFTOOL, Extractor.FILE_STATUS],
+        metadata_index=metadata_index,
+    )
+    assert extractor == Extractor.EXIFTOOL
+    assert media_file_info.date_and_time == datetime.datetime(
+        2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc
+    )
+    # Modified since, so exiftool is skipped by `extractors` here
+    _, extractor = media_file.helper.extract_media_file_info(
+        file_path=str(stale_file_path),
+        media_file_info_type=media_file.image_info.ImageInfo,
+        extractors=[Extractor.FILE_STATUS],
+        metadata_index=metadata_index,
+    )
+    assert extractor == Extractor.FILE_STATUS
+    assert (
+        metadata_index.get(
+            file_path=str(stale_file_path),
+            file_status=os.stat(stale_file_path),
+        )
+        is None
+    )
+
+
+def test_iterate_json_lines(tmp_path):
+    path = tmp_path / "index.jsonl"
+    path.write_text('{"a": "x"}\n{"a": "' + "y" * 50 + '"}\n')
+    with open(path) as f:
+        assert [
+            i["a"]
+            for i in media_file.metadata_index._iterate_json_values(
+                f=f, chunk_size=16
+            )
+        ] == ["x", "y" * 50]
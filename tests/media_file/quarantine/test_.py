@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from rename_file_by_time_info import external_program, media_file
+from rename_file_by_time_info.media_file import Extractor
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Uses a shell script")
+def test_quarantine_after_timeout(tmp_path):
+    # An exiftool which never responds
+    executable_path = tmp_path / "exiftool"
+    executable_path.write_text("#!/bin/sh\nexec sleep 60\n")
+    executable_path.chmod(0o755)
+    file_path = tmp_path / "a.jpg"
+    file_path.write_bytes(b"")
+    quarantine_path = tmp_path / "quarantine.json"
+
+    with external_program.ExiftoolProcess(
+        executable=str(executable_path)
+    ) as exiftool_process:
+        extractor_chain = media_file.ExtractorChain(
+            exiftool_process=exiftool_process,
+            limits={
+                Extractor.EXIFTOOL: media_file.ExtractorLimits(
+                    timeout_seconds=0.2
+                )
+            },
+            retries=1,
+            quarantine=media_file.Quarantine(path=str(quarantine_path)),
+        )
+        _, extractor = media_file.helper.extract_media_file_info(
+            file_path=str(file_path),
+            media_file_info_type=media_file.image_info.ImageInfo,
+            extractors=[Extractor.EXIFTOOL, Extractor.FILE_STATUS],
+            extractor_chain=extractor_chain,
+        )
+        assert extractor == Extractor.FILE_STATUS
+        assert "1 failure(s)" in extractor_chain.get_summary_lines()[0]
+
+    # Later runs skip exiftool for the file, even after it is renamed
+    new_file_path = tmp_path / "b.jpg"
+    os.rename(file_path, new_file_path)
+    quarantine = media_file.Quarantine(path=str(quarantine_path))
+    (entry,) = json.loads(quarantine_path.read_text())["files"].values()
+    assert entry["extractors"].keys() == {"exiftool"}
+    start_time = time.monotonic()
+    _, extractor = media_file.helper.extract_media_file_info(
+        file_path=str(new_file_path),
+        media_file_info_type=media_file.image_info.ImageInfo,
+        extractors=[Extractor.EXIFTOOL, Extractor.FILE_STATUS],
+        extractor_chain=media_file.ExtractorChain(
+            exiftool_process=exiftool_process,
+            limits={
+                Extractor.EXIFTOOL: media_file.ExtractorLimits(
+                    timeout_seconds=0.2
+                )
+            },
+            quarantine=quarantine,
+        ),
+    )
+    assert extractor == Extractor.FILE_STATUS
+    assert time.monotonic() - start_time < 0.2
+
+
+def test_quarantine_after_pillow_timeout(tmp_path):
+    is_released = threading.Event()
+    calls = []
+
+    class HangingImageInfo(media_file.image_info.ImageInfo):
+        @classmethod
+        def from_pil(cls, file_path):
+            calls.append(file_path)
+            is_released.wait(timeout=10)
+            return None
+
+    extractor_chain = media_file.ExtractorChain(
+        limits={
+            Extractor.PILLOW: media_file.ExtractorLimits(
+                timeout_seconds=0.1, max_abandoned_threads=1
+            )
+        },
+        retries=1,
+    )
+    files_paths = []
+    for file_name in ["a.jpg", "b.jpg"]:
+        file_path = tmp_path / file_name
+        file_path.write_bytes(file_name.encode("utf-8"))
+        files_paths.append(str(file_path))
+    try:
+        for file_path in files_paths:
+            _, extractor = media_file.helper.extract_media_file_info(
+                file_path=file_path,
+                media_file_info_type=HangingImageInfo,
+                extractors=[Extractor.PILLOW, Extractor.FILE_STATUS],
+                extractor_chain=extractor_chain,
+            )
+            assert extractor == Extractor.FILE_STATUS
+        # Pillow is not retried on the first file, and is not run on the
+        # second one while the first thread is running
+        assert calls == files_paths[:1]
+        assert len(extractor_chain.quarantine) == 1
+        assert extractor_chain.abandoned_threads_count == 1
+    finally:
+        is_released.set()
+    for _ in range(100):
+        if extractor_chain.abandoned_threads_count == 0:
+            break
+        time.sleep(0.05)
+    assert extractor_chain.abandoned_threads_count == 0
@@ -0,0 +1,98 @@
+import datetime
+import os
+
+import pytest
+
+from rename_file_by_time_info import media_file
+from rename_file_by_time_info.media_file import Extractor
+
+
+def test_get_and_put(tmp_path):
+    if not media_file.XattrCache.is_available():
+        pytest.skip("Extended attributes are not available")
+    file_path = tmp_path / "a.jpg"
+    file_path.write_bytes(b"a")
+    media_file_info = media_file.image_info.ImageInfo(
+        date_and_time_type=media_file.media_file_info.DateAndTimeType.AUTHENTIC,
+        date_and_time=datetime.datetime(
+            2020,
+            1,
+            2,
+            3,
+            4,
+            5,
+            tzinfo=datetime.timezone(datetime.timedelta(hours=8)),
+        ),
+        suspected_editing_software_keywords=["Camera"],
+    )
+    xattr_cache = media_file.XattrCache()
+    xattr_cache.put(
+        file_path=str(file_path),
+        file_status=os.stat(file_path),
+        media_file_info=media_file_info,
+        extractor=Extractor.EXIFTOOL,
+    )
+    if xattr_cache.get_summary_lines()[0].endswith(
+        "1 device(s) without support"
+    ):
+        pytest.skip("Extended attributes are not supported")
+
+    # Renamed files keep their attributes
+    new_file_path = tmp_path / "b.jpg"
+    os.rename(file_path, new_file_path)
+    assert xattr_cache.get(
+        file_path=str(new_file_path),
+        file_status=os.stat(new_file_path),
+        media_file_info_type=media_file.image_info.ImageInfo,
+    ) == (media_file_info, Extractor.EXIFTOOL)
+    new_file_path.write_bytes(b"ab")
+    assert (
+        xattr_cache.get(
+            file_path=str(new_file_path),
+            file_status=os.stat(new_file_path),
+            media_file_info_type=media_file.image_info.ImageInfo,
+        )
+        is None
+    )
+    assert xattr_cache.get_summary_lines() == [
+        "Extended attributes: 1 hit(s), 1 stale, 1 written, 0 device(s) "
+        "without support"
+    ]
+
+
+def test_get_after_modification_within_a_second(tmp_path):
+    if not media_file.XattrCache.is_available():
+        pytest.skip("Extended attributes are not available")
+    file_path = tmp_path / "a.jpg"
+    file_path.write_bytes(b"a")
+    os.utime(file_path, ns=(1600000000_100000000, 1600000000_100000000))
+    xattr_cache = media_file.XattrCache()
+    xattr_cache.put(
+        file_path=str(file_path),
+        file_status=os.stat(file_path),
+        media_file_info=media_file.image_info.ImageInfo(
+            date_and_time_type=(
+                media_file.media_file_info.DateAndTimeType.AUTHENTIC
+            ),
+            date_and_time=datetime.datetime(
+                2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc
+            ),
+            suspected_editing_software_keywords=[],
+        ),
+        extractor=Extractor.EXIFTOOL,
+    )
+    if xattr_cache.get_summary_lines()[0].endswith(
+        "1 device(s) without support"
+    ):
+        pytest.skip("Extended attributes are not supported")
+
+    file_path.write_bytes(b"b")
+    os.utime(file_path, ns=(1600000000_200000000, 1600000000_200000000))
+    assert (
+        xattr_cache.get(
+            file_path=str(file_path),
+            file_status=os.stat(file_path),
+            media_file_info_type=media_file.image_info.ImageInfo,
+        )
+        is None
+    )
@@ -0,0 +1,38 @@
+import json
+import time
+
+import pytest
+
+from rename_file_by_time_info import progress
+
+
+def test_progress(tmp_path):
+    status_file_path = tmp_path / "status.json"
+    reporter = progress.ProgressReporter(
+        interval_seconds=60, status_file=str(status_file_path)
+    )
+    reporter.start(files_counts=[3, 1])
+    for _ in range(20):
+        if reporter._is_total_final:
+            break
+        time.sleep(0.01)
+    reporter.record(file_size=1000, timestamp_source="exiftool")
+    reporter.record(file_size=3000, timestamp_source="file_status")
+    reporter.record(file_size=None, timestamp_source=None)
+    snapshot = reporter.get_snapshot()
+    assert (snapshot.files_count, snapshot.total_files_count) == (3, 4)
+    assert snapshot.is_total_final
+    assert snapshot.bytes_count == 4000
+    assert snapshot.file_status_share == 0.5
+    assert set(snapshot.timestamp_sources_files_per_second) == {
+        "exiftool",
+        "file_status",
+    }
+    # 1 file left at the rate of 3 files so far
+    assert snapshot.eta_seconds == pytest.approx(snapshot.elapsed_seconds / 3)
+    assert snapshot.format().startswith("Progress: 3/4 file(s) (75.0%)")
+
+    reporter.stop()
+    status = json.loads(status_file_path.read_text())
+    assert status["files_count"] == 3
+    assert status["is_total_final"] is True
@@ -0,0 +1,57 @@
+import threading
+
+from rename_file_by_time_info import scheduling
+
+
+def test_cost_model():
+    cost_model = scheduling.CostModel()
+    assert cost_model.estimate(
+        file_extension="mp4", file_size=2048
+    ) > cost_model.estimate(file_extension="mp4", file_size=1024)
+    for file_size, seconds in [(1000, 1.0), (2000, 2.0), (3000, 3.0)]:
+        cost_model.record(
+            file_extension="MP4", file_size=file_size, seconds=seconds
+        )
+    assert (
+        abs(cost_model.estimate(file_extension="mp4", file_size=4000) - 4.0)
+        < 1e-9
+    )
+
+
+def test_cost_scheduler():
+    # The most expensive item is the last one, which is started first
+    costs = [1, 1, 1, 1, 5]
+    started_items = []
+    lock = threading.Lock()
+
+    def function(item: int) -> int:
+        with lock:
+            started_items.append(item)
+        return item * 10
+
+    scheduler = scheduling.CostScheduler()
+    assert list(
+        scheduler.map(
+            function=function,
+            items=range(len(costs)),
+            get_cost=costs.__getitem__,
+            jobs=2,
+        )
+    ) == [0, 10, 20, 30, 40]
+    assert started_items[0] == 4
+    assert scheduler.statistics.items_count == 5
+    assert scheduler.get_summary_lines()[0].startswith(
+        "Scheduling (cost-aware): 5 item(s) by 2 worker(s)"
+    )
+
+    scheduler = scheduling.CostScheduler(cost_aware=False)
+    started_items.clear()
+    list(
+        scheduler.map(
+            function=function,
+            items=range(len(costs)),
+            get_cost=costs.__getitem__,
+            jobs=1,
+        )
+    )
+    assert started_items == [0, 1, 2, 3, 4]
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+
+from rename_file_by_time_info import service
+
+CONFIG_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "config.json"
+)
+
+
+def test_plan_and_rename_requests(tmp_path):
+    for file_name in ["a.txt", "b.txt"]:
+        tmp_path.joinpath(file_name).write_text("")
+    files_paths = sorted(str(i) for i in tmp_path.iterdir())
+    # Paths of Unix domain sockets are limited to about 100 characters
+    socket_directory = tempfile.mkdtemp()
+    socket_path = os.path.join(socket_directory, "service.sock")
+    rename_service = service.RenameService(
+        config_file_path=CONFIG_FILE_PATH, socket_path=socket_path
+    )
+    thread = threading.Thread(target=rename_service.serve_forever)
+    thread.start()
+    try:
+        assert rename_service.wait_until_ready(timeout=10)
+        options = {"forced_offset_time": "+08:00", "forced_date": "2023-09-25"}
+
+        responses = list(
+            service.request(
+                socket_path=socket_path,
+                request={
+                    "action": "plan",
+                    "mode": "general",
+                    "paths": files_paths,
+                    "options": options,
+                },
+            )
+        )
+        assert [i.get("status", None) for i in responses] == [
+            "PLANNED",
+            "PLANNED",
+            None,
+        ]
+        assert responses[-1] == {"done": True, "count": 2}
+        assert sorted(os.listdir(tmp_path)) == ["a.txt", "b.txt"]
+
+        responses = list(
+            service.request(
+                socket_path=socket_path,
+                request={
+                    "action": "rename",
+                    "mode": "general",
+                    "paths": files_paths + [str(tmp_path.joinpath("c.txt"))],
+                    "options": options,
+                },
+            )
+        )
+        assert [i.get("status", None) for i in responses] == [
+            "RENAMED",
+            "RENAMED",
+            "FAILED",
+            None,
+        ]
+        assert responses[0]["target"] == str(
+            tmp_path.joinpath("2023-09-25T000000+0800.txt")
+        )
+
+        responses = list(
+            service.request(
+                socket_path=socket_path,
+                request={"action": "unknown", "paths": files_paths},
+            )
+        )
+        assert "error" in responses[0]
+
+        # Options of wrong types are reported, and the connection still works
+        responses = list(
+            service.request(
+                socket_path=socket_path,
+                request={
+                    "action": "plan",
+                    "paths": files_paths,
+                    "options": {"forced_date": 20230925},
+                },
+            )
+        )
+        assert "error" in responses[0]
+
+        rename_service.reload()
+    finally:
+        rename_service.shutdown()
+        thread.join()
+    assert not os.path.exists(socket_path)
+    os.rmdir(socket_directory)
+
+
+def test_reload_waits_for_requests(tmp_path):
+    tmp_path.joinpath("a.txt").write_text("")
+    rename_service = service.RenameService(
+        config_file_path=CONFIG_FILE_PATH,
+        socket_path=str(tmp_path.joinpath("service.sock")),
+    )
+    responses = rename_service.handle_request(
+        request={
+            "action": "plan",
+            "mode": "general",
+            "paths": [str(tmp_path.joinpath("a.txt"))],
+        }
+    )
+    assert next(responses)["status"] == "PLANNED"
+    thread = threading.Thread(target=rename_service.reload)
+    thread.start()
+    thread.join(timeout=0.2)
+    assert thread.is_alive()
+
+    responses.close()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    rename_service.session.close()
@@ -0,0 +1,344 @@
+import datetime
+import json
+import os
+import sys
+import textwrap
+import threading
+
+import pytest
+
+import rename_file_by_time_info
+
+CONFIG_FILE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "config.json"
+)
+
+
+def test_plan_and_apply(tmp_path):
+    for file_name in ["a.txt", "b.txt", ".hidden.txt"]:
+        tmp_path.joinpath(file_name).write_text("")
+    files_paths = sorted(str(i) for i in tmp_path.iterdir())
+    events = []
+    progress = []
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(
+            forced_offset_time="+08:00",
+            forced_date=datetime.date(2023, 9, 25),
+        ),
+        progress_callback=progress.append,
+        event_callback=events.append,
+    ) as session:
+        plan = list(session.plan(files_paths=files_paths, mode="general"))
+        assert [i.status for i in plan] == [
+            rename_file_by_time_info.RenameStatus.SKIPPED,
+            rename_file_by_time_info.RenameStatus.PLANNED,
+            rename_file_by_time_info.RenameStatus.PLANNED,
+        ]
+        assert plan[1].target == str(
+            tmp_path.joinpath("2023-09-25T000000+0800.txt")
+        )
+        assert plan[1].timestamp_source == "forced_date"
+        results = list(session.apply(plan=plan))
+
+    assert [i.status for i in results] == [
+        rename_file_by_time_info.RenameStatus.SKIPPED,
+        rename_file_by_time_info.RenameStatus.RENAMED,
+        rename_file_by_time_info.RenameStatus.RENAMED,
+    ]
+    assert sorted(os.listdir(tmp_path)) == [
+        ".hidden.txt",
+        "2023-09-25T000000+0800.txt",
+        "2023-09-25T000000+0800_0001.txt",
+    ]
+    assert progress == [1, 2, 3]
+    assert len(events) == 5
+
+
+def test_rename_group_with_shared_suffix(tmp_path):
+    for file_name in ["IMG_1.JPG", "IMG_1.MOV", "IMG_1.XMP"]:
+        tmp_path.joinpath(file_name).write_text("")
+    # Only the name of the ".MOV" file is taken
+    tmp_path.joinpath("2023-09-25T000000+0800_000_c_orig.MOV").write_text("")
+    files_paths = sorted(
+        str(i) for i in tmp_path.iterdir() if i.name.startswith("IMG_")
+    )
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(
+            forced_offset_time="+08:00",
+            forced_date=datetime.date(2023, 9, 25),
+            use_exiftool_on_images=False,
+        ),
+    ) as session:
+        results = list(session.rename(files_paths=files_paths, mode="media"))
+
+    assert [i.status for i in results] == [
+        rename_file_by_time_info.RenameStatus.RENAMED
+    ] * 3
+    assert set(i.group for i in results) == {files_paths[0]}
+    assert sorted(os.listdir(tmp_path)) == [
+        "2023-09-25T000000+0800_000_c_orig.MOV",
+        "2023-09-25T000000+0800_000_c_orig_0001.JPG",
+        "2023-09-25T000000+0800_000_c_orig_0001.MOV",
+        "2023-09-25T000000+0800_000_c_orig_0001.XMP",
+    ]
+
+
+def test_rename_in_parallel(tmp_path):
+    for i in range(20):
+        tmp_path.joinpath("{}.txt".format(i)).write_text("")
+    files_paths = sorted(str(i) for i in tmp_path.iterdir())
+    progress = []
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(
+            forced_offset_time="+08:00",
+            forced_date=datetime.date(2023, 9, 25),
+        ),
+        progress_callback=progress.append,
+    ) as session:
+        results = list(
+            session.rename(files_paths=files_paths, mode="general", jobs=4)
+        )
+
+    assert [i.source for i in results] == files_paths
+    assert progress == list(range(1, 21))
+    assert sorted(os.listdir(tmp_path)) == [
+        "2023-09-25T000000+0800.txt",
+        *[
+            "2023-09-25T000000+0800_{}.txt".format(str(i).zfill(4))
+            for i in range(1, 20)
+        ],
+    ]
+
+
+def test_rename_in_parallel_is_deterministic(tmp_path):
+    names = {}
+    for mode in ["general", "auto"]:
+        for jobs in [1, 8]:
+            directory = tmp_path.joinpath("{}-{}".format(mode, jobs))
+            directory.mkdir()
+            for i in range(40):
+                file_path = directory.joinpath("{}.txt".format(i))
+                file_path.write_text(str(i))
+                # The same modified time, so that all names are taken
+                os.utime(file_path, ns=(0, 1695571200 * 10**9))
+            with rename_file_by_time_info.RenameSession(
+                config_file=json.load(open(CONFIG_FILE_PATH)),
+                options=rename_file_by_time_info.RenameOptions(
+                    forced_offset_time="+08:00"
+                ),
+            ) as session:
+                list(
+                    session.rename(
+                        files_paths=sorted(
+                            str(i) for i in directory.iterdir()
+                        ),
+                        mode=mode,
+                        jobs=jobs,
+                    )
+                )
+            names[mode, jobs] = {
+                i.read_text(): i.name for i in directory.iterdir()
+            }
+
+    assert names["general", 8] == names["general", 1]
+    assert names["auto", 8] == names["auto", 1]
+    assert len(set(names["general", 1].values())) == 40
+
+
+def test_rename_directories_in_parallel(tmp_path):
+    files_paths = []
+    for directory_name in ["a", "b"]:
+        tmp_path.joinpath(directory_name).mkdir()
+        for i in range(2):
+            file_path = tmp_path.joinpath(directory_name, "{}.txt".format(i))
+            file_path.write_text("")
+            files_paths.append(str(file_path))
+    # Renames of both directories wait for each other
+    barrier = threading.Barrier(2, timeout=10)
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(
+            forced_offset_time="+08:00",
+            forced_date=datetime.date(2023, 9, 25),
+        ),
+    ) as session:
+        move = session.file_mover.move
+
+        def wait_and_move(**kwargs):
+            barrier.wait()
+            return move(**kwargs)
+
+        session.file_mover.move = wait_and_move
+        results = list(
+            session.rename(files_paths=files_paths, mode="general", jobs=4)
+        )
+
+    assert [i.status for i in results] == [
+        rename_file_by_time_info.RenameStatus.RENAMED
+    ] * 4
+    # Files of the same directory are still renamed in order
+    assert [os.path.basename(i.target) for i in results] == [
+        "2023-09-25T000000+0800.txt",
+        "2023-09-25T000000+0800_0001.txt",
+    ] * 2
+
+def test_plan_in_inode_order(tmp_path):
+    # Inodes are usually allocated in the order of creation
+    for file_name in ["c.txt", "a.txt", "b.txt"]:
+        tmp_path.joinpath(file_name).write_text("")
+    files_paths = sorted(str(i) for i in tmp_path.iterdir())
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(order="inode"),
+    ) as session:
+        planned_files_paths = []
+        plan_file = session._plan_file
+
+        def record_plan_file(file_path, **kwargs):
+            planned_files_paths.append(file_path)
+            return plan_file(file_path=file_path, **kwargs)
+
+        session._plan_file = record_plan_file
+        plan = list(session.plan(files_paths=files_paths, mode="general"))
+    assert [i.source for i in plan] == files_paths
+    assert planned_files_paths == sorted(
+        files_paths, key=lambda i: os.stat(i).st_ino
+    )
+
+
+def test_plan_in_auto_mode(tmp_path):
+    for file_name in ["a.jpg", "b.txt", "c.ini", ".d.txt"]:
+        tmp_path.joinpath(file_name).write_text("")
+    files_paths = sorted(str(i) for i in tmp_path.iterdir())
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(
+            forced_offset_time="+08:00",
+            forced_date=datetime.date(2023, 9, 25),
+            use_exiftool_on_images=False,
+        ),
+    ) as session:
+        plan = list(session.plan(files_paths=files_paths, mode="auto"))
+
+    assert [(os.path.basename(i.source), i.message) for i in plan] == [
+        (".d.txt", "Skip hidden file"),
+        ("a.jpg", None),
+        ("b.txt", None),
+        ("c.ini", "Skip specific file type"),
+    ]
+    assert [os.path.basename(i.target) for i in plan[1:3]] == [
+        "2023-09-25T000000+0800_000_c_orig.jpg",
+        "2023-09-25T000000+0800.txt",
+    ]
+
+
+def test_audit(tmp_path):
+    for file_name in [
+        "2023-09-25T000000+0800_000_c_orig.jpg",
+        "2023-09-26T000000+0800_000_c_orig.jpg",
+        "IMG_0001.jpg",
+    ]:
+        tmp_path.joinpath(file_name).write_text("")
+    files_paths = sorted(str(i) for i in tmp_path.iterdir())
+    audit_log_path = str(tmp_path.joinpath("audit_log.json"))
+    statuses = []
+    for _ in range(2):
+        with rename_file_by_time_info.RenameSession(
+            config_file=json.load(open(CONFIG_FILE_PATH)),
+            options=rename_file_by_time_info.RenameOptions(
+                forced_offset_time="+08:00",
+                forced_date=datetime.date(2023, 9, 25),
+                use_exiftool_on_images=False,
+            ),
+        ) as session:
+            audit_log = rename_file_by_time_info.media_file.AuditLog.load(
+                path=audit_log_path,
+                fingerprint=session.get_fingerprint(mode="audit"),
+            )
+            statuses.append(
+                [
+                    i.status.value
+                    for i in session.audit(
+                        files_paths=files_paths, audit_log=audit_log
+                    )
+                ]
+            )
+        audit_log.save(path=audit_log_path)
+
+    assert statuses == [
+        ["VERIFIED", "MISMATCHED", "UNFORMATTED"],
+        ["UNCHANGED", "MISMATCHED", "UNFORMATTED"],
+    ]
+
+
+def test_sessions_have_their_own_file_statuses(tmp_path):
+    tmp_path.joinpath("a.txt").write_text("")
+    config_file = json.load(open(CONFIG_FILE_PATH))
+    with (
+        rename_file_by_time_info.RenameSession(
+            config_file=config_file
+        ) as session,
+        rename_file_by_time_info.RenameSession(
+            config_file={**config_file, "file_status": {"cache_size": 0}}
+        ) as other_session,
+    ):
+        list(
+            session.plan(
+                files_paths=[str(tmp_path.joinpath("a.txt"))], mode="general"
+            )
+        )
+        assert session.stat_layer.cache_size == 100000
+        assert session.stat_layer.statistics.fetches > 0
+        assert other_session.stat_layer.statistics.fetches == 0
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Uses a Python script")
+def test_rename_video_without_exiftool_on_images(tmp_path, monkeypatch):
+    # An exiftool which dates every file
+    bin_directory = tmp_path.joinpath("bin")
+    bin_directory.mkdir()
+    executable_path = bin_directory.joinpath("exiftool")
+    executable_path.write_text(
+        "#!{}\n".format(sys.executable) + textwrap.dedent(r"""
+            import sys
+
+            arguments = []
+            for line in sys.stdin:
+                line = line.rstrip("\n")
+                if not line.startswith("-execute"):
+                    arguments.append(line)
+                    continue
+                if "-echo" in arguments:
+                    sys.stdout.write("OK\n")
+                else:
+                    sys.stdout.write(
+                        '[{"CreateDate": "2020:01:02 03:04:05"}]\n'
+                    )
+                sys.stdout.write("{ready%s}\n" % line[8:])
+                sys.stdout.flush()
+                arguments = []
+            """)
+    )
+    executable_path.chmod(0o755)
+    monkeypatch.setenv(
+        "PATH", "{}{}{}".format(bin_directory, os.pathsep, os.environ["PATH"])
+    )
+    tmp_path.joinpath("src").mkdir()
+    file_path = tmp_path.joinpath("src", "a.mp4")
+    file_path.write_bytes(b"\x00\x00\x00\x18ftypmp42" + bytes(56))
+    os.utime(file_path, (1431000000, 1431000000))
+
+    with rename_file_by_time_info.RenameSession(
+        config_file=json.load(open(CONFIG_FILE_PATH)),
+        options=rename_file_by_time_info.RenameOptions(
+            forced_offset_time="+00:00", use_exiftool_on_images=False
+        ),
+    ) as session:
+        (result,) = session.rename(files_paths=[str(file_path)], mode="media")
+
+    assert result.status == rename_file_by_time_info.RenameStatus.RENAMED
+    assert result.timestamp_source == "exiftool"
+    assert os.path.basename(result.target).startswith("2020-01-02")
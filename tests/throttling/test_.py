@@ -0,0 +1,35 @@
+import json
+import time
+
+from rename_file_by_time_info import throttling
+
+
+def test_files_per_second():
+    throttle = throttling.Throttle(
+        limits=throttling.ThrottleLimits(files_per_second=20)
+    )
+    start_time = time.monotonic()
+    for _ in range(5):
+        throttle.wait_for_files(stage="plan")
+    # The first file is not delayed
+    assert time.monotonic() - start_time >= 0.19
+    assert throttle.statistics.files_wait_seconds > 0
+    assert throttle.get_summary_lines()[0].startswith(
+        "Throttle: 20 file(s)/s, unlimited byte(s)/s"
+    )
+
+
+def test_control_file(tmp_path):
+    control_file_path = tmp_path / "throttle.json"
+    control_file_path.write_text(json.dumps({"max_extractor_processes": 2}))
+    throttle = throttling.Throttle(
+        limits=throttling.ThrottleLimits(bytes_per_second=1000),
+        control_file=str(control_file_path),
+    )
+    assert throttle.limits == throttling.ThrottleLimits(
+        bytes_per_second=1000, max_extractor_processes=2
+    )
+
+    control_file_path.unlink()
+    throttle._check_control_file(force=True)
+    assert throttle.limits == throttling.ThrottleLimits(bytes_per_second=1000)
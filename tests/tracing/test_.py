@@ -0,0 +1,20 @@
+import logging
+
+from rename_file_by_time_info import tracing
+
+
+def test_lazy_is_only_evaluated_when_emitted(caplog):
+    calls = []
+
+    def get_payload():
+        calls.append(None)
+        return {"a": 1}
+
+    logger = logging.getLogger("tests.tracing")
+    with caplog.at_level(logging.INFO, logger="tests.tracing"):
+        logger.debug("payload: %s", tracing.Lazy(get_payload))
+        assert calls == []
+        logger.info("payload: %s", tracing.Lazy(get_payload))
+    assert len(calls) > 0
+    assert caplog.records[-1].getMessage() == "payload: {'a': 1}"
+    assert str(tracing.LazyJson({"a": 1})) == "{\n  \"a\": 1\n}"